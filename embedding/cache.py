@@ -0,0 +1,166 @@
+import os
+import re
+import fcntl
+import hashlib
+import threading
+from contextlib import contextmanager
+import numpy as np
+from typing import List, Optional, Tuple
+
+class EmbeddingCache():
+    '''
+    Persistent content-addressed cache of sentence embeddings. Entries are keyed by
+    (model name, max_seq_length, text hash): the first two select the namespace, i.e. the
+    pair of files an entry lives in, the latter identifies the entry within the namespace.
+    Both files are append-only, vectors are read through a memory map. Once more than
+    max_entries are stored, the oldest entries are evicted by rewriting both files.
+    Processes sharing a location take a file lock (<namespace>.lock) for every lookup and
+    put, and first read the entries the other processes appended or evicted meanwhile.
+    '''
+    KEY_SIZE = 16
+
+    def __init__(self, location: str, model_name: str, max_seq_length: int, dim: int, max_entries=1000000, retain_ratio=0.75):
+        os.makedirs(location, exist_ok=True)
+        namespace = re.sub(r"[^\w.-]", "_", f"{model_name}_{max_seq_length}")
+        self.keys_path = os.path.join(location, f"{namespace}.keys")
+        self.vectors_path = os.path.join(location, f"{namespace}.vecs")
+        self.lock_file = open(os.path.join(location, f"{namespace}.lock"), "ab")
+        self.dim = dim
+        self.max_entries = max_entries
+        self.retain_ratio = retain_ratio
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rows = {}
+        self.count = 0
+        self.vectors: Optional[np.memmap] = None
+        self.inode = None
+        with self._file_lock():
+            self._load()
+
+    @staticmethod
+    def get_key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=EmbeddingCache.KEY_SIZE).digest()
+
+    @contextmanager
+    def _file_lock(self):
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    def _get_inode(self):
+        # a new keys file after an eviction
+        return os.stat(self.keys_path).st_ino if os.path.isfile(self.keys_path) else None
+
+    def _load(self):
+        keys = b""
+        if os.path.isfile(self.keys_path):
+            with open(self.keys_path, "rb") as f:
+                keys = f.read()
+        vector_rows = 0
+        if os.path.isfile(self.vectors_path):
+            vector_rows = os.path.getsize(self.vectors_path) // (self.dim * 4)
+        # an interrupted append may leave the two files out of step
+        self.count = min(len(keys) // self.KEY_SIZE, vector_rows)
+        self._truncate(self.count)
+        self.rows = {keys[i*self.KEY_SIZE:(i+1)*self.KEY_SIZE]: i for i in range(self.count)}
+        self.vectors = None
+        self.inode = self._get_inode()
+
+    def _sync(self):
+        # with the file lock held: reads the entries of other processes sharing the location
+        if self._get_inode() != self.inode:
+            self._load()
+            return
+        if self.inode is None:
+            return
+        vector_rows = os.path.getsize(self.vectors_path) // (self.dim * 4)
+        with open(self.keys_path, "rb") as f:
+            f.seek(self.count * self.KEY_SIZE)
+            keys = f.read((vector_rows - self.count) * self.KEY_SIZE)
+        for i in range(len(keys) // self.KEY_SIZE):
+            self.rows[keys[i*self.KEY_SIZE:(i+1)*self.KEY_SIZE]] = self.count + i
+        self.count += len(keys) // self.KEY_SIZE
+
+    def _truncate(self, count: int):
+        for path, row_size in [(self.keys_path, self.KEY_SIZE), (self.vectors_path, self.dim * 4)]:
+            if os.path.isfile(path) and os.path.getsize(path) != count * row_size:
+                with open(path, "r+b") as f:
+                    f.truncate(count * row_size)
+
+    def _get_vectors(self, max_row: int) -> np.memmap:
+        # remap lazily once rows were appended after the current map was created
+        if self.vectors is None or max_row >= self.vectors.shape[0]:
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self.count, self.dim))
+        return self.vectors
+
+    def __len__(self):
+        return self.count
+
+    def lookup(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Returns a boolean mask over texts marking cache hits and the cached embeddings
+        of the hits (shape: hits*dim) in the order of texts.
+        '''
+        with self.lock, self._file_lock():
+            self._sync()
+            rows = np.array([self.rows.get(self.get_key(text), -1) for text in texts], dtype=np.int64)
+            mask = rows >= 0
+            hit_count = int(mask.sum())
+            self.hits += hit_count
+            self.misses += len(texts) - hit_count
+            if hit_count == 0:
+                return mask, np.empty((0, self.dim), dtype=np.float32)
+            hit_rows = rows[mask]
+            return mask, np.array(self._get_vectors(int(hit_rows.max()))[hit_rows])
+
+    def put(self, texts: List[str], embeddings: np.ndarray):
+        with self.lock, self._file_lock():
+            self._sync()
+            new_keys = []
+            new_rows = []
+            for i, text in enumerate(texts):
+                key = self.get_key(text)
+                if key in self.rows:
+                    continue
+                self.rows[key] = self.count + len(new_keys)
+                new_keys.append(key)
+                new_rows.append(i)
+            if not new_keys:
+                return
+            # write vectors before keys, such that every persisted key has its vector
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.ascontiguousarray(embeddings[new_rows], dtype=np.float32).tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(new_keys))
+            self.count += len(new_keys)
+            self.inode = self._get_inode()
+            if self.count > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        # keep the most recently written entries
+        keep = int(self.max_entries * self.retain_ratio)
+        start = self.count - keep
+        with open(self.keys_path, "rb") as f:
+            f.seek(start * self.KEY_SIZE)
+            keys = f.read(keep * self.KEY_SIZE)
+        vectors = np.array(self._get_vectors(self.count - 1)[start:])
+        self.vectors = None
+        with open(self.vectors_path + ".tmp", "wb") as f:
+            f.write(vectors.tobytes())
+        with open(self.keys_path + ".tmp", "wb") as f:
+            f.write(keys)
+        # without a keys file the namespace loads as empty, so a crash in between cannot
+        # pair keys with the wrong vectors
+        os.remove(self.keys_path)
+        os.replace(self.vectors_path + ".tmp", self.vectors_path)
+        os.replace(self.keys_path + ".tmp", self.keys_path)
+        self._load()
+
+    def print_stats(self):
+        print(f"Embedding Cache Entries: {self.count}")
+        print(f"Embedding Cache Hits: {self.hits}")
+        print(f"Embedding Cache Misses: {self.misses}")
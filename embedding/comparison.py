@@ -0,0 +1,73 @@
+import json
+import os
+import time
+import numpy as np
+from typing import List
+
+def load_corpus_sample(lang: str, size=2000, path=None) -> List[str]:
+    '''
+    Title with first paragraph of the first size articles of the collection the storages are
+    built from, data/TREC_Washington_Post_collection.v3.jl for en and data/netzpolitik.jsonl
+    for de, or of the raw articles of that collection at path.
+    '''
+    # the parsers are only needed for the check, not to compare embeddings
+    from ..wapo.parser import ParserWAPO
+    from ..netzpolitik.parser import ParserNetzpolitik
+    if path is None:
+        data_location = f"{os.path.abspath(os.path.join(__file__ , os.pardir, os.pardir))}/data"
+        path = f"{data_location}/{'TREC_Washington_Post_collection.v3.jl' if lang == 'en' else 'netzpolitik.jsonl'}"
+    texts = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            raw = json.loads(line)
+            if lang == "en":
+                article = ParserWAPO.parse_article(raw)
+                text = ParserWAPO.get_title_with_first_paragraph(article) if article else None
+            else:
+                text = ParserNetzpolitik.get_title_with_first_paragraph(raw)
+            if text:
+                texts.append(text)
+            if len(texts) == size:
+                break
+    return texts
+
+def get_nearest(embeddings: np.ndarray, k: int) -> np.ndarray:
+    # the k nearest other texts of every text by cosine similarity
+    normalized = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    similarities = normalized @ normalized.T
+    np.fill_diagonal(similarities, -np.inf)
+    return np.argsort(-similarities, axis=1, kind="stable")[:, :k]
+
+def compare_embeddings(em_reference, em_candidate, texts: List[str], batch_size=32, k=10) -> dict:
+    '''
+    Encodes texts with both models. Returns how close the candidate embeddings are to the
+    reference embeddings, the recall@k of the nearest neighbors among the texts by candidate
+    embeddings against those by reference embeddings, and the encode speedup of the
+    candidate model. Both models are loaded and run once before timing.
+    '''
+    em_reference.encode_batch(texts[:1], batch_size=batch_size)
+    em_candidate.encode_batch(texts[:1], batch_size=batch_size)
+    start = time.perf_counter()
+    emb_reference, _ = em_reference.encode_batch(texts, batch_size=batch_size)
+    seconds_reference = time.perf_counter() - start
+    start = time.perf_counter()
+    emb_candidate, _ = em_candidate.encode_batch(texts, batch_size=batch_size)
+    seconds_candidate = time.perf_counter() - start
+    norms = np.linalg.norm(emb_reference, axis=1) * np.linalg.norm(emb_candidate, axis=1)
+    cosine_similarities = np.sum(emb_reference * emb_candidate, axis=1) / np.maximum(norms, 1e-12)
+    k = min(k, len(texts) - 1)
+    recall = None
+    if k > 0:
+        nearest_reference = get_nearest(emb_reference, k)
+        nearest_candidate = get_nearest(emb_candidate, k)
+        recall = float(np.mean([len(set(c) & set(r)) / k for c, r in zip(nearest_candidate.tolist(), nearest_reference.tolist())]))
+    return {
+        "mean_cosine_similarity": float(np.mean(cosine_similarities)),
+        "min_cosine_similarity": float(np.min(cosine_similarities)),
+        "max_abs_difference": float(np.max(np.abs(emb_reference - emb_candidate))),
+        "k": k,
+        "recall_at_k": recall,
+        "seconds_reference": seconds_reference,
+        "seconds_candidate": seconds_candidate,
+        "speedup": seconds_reference / seconds_candidate if seconds_candidate else 0.
+    }
@@ -1,37 +1,138 @@
-from sentence_transformers import models, SentenceTransformer
-from ..typings import Vector
-from typing import Optional
+import numpy as np
+from .cache import EmbeddingCache
+from .scheduler import LengthBucketScheduler
+from .pool import EncodingPool
+from .registry import ModelRegistry, model_names
+from ..typings import Vector, VectorList
+from typing import Optional, List, Tuple
 
 class EmbeddingModel():
     # make sure you have > 2GB of free VRAM to enable CUDA
-    def __init__(self, lang, device="cpu"):
+    # the model is loaded on first use and shared within the process, see ModelRegistry
+    # pass cache_location to reuse embeddings across runs, see EmbeddingCache
+    # pass num_workers > 0 to encode in a pool of processes instead, see EncodingPool
+    # pass quantize=True for dynamic int8 quantization of the linear layers (CPU only)
+    # pass backend="onnx" to run the transformer with ONNX Runtime (CPU only), see OnnxEncoder
+    def __init__(self, lang, device="cpu", cache_location=None, cache_max_entries=1000000, num_workers=0, threads_per_worker=1, quantize=False, backend="torch", onnx_location=None, onnx_threads=0):
         supported_languages = ["de", "en"]
-        # Initialize model based on selected language
-        if lang == "de":
-            # load BERT model from Hugging Face
-            word_embedding_model = models.Transformer('bert-base-german-cased')
-
-            # Apply mean pooling to get one fixed sized sentence vector
-            pooling_model = models.Pooling(
-                word_embedding_model.get_word_embedding_dimension(),    # dimensions for the word embeddings
-                pooling_mode_cls_token=False,                           # not use the first token (CLS token) as text representations
-                pooling_mode_mean_tokens=True,                          # perform mean-pooling
-                pooling_mode_max_tokens=False                           # not use max in each dimension over all tokens
-            )
-
-            # join BERT model and pooling to get the sentence transformer
-            self.model = SentenceTransformer(modules=[word_embedding_model, pooling_model], device = device)
-            self.model.max_seq_length = 512
-
-        if lang == "en":
-            # available pre-trained models: https://docs.google.com/spreadsheets/d/14QplCdTCDwEmTqrn1LH4yrbKvdogK4oQvYO1K1aPR5M/edit#gid=0
-            self.model = SentenceTransformer('stsb-distilbert-base', device = device)
-            self.model.max_seq_length = 512
-
         if lang not in supported_languages:
             raise ValueError(f"language: {lang} not supported.")
+        if backend not in ["torch", "onnx"]:
+            raise ValueError(f"backend: {backend} not supported.")
+        if (quantize or backend == "onnx") and device != "cpu":
+            raise ValueError(f"{'quantization' if quantize else 'onnx backend'} is not supported on device: {device}.")
+        if quantize and backend == "onnx":
+            raise ValueError("quantization is not supported for the onnx backend.")
+
+        self.lang = lang
+        self.device = device
+        self.quantize = quantize
+        self.backend = backend
+        self.onnx_location = onnx_location
+        self.onnx_threads = onnx_threads
+        self.model_name = model_names[lang]
+        if quantize:
+            # keeps int8 embeddings apart from fp32 embeddings in the cache
+            self.model_name += "-int8"
+        if backend == "onnx":
+            self.model_name += "-onnx"
+        self.max_seq_length = 512
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker
+        self.cache_location = cache_location
+        self.cache_max_entries = cache_max_entries
+        self._scheduler = None
+        self._pool = None
+        self._cache = None
+
+    @property
+    def model(self):
+        return ModelRegistry.get(
+            self.lang,
+            self.device,
+            self.max_seq_length,
+            quantize=self.quantize,
+            backend=self.backend,
+            onnx_location=self.onnx_location,
+            onnx_threads=self.onnx_threads
+        )
+
+    @property
+    def scheduler(self) -> LengthBucketScheduler:
+        if self._scheduler is None:
+            self._scheduler = LengthBucketScheduler(self.model)
+        return self._scheduler
+
+    @property
+    def pool(self) -> Optional[EncodingPool]:
+        if self._pool is None and self.num_workers > 0:
+            model_kwargs = {
+                "device": self.device,
+                "quantize": self.quantize,
+                "backend": self.backend,
+                "onnx_location": self.onnx_location,
+                "onnx_threads": self.onnx_threads
+            }
+            self._pool = EncodingPool(self.lang, model_kwargs, num_workers=self.num_workers, threads_per_worker=self.threads_per_worker)
+        return self._pool
 
-    def encode(self, text:str) -> Optional[Vector]:
+    @property
+    def dim(self) -> int:
+        if self.num_workers > 0:
+            return self.pool.dim
+        return self.model.get_sentence_embedding_dimension()
+
+    @property
+    def cache(self) -> Optional[EmbeddingCache]:
+        if self._cache is None and self.cache_location:
+            self._cache = EmbeddingCache(self.cache_location, self.model_name, self.max_seq_length, self.dim, max_entries=self.cache_max_entries)
+        return self._cache
+
+    def encode(self, text:str, view=None) -> Optional[Vector]:
         if not text:
             return None
-        return (self.model.encode(text, convert_to_tensor=False, batch_size=8)).tolist()
\ No newline at end of file
+        embeddings, _ = self.encode_batch([text], batch_size=8, view=view)
+        return embeddings[0]
+
+    def encode_batch(self, texts: List[Optional[str]], batch_size=32, out: Optional[np.ndarray] = None, view=None) -> Tuple[VectorList, List[int]]:
+        '''
+        Encodes all texts with batched forward passes. Returns a float32 matrix (shape: N*dim)
+        aligned with texts and the positions of empty or None texts, whose rows are left zero.
+        If out is given (shape: >=N*dim), the matrix is written into its first N rows.
+        view names the kind of text (e.g. title) in the truncation stats.
+        '''
+        if out is None:
+            embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        else:
+            embeddings = out[:len(texts)]
+            embeddings.fill(0)
+        missing = [i for i, text in enumerate(texts) if not text]
+        present = [i for i, text in enumerate(texts) if text]
+        if present and self.cache is not None:
+            hit_mask, hit_embeddings = self.cache.lookup([texts[i] for i in present])
+            embeddings[[i for i, hit in zip(present, hit_mask) if hit]] = hit_embeddings
+            present = [i for i, hit in zip(present, hit_mask) if not hit]
+        if present:
+            present_texts = [texts[i] for i in present]
+            if self.pool is not None:
+                embeddings[present] = self.pool.encode(present_texts, batch_size=batch_size, view=view)
+            else:
+                embeddings[present] = self.scheduler.encode(present_texts, self.dim, batch_size=batch_size, view=view)
+            if self.cache is not None:
+                self.cache.put([texts[i] for i in present], embeddings[present])
+        return embeddings, missing
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+
+    def print_stats(self):
+        key = ModelRegistry.get_key(self.lang, self.device, self.max_seq_length, self.quantize, self.backend, self.onnx_location, self.onnx_threads)
+        if self.num_workers == 0 and key in ModelRegistry.load_seconds:
+            print(f"Model Load Seconds: {ModelRegistry.load_seconds[key]:.1f}")
+        if self._pool is not None:
+            self._pool.print_stats()
+        if self._scheduler is not None:
+            self._scheduler.print_stats()
+        if self._cache is not None:
+            self._cache.print_stats()
@@ -0,0 +1,106 @@
+import argparse
+import inspect
+import os
+import numpy as np
+import torch
+from typing import List
+from sentence_transformers import SentenceTransformer
+
+class OnnxEncoder():
+    '''
+    Runs the transformer of a sentence transformer with ONNX Runtime and applies the same
+    mean pooling as models.Pooling(pooling_mode_mean_tokens=True). The transformer is exported
+    to onnx_path on first use. Provides the subset of the SentenceTransformer interface used by
+    LengthBucketScheduler, so it can be used in its place.
+    '''
+    def __init__(self, model: SentenceTransformer, onnx_path: str, num_threads=0):
+        import onnxruntime
+
+        transformer = model._first_module()
+        self.tokenizer = transformer.tokenizer
+        self.max_seq_length = model.max_seq_length
+        self.dim = model.get_sentence_embedding_dimension()
+        # BERT takes token type ids, DistilBERT does not
+        self.input_names = ["input_ids", "attention_mask"]
+        if "token_type_ids" in inspect.signature(transformer.auto_model.forward).parameters:
+            self.input_names.append("token_type_ids")
+
+        if not os.path.isfile(onnx_path):
+            OnnxEncoder.export(transformer.auto_model, self.input_names, onnx_path)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(onnx_path, options)
+
+    @staticmethod
+    def export(auto_model: torch.nn.Module, input_names: List[str], onnx_path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(onnx_path)), exist_ok=True)
+        auto_model.eval()
+        dummy = torch.ones((1, 8), dtype=torch.long)
+        torch.onnx.export(
+            auto_model,
+            tuple(dummy if name != "token_type_ids" else torch.zeros_like(dummy) for name in input_names),
+            onnx_path,
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["token_embeddings"]},
+            opset_version=11
+        )
+
+    def tokenize(self, text: str) -> List[int]:
+        # same as models.Transformer.tokenize, without keeping the torch weights referenced
+        return self.tokenizer.convert_tokens_to_ids(self.tokenizer.tokenize(text))
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, sentences, batch_size=32, is_pretokenized=True, convert_to_numpy=True, convert_to_tensor=False) -> np.ndarray:
+        if not is_pretokenized:
+            sentences = [self.tokenize(text) for text in sentences]
+        embeddings = []
+        # with the special tokens, the inputs are at most max_seq_length long
+        max_ids = self.max_seq_length - self.tokenizer.num_special_tokens_to_add()
+        for start in range(0, len(sentences), batch_size):
+            batch = [self.tokenizer.build_inputs_with_special_tokens(ids[:max_ids]) for ids in sentences[start:start + batch_size]]
+            max_len = max(len(ids) for ids in batch)
+            input_ids = np.full((len(batch), max_len), self.tokenizer.pad_token_id, dtype=np.int64)
+            attention_mask = np.zeros((len(batch), max_len), dtype=np.int64)
+            for i, ids in enumerate(batch):
+                input_ids[i, :len(ids)] = ids
+                attention_mask[i, :len(ids)] = 1
+            inputs = {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": np.zeros_like(input_ids)}
+            token_embeddings = self.session.run(None, {name: inputs[name] for name in self.input_names})[0]
+            # mean pooling over the non-padding tokens
+            mask = attention_mask[:, :, np.newaxis].astype(np.float32)
+            sum_embeddings = np.sum(token_embeddings * mask, axis=1)
+            sum_mask = np.clip(mask.sum(axis=1), 1e-9, None)
+            embeddings.append(sum_embeddings / sum_mask)
+        return np.concatenate(embeddings).astype(np.float32, copy=False)
+
+if __name__ == "__main__":
+    from .model import EmbeddingModel
+    from .comparison import compare_embeddings, load_corpus_sample
+
+    p = argparse.ArgumentParser(description='Compare embeddings, nearest neighbors and throughput of the ONNX Runtime backend against the torch backend')
+    p.add_argument('--lang', default="en", help='Language of the model (en: WAPO, de: netzpolitik)')
+    p.add_argument('--articles', default=None, help='Raw articles of the collection (.jl/.jsonl), defaults to the collection in data/')
+    p.add_argument('--sample', default=2000, type=int, help='Number of articles whose title with first paragraph is encoded')
+    p.add_argument('--k', default=10, type=int, help='Number of nearest neighbors for the recall against torch')
+    p.add_argument('--batch_size', default=32, type=int, help='Batch size for encoding')
+    p.add_argument('--onnx_threads', default=0, type=int, help='Intra-op threads of ONNX Runtime, 0 uses all cores')
+
+    args = p.parse_args()
+
+    texts = load_corpus_sample(args.lang, args.sample, path=args.articles)
+    em_torch = EmbeddingModel(args.lang)
+    em_onnx = EmbeddingModel(args.lang, backend="onnx", onnx_threads=args.onnx_threads)
+    stats = compare_embeddings(em_torch, em_onnx, texts, batch_size=args.batch_size, k=args.k)
+    print(f"Texts: {len(texts)}")
+    print(f"Mean Cosine Similarity: {stats['mean_cosine_similarity']:.6f}")
+    print(f"Min Cosine Similarity: {stats['min_cosine_similarity']:.6f}")
+    print(f"Max Abs Difference: {stats['max_abs_difference']:.6f}")
+    print(f"Recall@{stats['k']} against torch: {stats['recall_at_k']:.4f}")
+    print(f"Texts/sec torch: {len(texts) / stats['seconds_reference']:.1f}")
+    print(f"Texts/sec onnx: {len(texts) / stats['seconds_candidate']:.1f}")
+    print(f"Speedup: {stats['speedup']:.2f}")
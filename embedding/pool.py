@@ -0,0 +1,159 @@
+import math
+import queue
+import time
+import traceback
+import multiprocessing as mp
+import numpy as np
+from typing import Iterable, Iterator, List
+from .truncation import TruncationStats
+from ..typings import VectorList
+
+def load_embedding_model(lang, model_kwargs, num_threads):
+    # pin the intra-op threads before torch spawns its thread pool
+    import torch
+    torch.set_num_threads(num_threads)
+    if model_kwargs.get("backend") == "onnx" and not model_kwargs.get("onnx_threads"):
+        # onnx runtime would otherwise use all cores in every worker
+        model_kwargs = dict(model_kwargs, onnx_threads=num_threads)
+    from .model import EmbeddingModel
+    return EmbeddingModel(lang, **model_kwargs)
+
+def _encode_worker(load_model, lang, model_kwargs, num_threads, input_queue, output_queue):
+    try:
+        em = load_model(lang, model_kwargs, num_threads)
+    except Exception:
+        output_queue.put((None, None, traceback.format_exc()))
+        return
+    output_queue.put((None, em.dim, None))
+    while True:
+        task = input_queue.get()
+        if task is None:
+            break
+        chunk_id, texts, batch_size, view = task
+        try:
+            truncator_stats = em.scheduler.truncator.stats
+            before = truncator_stats.get(view)
+            embeddings = em.scheduler.encode(texts, em.dim, batch_size=batch_size, view=view)
+            truncation_counts = [after - prev for after, prev in zip(truncator_stats.get(view), before)]
+            output_queue.put((chunk_id, (embeddings, truncation_counts), None))
+        except Exception:
+            output_queue.put((chunk_id, None, traceback.format_exc()))
+
+class EncodingPool():
+    '''
+    Runs num_workers processes, each holding its own EmbeddingModel(lang, **model_kwargs) with
+    threads_per_worker threads. Texts are sent to the workers in chunks, results are yielded in
+    input order.
+    Any worker failure shuts the whole pool down and is raised in the caller.
+    load_model(lang, model_kwargs, threads_per_worker) builds the model in a worker, it has to
+    be picklable, e.g. a module-level function.
+    '''
+    def __init__(self, lang, model_kwargs=None, num_workers=None, threads_per_worker=1, chunk_size=64, startup_timeout=600, load_model=load_embedding_model):
+        self.num_workers = num_workers if num_workers else max(1, mp.cpu_count() // threads_per_worker)
+        self.chunk_size = chunk_size
+        self.text_count = 0
+        self.seconds = 0.
+        self.truncation_stats = TruncationStats()
+        self.closed = False
+        # fork is not safe once torch has initialized its thread pools
+        ctx = mp.get_context("spawn")
+        self.input_queue = ctx.Queue()
+        self.output_queue = ctx.Queue()
+        self.workers = [
+            ctx.Process(
+                target=_encode_worker,
+                args=(load_model, lang, model_kwargs or {}, threads_per_worker, self.input_queue, self.output_queue),
+                daemon=True
+            )
+            for _ in range(self.num_workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+        self.dim = None
+        for _ in self.workers:
+            _, dim, _ = self._get_result(startup_timeout)
+            self.dim = dim
+
+    def _get_result(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                chunk_id, result, error = self.output_queue.get(timeout=1)
+            except queue.Empty:
+                dead = [w for w in self.workers if w.exitcode is not None]
+                if dead:
+                    self.close()
+                    raise RuntimeError(f"Encoding worker exited unexpectedly with code {dead[0].exitcode}")
+                if deadline is not None and time.monotonic() > deadline:
+                    self.close()
+                    raise TimeoutError("Encoding workers did not respond in time")
+                continue
+            if error is not None:
+                self.close()
+                raise RuntimeError(f"Encoding worker failed:\n{error}")
+            return chunk_id, result, error
+
+    def encode_stream(self, text_chunks: Iterable[List[str]], batch_size=32, view=None) -> Iterator[VectorList]:
+        '''
+        Encodes every chunk of texts and yields one embedding matrix per chunk in input order.
+        At most two chunks per worker are in flight at any time.
+        '''
+        if self.closed:
+            raise RuntimeError("Encoding pool is closed")
+        start = time.perf_counter()
+        chunks = iter(text_chunks)
+        pending = {}
+        next_submit = 0
+        next_yield = 0
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and next_submit - next_yield < 2 * self.num_workers:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        exhausted = True
+                        break
+                    self.input_queue.put((next_submit, chunk, batch_size, view))
+                    self.text_count += len(chunk)
+                    next_submit += 1
+                if next_yield == next_submit:
+                    break
+                while next_yield not in pending:
+                    chunk_id, (embeddings, truncation_counts), _ = self._get_result()
+                    self.truncation_stats.add(view, truncation_counts)
+                    pending[chunk_id] = embeddings
+                yield pending.pop(next_yield)
+                next_yield += 1
+        except BaseException:
+            # results of chunks in flight can not be matched to a later call anymore
+            self.close()
+            raise
+        finally:
+            self.seconds += time.perf_counter() - start
+
+    def encode(self, texts: List[str], batch_size=32, view=None) -> VectorList:
+        if len(texts) == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        # spread small inputs over all workers
+        chunk_size = min(self.chunk_size, math.ceil(len(texts) / self.num_workers))
+        chunks = (texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size))
+        return np.concatenate(list(self.encode_stream(chunks, batch_size=batch_size, view=view)))
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for worker in self.workers:
+            if worker.is_alive():
+                self.input_queue.put(None)
+        for worker in self.workers:
+            worker.join(timeout=10)
+            if worker.is_alive():
+                worker.terminate()
+
+    def print_stats(self):
+        texts_per_second = self.text_count / self.seconds if self.seconds else 0.
+        print(f"Encoding Pool Workers: {self.num_workers}")
+        print(f"Encoded Texts: {self.text_count}")
+        print(f"Texts/sec: {texts_per_second:.1f}")
+        self.truncation_stats.print_stats()
@@ -0,0 +1,31 @@
+import argparse
+import torch
+
+def quantize_model(model: torch.nn.Module) -> torch.nn.Module:
+    # int8 weights for all linear layers of the transformer, activations are quantized on the fly
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+if __name__ == "__main__":
+    from .model import EmbeddingModel
+    from .comparison import compare_embeddings, load_corpus_sample
+
+    p = argparse.ArgumentParser(description='Compare embeddings, nearest neighbors and speed of the int8 quantized model against the fp32 model')
+    p.add_argument('--lang', default="en", help='Language of the model (en: WAPO, de: netzpolitik)')
+    p.add_argument('--articles', default=None, help='Raw articles of the collection (.jl/.jsonl), defaults to the collection in data/')
+    p.add_argument('--sample', default=2000, type=int, help='Number of articles whose title with first paragraph is encoded')
+    p.add_argument('--k', default=10, type=int, help='Number of nearest neighbors for the recall against fp32')
+    p.add_argument('--batch_size', default=32, type=int, help='Batch size for encoding')
+
+    args = p.parse_args()
+
+    texts = load_corpus_sample(args.lang, args.sample, path=args.articles)
+    em_fp32 = EmbeddingModel(args.lang)
+    em_int8 = EmbeddingModel(args.lang, quantize=True)
+    stats = compare_embeddings(em_fp32, em_int8, texts, batch_size=args.batch_size, k=args.k)
+    print(f"Texts: {len(texts)}")
+    print(f"Mean Cosine Similarity: {stats['mean_cosine_similarity']:.6f}")
+    print(f"Min Cosine Similarity: {stats['min_cosine_similarity']:.6f}")
+    print(f"Recall@{stats['k']} against fp32: {stats['recall_at_k']:.4f}")
+    print(f"Encode Seconds fp32: {stats['seconds_reference']:.3f}")
+    print(f"Encode Seconds int8: {stats['seconds_candidate']:.3f}")
+    print(f"Speedup: {stats['speedup']:.2f}")
@@ -0,0 +1,77 @@
+import os
+import time
+import threading
+from sentence_transformers import models, SentenceTransformer
+from .quantization import quantize_model
+
+model_names = {
+    "de": 'bert-base-german-cased',
+    "en": 'stsb-distilbert-base'
+}
+
+def load_model(lang, device, max_seq_length, quantize=False) -> SentenceTransformer:
+    # Initialize model based on selected language
+    if lang == "de":
+        # load BERT model from Hugging Face
+        word_embedding_model = models.Transformer(model_names[lang])
+
+        # Apply mean pooling to get one fixed sized sentence vector
+        pooling_model = models.Pooling(
+            word_embedding_model.get_word_embedding_dimension(),    # dimensions for the word embeddings
+            pooling_mode_cls_token=False,                           # not use the first token (CLS token) as text representations
+            pooling_mode_mean_tokens=True,                          # perform mean-pooling
+            pooling_mode_max_tokens=False                           # not use max in each dimension over all tokens
+        )
+
+        # join BERT model and pooling to get the sentence transformer
+        model = SentenceTransformer(modules=[word_embedding_model, pooling_model], device = device)
+
+    if lang == "en":
+        # available pre-trained models: https://docs.google.com/spreadsheets/d/14QplCdTCDwEmTqrn1LH4yrbKvdogK4oQvYO1K1aPR5M/edit#gid=0
+        model = SentenceTransformer(model_names[lang], device = device)
+
+    if quantize:
+        model = quantize_model(model)
+    model.max_seq_length = max_seq_length
+    return model
+
+class ModelRegistry():
+    '''
+    Process-wide registry of sentence transformers. Each (lang, device, max_seq_length, quantize,
+    backend, onnx_location, onnx_threads) model is loaded on first use and then shared by every
+    EmbeddingModel of the process. The onnx backend wraps the loaded model in an OnnxEncoder.
+    '''
+    models = {}
+    load_seconds = {}
+    lock = threading.Lock()
+    default_onnx_location = f"{os.path.abspath(os.path.join(__file__ , os.pardir, os.pardir))}/data/onnx"
+
+    @staticmethod
+    def get_key(lang, device, max_seq_length, quantize=False, backend="torch", onnx_location=None, onnx_threads=0):
+        # the onnx settings do not matter for torch models, they are shared regardless
+        if backend != "onnx":
+            return (lang, device, max_seq_length, quantize, backend, None, 0)
+        onnx_location = os.path.abspath(onnx_location or ModelRegistry.default_onnx_location)
+        return (lang, device, max_seq_length, quantize, backend, onnx_location, onnx_threads)
+
+    @staticmethod
+    def get(lang, device, max_seq_length, quantize=False, backend="torch", onnx_location=None, onnx_threads=0):
+        key = ModelRegistry.get_key(lang, device, max_seq_length, quantize, backend, onnx_location, onnx_threads)
+        with ModelRegistry.lock:
+            if key not in ModelRegistry.models:
+                start = time.perf_counter()
+                model = load_model(lang, device, max_seq_length, quantize=quantize)
+                if backend == "onnx":
+                    from .onnx_backend import OnnxEncoder
+                    onnx_path = f"{onnx_location or ModelRegistry.default_onnx_location}/{model_names[lang]}.onnx"
+                    model = OnnxEncoder(model, onnx_path, num_threads=onnx_threads)
+                ModelRegistry.models[key] = model
+                ModelRegistry.load_seconds[key] = time.perf_counter() - start
+                print(f"Loaded {model_names[lang]}{' (int8)' if quantize else ''} ({backend}) on {device} in {ModelRegistry.load_seconds[key]:.1f}s")
+            return ModelRegistry.models[key]
+
+    @staticmethod
+    def clear():
+        with ModelRegistry.lock:
+            ModelRegistry.models.clear()
+            ModelRegistry.load_seconds.clear()
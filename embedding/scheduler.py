@@ -0,0 +1,66 @@
+import time
+import numpy as np
+from typing import List
+from .truncation import Truncator
+from ..typings import VectorList
+
+class LengthBucketScheduler():
+    '''
+    Encodes texts in batches of similar token length to cut the compute wasted on padding.
+    Every text is tokenized once (see Truncator), the token ids are sorted by length, split
+    into buckets of batch_size, encoded as pretokenized input and the embeddings are
+    returned in the original order.
+    '''
+    # [CLS] and [SEP] added by the tokenizer to every input
+    SPECIAL_TOKENS = 2
+
+    def __init__(self, model):
+        self.model = model
+        self.truncator = Truncator(model.tokenize, model.max_seq_length)
+        self.text_count = 0
+        self.token_count = 0
+        self.padded_token_count = 0
+        self.unsorted_padded_token_count = 0
+        self.seconds = 0.
+
+    @staticmethod
+    def get_padded_token_count(lengths: np.ndarray, batch_size: int) -> int:
+        if len(lengths) == 0:
+            return 0
+        return sum(len(batch) * int(batch.max()) for batch in np.split(lengths, range(batch_size, len(lengths), batch_size)))
+
+    def encode(self, texts: List[str], dim: int, batch_size=32, view=None) -> VectorList:
+        start = time.perf_counter()
+        token_ids = self.truncator.tokenize(texts, view=view)
+        lengths = np.array([len(ids) for ids in token_ids]) + self.SPECIAL_TOKENS
+        order = np.argsort(lengths, kind="stable")
+        embeddings = np.empty((len(texts), dim), dtype=np.float32)
+        for bucket_start in range(0, len(texts), batch_size):
+            bucket = order[bucket_start:bucket_start + batch_size]
+            embeddings[bucket] = self.model.encode(
+                [token_ids[i] for i in bucket],
+                batch_size=len(bucket),
+                is_pretokenized=True,
+                convert_to_numpy=True,
+                convert_to_tensor=False
+            )
+        self.seconds += time.perf_counter() - start
+        self.text_count += len(texts)
+        self.token_count += int(lengths.sum())
+        self.padded_token_count += self.get_padded_token_count(lengths[order], batch_size)
+        self.unsorted_padded_token_count += self.get_padded_token_count(lengths, batch_size)
+        return embeddings
+
+    def get_padding_ratio(self, padded_token_count: int) -> float:
+        if padded_token_count == 0:
+            return 0.
+        return 1 - self.token_count / padded_token_count
+
+    def print_stats(self):
+        tokens_per_second = self.token_count / self.seconds if self.seconds else 0.
+        print(f"Encoded Texts: {self.text_count}")
+        print(f"Encoded Tokens: {self.token_count}")
+        print(f"Tokens/sec: {tokens_per_second:.1f}")
+        print(f"Padding Ratio: {self.get_padding_ratio(self.padded_token_count):.4f}")
+        print(f"Padding Ratio Without Bucketing: {self.get_padding_ratio(self.unsorted_padded_token_count):.4f}")
+        self.truncator.stats.print_stats()
@@ -0,0 +1,59 @@
+from typing import Callable, List, Tuple
+
+class TruncationStats():
+    # per view: [texts, truncated texts, texts tokenized a second time]
+    def __init__(self):
+        self.views = {}
+
+    def get(self, view) -> List[int]:
+        return list(self.views.get(view, [0, 0, 0]))
+
+    def add(self, view, counts: List[int]):
+        current = self.views.setdefault(view, [0, 0, 0])
+        for i, count in enumerate(counts):
+            current[i] += count
+
+    def print_stats(self):
+        for view, (text_count, truncated_count, retokenized_count) in sorted(self.views.items(), key=lambda item: str(item[0])):
+            ratio = truncated_count / text_count if text_count else 0.
+            print(f"Truncated ({view}): {truncated_count}/{text_count} ({ratio:.2%}), Retokenized: {retokenized_count}")
+
+class Truncator():
+    '''
+    Cuts texts to the token budget of the model before they are fully tokenized. Texts are
+    first cut to max_tokens * max_chars_per_token characters, which is more than max_tokens
+    tokens for any realistic text, and then tokenized exactly once. The token ids are
+    truncated to max_tokens. Only if the character cut left fewer than max_tokens tokens,
+    the whole text is tokenized again.
+    '''
+    def __init__(self, tokenize: Callable[[str], List[int]], max_tokens: int, max_chars_per_token=10):
+        self.tokenize_func = tokenize
+        self.max_tokens = max_tokens
+        self.max_chars = max_tokens * max_chars_per_token
+        self.stats = TruncationStats()
+
+    def cut(self, text: str) -> Tuple[str, bool]:
+        if len(text) <= self.max_chars:
+            return text, False
+        # do not split the last word, it would be tokenized differently
+        cut_at = text.rfind(" ", 0, self.max_chars + 1)
+        return text[:cut_at if cut_at > 0 else self.max_chars], True
+
+    def tokenize(self, texts: List[str], view=None) -> List[List[int]]:
+        token_ids = []
+        truncated_count = 0
+        retokenized_count = 0
+        for text in texts:
+            cut_text, truncated = self.cut(text)
+            ids = self.tokenize_func(cut_text)
+            if truncated and len(ids) < self.max_tokens:
+                ids = self.tokenize_func(text)
+                truncated = False
+                retokenized_count += 1
+            if len(ids) > self.max_tokens:
+                ids = ids[:self.max_tokens]
+                truncated = True
+            truncated_count += truncated
+            token_ids.append(ids)
+        self.stats.add(view, [len(texts), truncated_count, retokenized_count])
+        return token_ids
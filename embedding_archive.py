@@ -0,0 +1,129 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+from typing import List, Tuple
+from .label_table import LabelTable
+from .pyw_hnswlib import Hnswlib
+from .typings import VectorList
+
+class EmbeddingArchive():
+    '''
+    Append-only store of the embeddings of a build as they came from the encoder, not
+    normalized, so that new graphs are built without parsing and encoding again:
+    <path>.f32 holds the float32 rows, <path>.ids.npy their ids, <path>.removed.npy the rows
+    that are removals (zero rows, see remove) and <path>.json the dim and the row count. Rows
+    written after the last flush are dropped when the archive is opened. If an id was added
+    or removed more than once, its last row counts.
+    '''
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self.ids = LabelTable()
+        self.count = 0
+        # row numbers of the removals
+        self.removed = np.empty(0, dtype=np.int64)
+        if os.path.isfile(path + ".json"):
+            with open(path + ".json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["dim"] != dim:
+                raise ValueError(f"archive {path} has dim {meta['dim']}, not {dim}.")
+            self.ids = LabelTable.load(path + ".ids.npy")
+            self.count = meta["count"]
+            self.removed = EmbeddingArchive.load_removed(path, self.count)
+        self.truncate(self.count)
+
+    def truncate(self, count: int):
+        # e.g. to the row count of a checkpoint
+        if count > self.count:
+            raise ValueError(f"archive {self.path} has only {self.count} rows.")
+        with open(self.path + ".f32", "ab") as f:
+            f.truncate(count * self.dim * 4)
+        # the ids may also be ahead of the row count after a crash while flushing
+        if count < len(self.ids):
+            ids = self.ids.translate(np.arange(count)).tolist()
+            self.ids = LabelTable(capacity=max(count, 1))
+            self.ids.append(ids)
+        self.removed = self.removed[self.removed < count]
+        self.count = count
+
+    def append(self, embeddings: VectorList, ids: List[str]):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        assert embeddings.shape == (len(ids), self.dim)
+        with open(self.path + ".f32", "ab") as f:
+            f.write(embeddings.tobytes())
+        self.ids.append(ids)
+        self.count += len(ids)
+
+    def remove(self, ids: List[str]):
+        # a zero row per id keeps the rows aligned with their ids
+        self.append(np.zeros((len(ids), self.dim), dtype=np.float32), ids)
+        self.removed = np.concatenate([self.removed, np.arange(self.count - len(ids), self.count)])
+
+    def flush(self):
+        self.ids.save(self.path + ".ids.npy")
+        with open(self.path + ".removed.npy.tmp", "wb") as f:
+            np.save(f, self.removed)
+        os.replace(self.path + ".removed.npy.tmp", self.path + ".removed.npy")
+        with open(self.path + ".json.tmp", "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "count": self.count}, f)
+        os.replace(self.path + ".json.tmp", self.path + ".json")
+
+    @staticmethod
+    def load(path: str) -> Tuple[VectorList, np.ndarray]:
+        '''
+        Returns the memory-mapped embeddings of the flushed archive at path and their ids.
+        '''
+        with open(path + ".json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        ids = np.char.decode(np.load(path + ".ids.npy", mmap_mode="r")[:meta["count"]], "utf-8")
+        if meta["count"] == 0:
+            return np.empty((0, meta["dim"]), dtype=np.float32), ids
+        embeddings = np.memmap(path + ".f32", dtype=np.float32, mode="r", shape=(meta["count"], meta["dim"]))
+        return embeddings, ids
+
+    @staticmethod
+    def load_removed(path: str, count: int) -> np.ndarray:
+        '''
+        Returns the row numbers of the removals among the first count rows of the archive at
+        path. Archives written before removals were recorded have none.
+        '''
+        if not os.path.isfile(path + ".removed.npy"):
+            return np.empty(0, dtype=np.int64)
+        removed = np.load(path + ".removed.npy")
+        return removed[removed < count]
+
+def rebuild(archive_path: str, target: str, m=16, ef_construction=200, num_threads=-1, block_size=100000) -> Hnswlib:
+    '''
+    Builds a new cosine HNSW storage at target from the archive, hnswlib inserts every block
+    with num_threads threads (-1 uses all cores). Ids whose last row is a removal are left out.
+    '''
+    embeddings, ids = EmbeddingArchive.load(archive_path)
+    # the last row of every id
+    _, last = np.unique(ids[::-1], return_index=True)
+    rows = np.sort(len(ids) - 1 - last)
+    rows = rows[~np.isin(rows, EmbeddingArchive.load_removed(archive_path, len(ids)))]
+    index = Hnswlib(space='cosine', dim=embeddings.shape[1], growth_factor=None)
+    index.init_index(max_elements=max(len(rows), 1), ef_construction=ef_construction, M=m)
+    index.set_num_threads(num_threads)
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        index.add_items(embeddings[block], ids[block].tolist())
+    index.save_index(target)
+    return index
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description='Build a vector storage from the embedding archive of a previous build')
+    p.add_argument('--archive', required=True, help='Path of the archive, <storage>.emb for storages built with --archive_embeddings')
+    p.add_argument('--target', required=True, help='Path of the new vector storage (.bin)')
+    p.add_argument('--m', default=16, type=int, help='M of the HNSW graph')
+    p.add_argument('--ef_construction', default=200, type=int, help='ef_construction of the HNSW graph')
+    p.add_argument('--threads', default=-1, type=int, help='hnswlib threads for insertion, -1 uses all cores')
+    p.add_argument('--block_size', default=100000, type=int, help='Number of embeddings inserted per hnswlib call')
+
+    args = p.parse_args()
+
+    start = time.perf_counter()
+    index = rebuild(args.archive, args.target, m=args.m, ef_construction=args.ef_construction, num_threads=args.threads, block_size=args.block_size)
+    print(f"Built {args.target} with {index.get_current_count()} elements in {time.perf_counter() - start:.1f}s")
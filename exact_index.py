@@ -0,0 +1,231 @@
+# Exact cosine nearest neighbor search with the interface of pyw_hnswlib.Hnswlib
+import argparse
+import os
+import threading
+import time
+import hnswlib
+import numpy as np
+from .label_table import LabelTable
+from .typings import VectorList
+
+def normalize(data: VectorList) -> VectorList:
+    data = np.array(data, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(data, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return data / norms
+
+class ExactIndex():
+    '''
+    Brute-force index over a normalized float32 matrix. Queries are answered in blocks of rows,
+    each block with one matrix multiply against all vectors and an argpartition for the top k,
+    so the similarity matrix of a block stays below block_elements floats. Saved as .npy at the
+    index path, loaded memory-mapped. Loading an hnswlib .bin copies its vectors instead.
+    '''
+    def __init__(self, space, dim, growth_factor=2., block_elements=1 << 24):
+        if space != "cosine":
+            raise ValueError(f"space: {space} not supported.")
+        self.dim = dim
+        self.growth_factor = growth_factor
+        self.block_elements = block_elements
+        self.lock = threading.Lock()
+        self.labels = LabelTable()
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.count = 0
+
+    def init_index(self, max_elements: int, ef_construction = 200, M = 16):
+        # graph parameters are meaningless for exact search
+        self.vectors = np.empty((max_elements, self.dim), dtype=np.float32)
+
+    def get_max_elements(self):
+        return len(self.vectors)
+
+    def get_current_count(self):
+        # includes the deleted elements
+        return self.count
+
+    def get_deleted_count(self):
+        return len(self.labels.free_labels)
+
+    def resize_index(self, new_size: int):
+        with self.lock:
+            self._resize(new_size)
+
+    def _resize(self, new_size: int):
+        vectors = np.empty((new_size, self.dim), dtype=np.float32)
+        vectors[:self.count] = self.vectors[:self.count]
+        self.vectors = vectors
+
+    def _reserve(self, num_added: int):
+        # a memory-mapped matrix is copied on the first change
+        capacity = len(self.vectors)
+        if self.count + num_added <= capacity and not isinstance(self.vectors, np.memmap):
+            return
+        if self.count + num_added > capacity and self.growth_factor is None:
+            raise RuntimeError("The number of elements exceeds the specified limit")
+        while capacity < self.count + num_added:
+            capacity = max(int(capacity * self.growth_factor), capacity + 1)
+        self._resize(capacity)
+
+    def add_items(self, data: VectorList, ids=None):
+        data = normalize(data)
+        if ids is not None:
+            assert len(data) == len(ids)
+        num_added = len(data)
+        with self.lock:
+            self._reserve(num_added)
+            if ids is not None:
+                self.labels.append(ids)
+            else:
+                self.labels.append([str(label) for label in range(self.count, self.count + num_added)])
+            self.vectors[self.count:self.count + num_added] = data
+            self.count += num_added
+
+    def upsert_items(self, data: VectorList, ids):
+        data = normalize(data)
+        assert len(data) == len(ids)
+        with self.lock:
+            labels = self.labels.assign(ids)
+            end = max(self.count, int(labels.max(initial=-1)) + 1)
+            self._reserve(end - self.count)
+            self.vectors[labels] = data
+            self.count = end
+
+    def remove_items(self, ids) -> int:
+        with self.lock:
+            labels = self.labels.lookup(ids)
+            labels = np.unique(labels[labels >= 0]).tolist()
+            self.labels.release(labels)
+        return len(labels)
+
+    def compact(self):
+        with self.lock:
+            live = np.flatnonzero(self.labels.ids[:self.count] != b"")
+            ids = self.labels.translate(live).tolist()
+            self.vectors = np.array(self.vectors[live])
+            self.count = len(live)
+            self.labels = LabelTable(capacity=len(live))
+            self.labels.append(ids)
+
+    def get_items(self, labels):
+        return self.vectors[np.asarray(labels)]
+
+    def set_ef(self, ef: int):
+        pass
+
+    def set_num_threads(self, num_threads: int):
+        # numpy's BLAS decides the threads of the matrix multiply
+        pass
+
+    def load_index(self, path: str, max_elements=0):
+        with open(path, "rb") as f:
+            is_npy = f.read(6) == b"\x93NUMPY"
+        self.labels = LabelTable.load_for_index(path)
+        if is_npy:
+            self.vectors = np.load(path, mmap_mode="r")
+        else:
+            self.vectors = ExactIndex.read_hnswlib_vectors(path, self.dim, self.labels)
+        self.count = len(self.vectors)
+        if max_elements > self.count:
+            self._resize(max_elements)
+
+    @staticmethod
+    def read_hnswlib_vectors(path: str, dim: int, labels: LabelTable) -> VectorList:
+        # hnswlib keeps the normalized vectors of a cosine index, labels are 0..count-1;
+        # deleted labels can not be read, their rows stay zero and their ids empty
+        index = hnswlib.Index("cosine", dim)
+        index.load_index(path)
+        count = index.get_current_count()
+        vectors = np.zeros((count, dim), dtype=np.float32)
+        live = np.flatnonzero(labels.ids[:count] != b"")
+        vectors[live] = ExactIndex.read_hnswlib_items(index, live, dim)
+        return vectors
+
+    @staticmethod
+    def read_hnswlib_items(index: hnswlib.Index, labels, dim: int, block_size=16384) -> VectorList:
+        # hnswlib returns nested lists, read in blocks so that only one block is held as lists
+        labels = np.asarray(labels)
+        vectors = np.empty((len(labels), dim), dtype=np.float32)
+        for start in range(0, len(labels), block_size):
+            block = labels[start:start + block_size]
+            vectors[start:start + len(block)] = np.array(index.get_items(block), dtype=np.float32).reshape(len(block), dim)
+        return vectors
+
+    def save_index(self, path: str):
+        # renamed after writing, the vectors may be memory-mapped from the path
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, self.vectors[:self.count])
+        os.replace(path + ".tmp", path)
+        self.labels.save(LabelTable.sidecar_path(path))
+
+    def knn_query_labels(self, data: VectorList, k=1, allowed=None, denied=None):
+        data = normalize(data)
+        # allowed is a bitmap over the labels, denied an array of labels
+        excluded = None
+        if allowed is not None or denied is not None or self.labels.free_labels:
+            excluded = np.zeros(self.count, dtype=bool)
+            excluded[self.labels.free_labels] = True
+            if allowed is not None:
+                excluded |= ~allowed[:self.count]
+            if denied is not None:
+                excluded[denied] = True
+        candidate_count = self.count if excluded is None else self.count - int(excluded.sum())
+        if k > candidate_count:
+            raise ValueError(f"k: {k} exceeds the number of elements: {candidate_count}.")
+        vectors = self.vectors[:self.count]
+        labels = np.empty((len(data), k), dtype=np.int64)
+        distances = np.empty((len(data), k), dtype=np.float32)
+        block_size = max(1, self.block_elements // max(self.count, 1))
+        for start in range(0, len(data), block_size):
+            similarities = data[start:start + block_size] @ vectors.T
+            if excluded is not None:
+                similarities[:, excluded] = -np.inf
+            # unordered top k per row, then sorted by similarity
+            top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+            top_similarities = np.take_along_axis(similarities, top, axis=1)
+            order = np.argsort(-top_similarities, axis=1)
+            labels[start:start + block_size] = np.take_along_axis(top, order, axis=1)
+            distances[start:start + block_size] = 1 - np.take_along_axis(top_similarities, order, axis=1)
+        return labels, distances
+
+    def knn_query(self, data: VectorList, k=1, allowed=None, denied=None):
+        labels_int, distances = self.knn_query_labels(data, k, allowed=allowed, denied=denied)
+        return self.labels.translate(labels_int), distances
+
+def recall_at_k(approximate_ids, exact_ids) -> np.ndarray:
+    # per query: share of the exact k nearest neighbors the approximate search found
+    return np.array([len(set(a) & set(e)) / len(e) for a, e in zip(np.asarray(approximate_ids).tolist(), np.asarray(exact_ids).tolist())])
+
+if __name__ == "__main__":
+    from .vector_storage import VectorStorage
+
+    p = argparse.ArgumentParser(description='Measure the recall@k of a HNSW vector storage against exact search')
+    p.add_argument('--storage', required=True, help='Path of the vector storage (.bin)')
+    p.add_argument('--dim', default=768, type=int, help='Dimension of the embeddings')
+    p.add_argument('--queries', default=None, help='.npy file of query embeddings, defaults to a sample of the stored vectors')
+    p.add_argument('--sample', default=1000, type=int, help='Number of stored vectors used as queries')
+    p.add_argument('--k', default=100, type=int, help='Number of nearest neighbors')
+    p.add_argument('--ef', default=150, type=int, help='ef of the HNSW search')
+
+    args = p.parse_args()
+
+    hnsw = VectorStorage(args.storage, dim=args.dim, ef=args.ef, persist=False)
+    exact = VectorStorage(args.storage, dim=args.dim, persist=False, backend="exact")
+    if args.queries:
+        queries = np.load(args.queries)
+    else:
+        sample = np.random.RandomState(0).choice(exact.get_current_count(), min(args.sample, exact.get_current_count()), replace=False)
+        queries = exact.storage.get_items(sample)
+
+    start = time.perf_counter()
+    hnsw_ids, _ = hnsw.get_k_nearest_batch(queries, args.k)
+    hnsw_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    exact_ids, _ = exact.get_k_nearest_batch(queries, args.k)
+    exact_seconds = time.perf_counter() - start
+
+    recalls = recall_at_k(hnsw_ids, exact_ids)
+    print(f"Queries: {len(queries)}")
+    print(f"Recall@{args.k} Avg: {recalls.mean():.4f}")
+    print(f"Recall@{args.k} Min: {recalls.min():.4f}")
+    print(f"Query Seconds HNSW: {hnsw_seconds:.3f}")
+    print(f"Query Seconds Exact: {exact_seconds:.3f}")
@@ -1,8 +1,6 @@
 import re
 from .typings import Vector, StringList
-from scipy.spatial.distance import cosine
 import numpy as np
-from itertools import combinations
 from typing import Optional
 
 class FeatureExtraction():
@@ -13,44 +11,72 @@ class FeatureExtraction():
 
     @staticmethod
     def mean_of_pairwise_cosine_distances(embeddings) -> float:
-        # all combinations of 2 rows, ignoring order and no repeated elements
-        coms = combinations(embeddings, 2)
-        dists = np.array([cosine(pair[0], pair[1]) for pair in coms])
-        mean_dist = np.mean(dists)
+        embeddings = np.asarray(embeddings, dtype=np.float64)
+        normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        # the upper triangle of the Gram matrix holds the cosine similarities of all
+        # combinations of 2 rows, ignoring order and no repeated elements
+        gram = normalized @ normalized.T
+        similarities = gram[np.triu_indices(len(embeddings), k=1)]
+        mean_dist = float(np.mean(1 - similarities))
         return mean_dist
 
     def get_keywords_similarity(self, keywords: StringList):
         keywords_similarity = 2. # max cosine distance
+        embeddings = np.empty((0, 0))
         if len(keywords) > 1:
-            embeddings = [self.embedder.encode(word) for word in keywords]
+            # one batch for all keywords, skipping empty ones
+            embeddings, missing = self.embedder.encode_batch(keywords, view="keywords")
+            embeddings = np.delete(embeddings, missing, axis=0)
+        if len(embeddings) > 1:
             keywords_similarity = FeatureExtraction.mean_of_pairwise_cosine_distances(embeddings)
         else:
             keywords_similarity = 0
         return keywords_similarity
 
+    def get_text_of_title_with_first_paragraph(self, article) -> Optional[str]:
+        if not article:
+            return None
+        return self.parser.get_title_with_first_paragraph(article)
+
+    def get_text_of_title(self, article) -> Optional[str]:
+        if not article:
+            return None
+        return self.parser.get_title(article)
+
+    def get_text_of_title_with_section_titles(self, article) -> Optional[str]:
+        if not article:
+            return None
+        return self.parser.get_title_with_section_titles(article)
+
+    @staticmethod
+    def get_text_of_keywords(keywords: StringList) -> Optional[str]:
+        if len(keywords) == 0:
+            return None
+        return " ".join(keywords)
+
     def get_embedding_of_title_with_first_paragraph(self, article) -> Optional[Vector]:
         emb = None
         if article:
-            combined_text = self.parser.get_title_with_first_paragraph(article)
-            emb = self.embedder.encode(combined_text)
+            combined_text = self.get_text_of_title_with_first_paragraph(article)
+            emb = self.embedder.encode(combined_text, view="title_with_first_paragraph")
         return emb
 
     def get_embedding_of_title(self, article) -> Optional[Vector]:
         emb = None
         if article:
-            titles = self.parser.get_title(article)
-            emb = self.embedder.encode(titles)
+            titles = self.get_text_of_title(article)
+            emb = self.embedder.encode(titles, view="title")
         return emb
 
     def get_embedding_of_title_with_section_titles(self, article) -> Optional[Vector]:
         emb = None
         if article:
-            titles = self.parser.get_title_with_section_titles(article)
-            emb = self.embedder.encode(titles)
+            titles = self.get_text_of_title_with_section_titles(article)
+            emb = self.embedder.encode(titles, view="title_with_section_titles")
         return emb
 
     def get_embedding_of_keywords(self, keywords: StringList) -> Optional[Vector]:
-        if len(keywords) == 0:
+        keywords_str = FeatureExtraction.get_text_of_keywords(keywords)
+        if keywords_str is None:
             return None
-        keywords_str = " ".join(keywords)
-        return self.embedder.encode(keywords_str)
\ No newline at end of file
+        return self.embedder.encode(keywords_str, view="keywords")
@@ -0,0 +1,167 @@
+import queue
+import threading
+import time
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, Tuple
+
+class StageStats():
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.seconds = 0.
+
+    def add(self, items: int, seconds: float):
+        self.items += items
+        self.seconds += seconds
+
+    def print_stats(self):
+        # seconds the stage was busy, waiting on the queues is not counted
+        items_per_second = self.items / self.seconds if self.seconds else 0.
+        print(f"{self.name}: {self.items} items in {self.seconds:.1f}s ({items_per_second:.1f}/sec)")
+
+class IngestPipeline():
+    '''
+    Pipelined ingest of a line based file into an Hnswlib index:
+
+    parse: batches of lines are parsed by parse_func in a thread pool of parse_workers
+    encode: parsed batches are encoded in input order by embedder.encode_batch
+    insert: a separate thread adds the embeddings with insert_threads hnswlib threads, and
+            appends them to archive (see EmbeddingArchive) if one is given
+
+    Bounded queues connect the stages, so at most queue_size batches wait between two stages.
+    The embedding buffers are recycled between the encode and insert stages.
+    If run is given a position function, e.g. the byte offset of the input file, its value
+    after the last line of every batch is passed to on_inserted once the batch is inserted,
+    in input order and on the insert thread.
+    '''
+    def __init__(self, storage, embedder, dim, batch_size=1000, parse_workers=4, insert_threads=0, queue_size=4, view=None, archive=None):
+        self.storage = storage
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self.parse_workers = parse_workers
+        self.queue_size = queue_size
+        self.view = view
+        self.archive = archive
+        if insert_threads:
+            self.storage.set_num_threads(insert_threads)
+        self.free_buffers = queue.Queue()
+        for _ in range(queue_size + 2):
+            self.free_buffers.put(np.empty((batch_size, dim), dtype=np.float32))
+
+        self.parse_stats = StageStats("Parse")
+        self.encode_stats = StageStats("Encode")
+        self.insert_stats = StageStats("Insert")
+        self.exception_count = 0
+        self.total = 0
+        self.seconds = 0.
+
+    def _parse_batch(self, parse_func, lines: List[str]) -> Tuple[List[str], List[str], int, float]:
+        start = time.perf_counter()
+        texts = []
+        ids = []
+        exception_count = 0
+        for line in lines:
+            text, article_id = parse_func(line)
+            if not text or article_id is None:
+                exception_count += 1
+                continue
+            texts.append(text)
+            ids.append(article_id)
+        return texts, ids, exception_count, time.perf_counter() - start
+
+    def _insert(self, insert_queue: queue.Queue, errors: list, on_inserted):
+        while True:
+            item = insert_queue.get()
+            if item is None:
+                return
+            # batches without embeddings only report their position
+            embeddings, ids, buffer, position = item
+            try:
+                if not errors:
+                    if len(ids) != 0:
+                        start = time.perf_counter()
+                        self.storage.add_items(embeddings, ids)
+                        if self.archive is not None:
+                            self.archive.append(embeddings, ids)
+                        self.insert_stats.add(len(ids), time.perf_counter() - start)
+                    if on_inserted is not None:
+                        on_inserted(position)
+            except BaseException as e:
+                # keep draining the queue, the error is raised in the calling thread
+                errors.append(e)
+            finally:
+                if buffer is not None:
+                    self.free_buffers.put(buffer)
+
+    def _encode_batch(self, texts: List[str], ids: List[str]) -> Tuple[tuple, int]:
+        buffer = self.free_buffers.get()
+        start = time.perf_counter()
+        embeddings, missing = self.embedder.encode_batch(texts, out=buffer, view=self.view)
+        if missing:
+            keep = np.setdiff1d(np.arange(len(texts)), missing)
+            embeddings = embeddings[keep]
+            ids = [ids[i] for i in keep]
+        self.encode_stats.add(len(texts), time.perf_counter() - start)
+        return (embeddings, ids, buffer), len(missing)
+
+    def run(self, lines: Iterable[str], parse_func: Callable[[str], Tuple[Optional[str], Optional[str]]], position=None, on_inserted=None):
+        '''
+        parse_func maps one line to (text, id), lines without text or id are counted as exceptions.
+        '''
+        start = time.perf_counter()
+        insert_queue = queue.Queue(maxsize=self.queue_size)
+        errors = []
+        inserter = threading.Thread(target=self._insert, args=(insert_queue, errors, on_inserted), daemon=True)
+        inserter.start()
+        pending = deque()
+
+        def encode_next():
+            future, batch_position = pending.popleft()
+            texts, ids, exception_count, parse_seconds = future.result()
+            self.parse_stats.add(len(texts) + exception_count, parse_seconds)
+            self.exception_count += exception_count
+            if errors:
+                raise errors[0]
+            if len(texts) == 0:
+                insert_queue.put((None, [], None, batch_position))
+                return
+            (embeddings, ids, buffer), missing_count = self._encode_batch(texts, ids)
+            self.exception_count += missing_count
+            self.total += len(texts) - missing_count
+            insert_queue.put((embeddings, ids, buffer, batch_position))
+
+        def submit(lines_batch):
+            batch_position = position() if position is not None else None
+            pending.append((executor.submit(self._parse_batch, parse_func, lines_batch), batch_position))
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.parse_workers) as executor:
+                lines_batch = []
+                for line in lines:
+                    lines_batch.append(line)
+                    if len(lines_batch) == self.batch_size:
+                        submit(lines_batch)
+                        lines_batch = []
+                        # keep the parse stage at most queue_size batches ahead
+                        if len(pending) > self.queue_size:
+                            encode_next()
+                if len(lines_batch) != 0:
+                    submit(lines_batch)
+                while pending:
+                    encode_next()
+        finally:
+            insert_queue.put(None)
+            inserter.join()
+            self.seconds += time.perf_counter() - start
+        if errors:
+            raise errors[0]
+
+    def print_stats(self):
+        print(f"Done. Exception Count: {self.exception_count}. Total: {self.total}")
+        self.parse_stats.print_stats()
+        self.encode_stats.print_stats()
+        self.insert_stats.print_stats()
+        items_per_second = self.total / self.seconds if self.seconds else 0.
+        print(f"Wall Time: {self.seconds:.1f}s ({items_per_second:.1f} items/sec)")
@@ -0,0 +1,171 @@
+import os
+import pickle
+import numpy as np
+from typing import List
+
+class LabelTable():
+    '''
+    Maps the int labels of an hnswlib index to article ids. The ids are kept utf-8 encoded in
+    one fixed-width bytes array, so that label i is row i and a whole matrix of labels is
+    translated with a single fancy index. The table is saved as a .npy sidecar of the index
+    and memory-mapped on load; it is only copied into memory once ids are changed.
+    Released labels keep an empty id and are handed out again by assign.
+    '''
+    def __init__(self, capacity=1024):
+        self.ids = np.empty(capacity, dtype="S1")
+        self.count = 0
+        self.free_labels = []
+        # (labels sorted by id, sorted ids) for lookups, ids changed since then are in _recent
+        self._sorted = None
+        self._recent = {}
+        # counts the changes of ids, e.g. to know when looked up labels are stale
+        self.version = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _reserve(self, count: int, width: int):
+        capacity = len(self.ids)
+        width = max(width, self.ids.dtype.itemsize)
+        mapped = isinstance(self.ids, np.memmap)
+        if count <= capacity and width == self.ids.dtype.itemsize and not mapped:
+            return
+        # grow geometrically, a memory-mapped table is copied on the first append
+        while capacity < count:
+            capacity = max(2 * capacity, 1024)
+        ids = np.empty(capacity, dtype=f"S{width}")
+        ids[:self.count] = self.ids[:self.count]
+        self.ids = ids
+
+    def _track(self, encoded: List[bytes], labels: List[int]):
+        # small changes go to _recent, large ones resort the whole table on the next lookup
+        self.version += 1
+        if self._sorted is None or len(self._recent) + len(encoded) > max(1024, self.count // 8):
+            self._sorted = None
+            self._recent = {}
+            return
+        self._recent.update(zip(encoded, labels))
+
+    def append(self, ids: List[str]) -> int:
+        '''
+        Adds the ids as the next labels and returns the first of them.
+        '''
+        encoded = np.array([str(article_id).encode("utf-8") for article_id in ids], dtype=np.bytes_)
+        start = self.count
+        self._reserve(start + len(encoded), encoded.dtype.itemsize)
+        self.ids[start:start + len(encoded)] = encoded
+        self.count += len(encoded)
+        self._track(encoded.tolist(), list(range(start, start + len(encoded))))
+        return start
+
+    def release(self, labels: List[int]):
+        # the labels keep no id until assign reuses them
+        self._reserve(self.count, 1)
+        released = [bytes(self.ids[label]) for label in labels]
+        self.ids[labels] = b""
+        self.free_labels.extend(labels)
+        self._track(released, [-1] * len(released))
+
+    def assign(self, ids: List[str]) -> np.ndarray:
+        '''
+        Returns a label for every id: its current label if it has one, else a released label,
+        else a new one.
+        '''
+        labels = self.lookup(ids)
+        new_ids = [article_id for article_id, label in zip(ids, labels) if label < 0]
+        reused = []
+        while self.free_labels and len(reused) < len(new_ids):
+            reused.append(self.free_labels.pop())
+        if reused:
+            encoded = np.array([str(article_id).encode("utf-8") for article_id in new_ids[:len(reused)]], dtype=np.bytes_)
+            self._reserve(self.count, encoded.dtype.itemsize)
+            self.ids[reused] = encoded
+            self._track(encoded.tolist(), reused)
+        appended = new_ids[len(reused):]
+        start = self.append(appended) if appended else self.count
+        labels[labels < 0] = reused + list(range(start, start + len(appended)))
+        return labels
+
+    def translate(self, labels: np.ndarray) -> np.ndarray:
+        # labels of any shape, e.g. the N*k labels of a knn query, to a str array of that shape
+        return np.char.decode(self.ids[:self.count][labels], "utf-8")
+
+    def lookup(self, ids: List[str]) -> np.ndarray:
+        '''
+        Returns the label of every id, -1 for unknown ids. If an id was added more than once,
+        one of its labels is returned.
+        '''
+        table = self.ids[:self.count]
+        if self._sorted is None:
+            sorted_labels = np.argsort(table, kind="stable")
+            self._sorted = (sorted_labels, table[sorted_labels])
+            self._recent = {}
+        sorted_labels, sorted_ids = self._sorted
+        encoded = [str(article_id).encode("utf-8") for article_id in ids]
+        labels = np.full(len(encoded), -1, dtype=np.int64)
+        if len(sorted_ids) != 0 and len(encoded) != 0:
+            # longer ids than the table width can not be in the table, but would match when cut
+            fits = np.array([0 < len(article_id) <= table.dtype.itemsize for article_id in encoded])
+            queries = np.array(encoded, dtype=table.dtype)
+            positions = np.minimum(np.searchsorted(sorted_ids, queries), len(sorted_ids) - 1)
+            found = fits & (sorted_ids[positions] == queries)
+            labels[found] = sorted_labels[positions[found]]
+            # the label may have been released or reassigned since the table was sorted
+            labels[found & (table[np.maximum(labels, 0)] != queries)] = -1
+        for i, article_id in enumerate(encoded):
+            if article_id in self._recent:
+                labels[i] = self._recent[article_id]
+        return labels
+
+    def save(self, path: str):
+        # written next to the path and renamed, the table may be memory-mapped from it
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, self.ids[:self.count])
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def load(path: str) -> "LabelTable":
+        table = LabelTable(capacity=0)
+        table.ids = np.load(path, mmap_mode="r")
+        table.count = len(table.ids)
+        table.free_labels = np.flatnonzero(table.ids == b"").tolist()
+        return table
+
+    @staticmethod
+    def load_pickle(path: str) -> "LabelTable":
+        # indexes saved before the label table pickled (cur_ind, {label: id})
+        with open(path, "rb") as f:
+            cur_ind, dict_labels = pickle.load(f)
+        table = LabelTable(capacity=cur_ind)
+        table.append([dict_labels.get(label, "") for label in range(cur_ind)])
+        return table
+
+    @staticmethod
+    def sidecar_path(index_path: str) -> str:
+        return index_path + ".labels.npy"
+
+    @staticmethod
+    def load_for_index(index_path: str) -> "LabelTable":
+        path = LabelTable.sidecar_path(index_path)
+        if not os.path.isfile(path) and os.path.isfile(index_path + ".pkl"):
+            return LabelTable.load_pickle(index_path + ".pkl")
+        return LabelTable.load(path)
+
+class IdFilter():
+    '''
+    A fixed set of ids excluded from many queries, e.g. all opinion articles. Its labels are
+    looked up once per label table and version instead of once per query.
+    '''
+    def __init__(self, ids: List[str]):
+        self.ids = list(ids)
+        # (label table, its version, labels), replaced as a whole so that threads may share it
+        self._cached = (None, -1, None)
+
+    def get_labels(self, table: LabelTable) -> np.ndarray:
+        cached_table, version, labels = self._cached
+        if cached_table is not table or version != table.version:
+            version = table.version
+            labels = table.lookup(self.ids)
+            labels = np.unique(labels[labels >= 0])
+            self._cached = (table, version, labels)
+        return labels
@@ -0,0 +1,174 @@
+import argparse
+import json
+import os
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from .label_table import LabelTable
+from .pyw_hnswlib import Hnswlib
+from .typings import VectorList, StringList, NeighborIds, NeighborDistances
+
+class MultiViewStorage():
+    '''
+    Several named embedding views of the same articles, e.g. wapo_vs_title and
+    wapo_vs_extracted_k_normalized, with one HNSW index per view under one label table, so
+    every article id is stored once. The directory holds manifest.json, labels.npy and
+    {view}.bin per view. Views are loaded on first use; get_k_nearest_views queries several
+    views in parallel threads.
+    '''
+    def __init__(
+        self,
+        storage_location,
+        dim = 768,
+        ef_construction = 200,
+        m = 100,
+        ef = 150,
+        max_elements = 1024,
+        num_threads = None
+    ):
+        self.storage_location = storage_location
+        self.dim = dim
+        self.ef_construction = ef_construction
+        self.m = m
+        self.ef = ef
+        self.max_elements = max_elements
+        self.num_threads = num_threads
+        self.lock = threading.Lock()
+
+        # view name -> index, None until the view is loaded
+        self.views = {}
+        self.view_locks = {}
+        self.labels = LabelTable()
+
+        manifest_path = f"{storage_location}/manifest.json"
+        if os.path.isfile(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            self.dim = manifest["dim"]
+            self.labels = LabelTable.load(f"{storage_location}/labels.npy")
+            for name in manifest["views"]:
+                self.views[name] = None
+                self.view_locks[name] = threading.Lock()
+
+    def get_view_path(self, name: str) -> str:
+        return f"{self.storage_location}/{name}.bin"
+
+    def get_view_names(self) -> List[str]:
+        return list(self.views)
+
+    def get_current_count(self):
+        return len(self.labels)
+
+    def get_view(self, name: str) -> Hnswlib:
+        if name not in self.views:
+            raise KeyError(f"view: {name} not found.")
+        # views load in parallel, each only once
+        with self.view_locks[name]:
+            if self.views[name] is None:
+                view = Hnswlib(space='cosine', dim=self.dim, labels=self.labels)
+                view.load_index(self.get_view_path(name))
+                view.set_ef(self.ef)
+                self.views[name] = view
+        return self.views[name]
+
+    def _create_view(self, name: str, max_elements: int, ef_construction: int, m: int) -> Hnswlib:
+        view = Hnswlib(space='cosine', dim=self.dim, labels=self.labels)
+        view.init_index(max_elements=max_elements, ef_construction=ef_construction, M=m)
+        view.set_ef(self.ef)
+        self.views[name] = view
+        self.view_locks[name] = threading.Lock()
+        return view
+
+    def add_items(self, name: str, embeddings: VectorList, ids: StringList):
+        '''
+        Adds the embeddings of the articles to the view, which is created if it does not exist.
+        Articles already stored in the view get the new embedding. Ids must be unique.
+        '''
+        if len(set(ids)) != len(ids):
+            raise ValueError("article ids must be unique.")
+        with self.lock:
+            if name in self.views:
+                view = self.get_view(name)
+            else:
+                view = self._create_view(name, self.max_elements, self.ef_construction, self.m)
+            labels = self.labels.assign(ids)
+        view.add_labeled_items(embeddings, labels)
+
+    def add_view_from_storage(self, name: str, path: str, block_size=100000):
+        '''
+        Copies a single-view storage (.bin with its label sidecar) into the view, no
+        embeddings are computed. The view keeps the M and ef_construction of the storage.
+        '''
+        source = Hnswlib(space='cosine', dim=self.dim)
+        source.load_index(path)
+        live = np.flatnonzero(source.labels.ids[:len(source.labels)] != b"")
+        if name not in self.views:
+            with self.lock:
+                self._create_view(name, max(len(live), 1), source.index.ef_construction, source.index.M)
+        for start in range(0, len(live), block_size):
+            labels = live[start:start + block_size]
+            self.add_items(name, source.get_items(labels), source.labels.translate(labels).tolist())
+
+    def _get_filters(self, allow_ids: Optional[StringList], deny_ids: Optional[StringList]):
+        allowed = None
+        if allow_ids is not None:
+            allowed = np.zeros(len(self.labels), dtype=bool)
+            allow_labels = self.labels.lookup(allow_ids)
+            allowed[allow_labels[allow_labels >= 0]] = True
+        denied = None
+        if deny_ids is not None:
+            denied = self.labels.lookup(deny_ids)
+            denied = denied[denied >= 0]
+        return allowed, denied
+
+    def get_k_nearest_batch(self, name: str, embeddings: VectorList, k: int, allow_ids: Optional[StringList] = None, deny_ids: Optional[StringList] = None) -> Tuple[NeighborIds, NeighborDistances]:
+        '''
+        Like VectorStorage.get_k_nearest_batch on the view.
+        '''
+        allowed, denied = self._get_filters(allow_ids, deny_ids)
+        return self.get_view(name).knn_query(embeddings, k, allowed=allowed, denied=denied)
+
+    def get_k_nearest_views(self, queries: Dict[str, VectorList], k: int, allow_ids: Optional[StringList] = None, deny_ids: Optional[StringList] = None) -> Dict[str, Tuple[NeighborIds, NeighborDistances]]:
+        '''
+        queries maps view names to their query embeddings (shape: N*dim). The views are loaded
+        and queried in parallel, returns the ids and distances per view.
+        '''
+        allowed, denied = self._get_filters(allow_ids, deny_ids)
+        def query(name):
+            return self.get_view(name).knn_query(queries[name], k, allowed=allowed, denied=denied)
+        with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            results = list(executor.map(query, queries))
+        return dict(zip(queries, results))
+
+    def save(self):
+        # views that were never loaded are unchanged on disk
+        os.makedirs(self.storage_location, exist_ok=True)
+        for name, view in self.views.items():
+            if view is not None:
+                view.save_index(self.get_view_path(name))
+        self.labels.save(f"{self.storage_location}/labels.npy")
+        with open(f"{self.storage_location}/manifest.json", "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "views": list(self.views)}, f)
+
+    def print_stats(self):
+        for name, view in self.views.items():
+            count = "not loaded" if view is None else view.get_current_count()
+            print(f"View {name}: {count}")
+        print(f"Articles: {self.get_current_count()}")
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description='Copy single-view vector storages into a multi-view storage')
+    p.add_argument('--target', required=True, help='Directory of the multi-view storage')
+    p.add_argument('--dim', default=768, type=int, help='Dimension of the embeddings')
+    p.add_argument('storages', nargs='+', help='Vector storages (.bin), the file names without .bin name the views')
+
+    args = p.parse_args()
+
+    mvs = MultiViewStorage(args.target, dim=args.dim)
+    for path in args.storages:
+        name = os.path.splitext(os.path.basename(path))[0]
+        print(f"Copying {path} into view {name}.")
+        mvs.add_view_from_storage(name, path)
+    mvs.save()
+    mvs.print_stats()
@@ -1,16 +1,16 @@
 import argparse
 import json
 import os
+import numpy as np
 from elasticsearch import Elasticsearch
 from tqdm import tqdm
 from ..parser import ParserNetzpolitik
-from ...vector_storage import VectorStorage
+from ...vector_server import open_storage
 from ...feature_extraction import FeatureExtraction
 from ...embedding.model import EmbeddingModel
-from ...typings import NearestNeighborList
 
 class CombinedRecallExperiment():
-    def __init__(self, es, parser, index, size, get_keywords_query_func, get_embedding_query_func, vector_storage_location, judgement_list_path):
+    def __init__(self, es, parser, index, size, get_keywords_query_func, get_embedding_query_func, vector_storage_location, judgement_list_path, vector_server=None):
         self.es = es
         self.parser = parser
         self.index = index
@@ -24,7 +24,7 @@ class CombinedRecallExperiment():
         self.recall_improvement_avg = 0.
 
         # load vector storage from file
-        self.vs = VectorStorage(vector_storage_location)
+        self.vs = open_storage(vector_storage_location, vector_server)
 
         with open(judgement_list_path, "r", encoding="utf-8") as f:
             for line in tqdm(f, total=7527):
@@ -54,9 +54,9 @@ class CombinedRecallExperiment():
                         ))["hits"]["hits"]
                         result_ids = [res["_id"] for res in k_results]
                     embedding_query = get_embedding_query_func(query_article_es)
-                    if embedding_query:
-                        nearest_n: NearestNeighborList = self.vs.get_k_nearest(embedding_query,size)
-                        e_results = [list(nn.keys())[0] for nn in nearest_n[0]]
+                    if embedding_query is not None:
+                        nearest_ids, _ = self.vs.get_k_nearest_batch(np.reshape(embedding_query, (1, -1)), size)
+                        e_results = nearest_ids[0].tolist()
                         for res in e_results:
                             if res not in result_ids:
                                 for ref in judgement["references"]:
@@ -107,6 +107,7 @@ if __name__ == "__main__":
     p.add_argument('--user', default=None, help='ElasticSearch user')
     p.add_argument('--secret', default=None, help="ElasticSearch secret")
     p.add_argument('--device', default="cpu", help="(CUDA) device for pytorch")
+    p.add_argument('--vector_server', default=None, help="Socket path of a running vector server (python -m NewsSearchEngine.vector_server) to query instead of loading the storages")
 
     args = p.parse_args()
 
@@ -173,7 +174,8 @@ if __name__ == "__main__":
             get_query_from_tf_idf_keywords,
             get_embedding_of_extracted_keywords_denorm_ordered,
             vs_extracted_k_denormalized_ordered,
-            judgement_list_path
+            judgement_list_path,
+            vector_server=args.vector_server
         )
         print("----------------------------------------------------------------")
         print("Run combined retrieval method using keyword matching and semantic search.")
@@ -1,15 +1,15 @@
 import argparse
 import json
 import os
+import numpy as np
 from elasticsearch import Elasticsearch
 from ..parser import ParserNetzpolitik
-from ...vector_storage import VectorStorage
+from ...vector_server import open_storage
 from ...feature_extraction import FeatureExtraction
 from ...embedding.model import EmbeddingModel
-from ...typings import NearestNeighborList
 
 class SemanticSearchExperiment():
-    def __init__(self, es, index, size, get_query_func, vector_storage_location, judgement_list_path):
+    def __init__(self, es, index, size, get_query_func, vector_storage_location, judgement_list_path, backend="hnsw", rerank=False, vector_server=None):
         self.es = es
         self.index = index
         self.count = 0
@@ -19,8 +19,10 @@ class SemanticSearchExperiment():
         self.max_recall = 0.
 
         # load vector storage from file
-        self.vs = VectorStorage(vector_storage_location, 20000)
+        self.vs = open_storage(vector_storage_location, vector_server, max_elements=20000, backend=backend, rerank=rerank)
 
+        queries = []
+        query_judgements = []
         with open(judgement_list_path, "r", encoding="utf-8") as f:
             for line in f:
                 judgement = json.loads(line)
@@ -30,29 +32,30 @@ class SemanticSearchExperiment():
                         id = judgement["id"]
                     )
                     query = get_query_func(query_article_es)
-                    if not query:
+                    if query is None:
                         continue
                     self.count += 1
-                    nearest_n: NearestNeighborList = self.vs.get_k_nearest(query,size)
-                    result_ids = [list(nn.keys())[0] for nn in nearest_n[0]]
-                    result_ids = list(set(result_ids))
-                    recall = 0.
-                    self.retrieval_count_avg += len(result_ids)
-                    for res_id in result_ids:
-                        if res_id == judgement["id"]:
-                            continue
-                        if res_id in judgement["references"]:
-                            recall += 1
-                    recall /= len(judgement["references"])
-                    self.recall_avg += recall
-                    if recall < self.min_recall:
-                        self.min_recall = recall
-                    if recall > self.max_recall:
-                        self.max_recall = recall
+                    queries.append(query)
+                    query_judgements.append(judgement)
                 except Exception as e:
                     print(e)
                     # query article not found
                     continue
+
+        # all topics in one knn query
+        if queries:
+            nearest_ids, _ = self.vs.get_k_nearest_batch(np.stack(queries), size)
+            for judgement, result_ids in zip(query_judgements, nearest_ids.tolist()):
+                result_ids = list(set(result_ids))
+                relevant_ids = set(judgement["references"])
+                self.retrieval_count_avg += len(result_ids)
+                recall = len([res_id for res_id in result_ids if res_id != judgement["id"] and res_id in relevant_ids])
+                recall /= len(judgement["references"])
+                self.recall_avg += recall
+                if recall < self.min_recall:
+                    self.min_recall = recall
+                if recall > self.max_recall:
+                    self.max_recall = recall
         self.recall_avg /= self.count
         self.retrieval_count_avg /= self.count
 
@@ -71,6 +74,11 @@ if __name__ == "__main__":
     p.add_argument('--user', default=None, help='ElasticSearch user')
     p.add_argument('--secret', default=None, help="ElasticSearch secret")
     p.add_argument('--device', default="cpu", help="(CUDA) device for pytorch")
+    p.add_argument('--cache', default=None, help="Directory of the persistent embedding cache")
+    p.add_argument('--quantize', action='store_true', help="Encode the queries with the dynamically int8 quantized model (CPU only), compare storages built with and without --quantize for the int8 recall")
+    p.add_argument('--backend', default="hnsw", choices=["hnsw", "exact"], help="Search the vector storages with HNSW or exactly")
+    p.add_argument('--rerank', action='store_true', help="Rerank over-fetched HNSW candidates by exact cosine against the float16 vector sidecar")
+    p.add_argument('--vector_server', default=None, help="Socket path of a running vector server (python -m NewsSearchEngine.vector_server) to query instead of loading the storages")
 
     args = p.parse_args()
 
@@ -92,7 +100,7 @@ if __name__ == "__main__":
         )
 
     parser = ParserNetzpolitik(es)
-    em = EmbeddingModel(lang="de", device=args.device)
+    em = EmbeddingModel(lang="de", device=args.device, cache_location=args.cache, quantize=args.quantize)
     fe = FeatureExtraction(em, parser)
     size = 100
     data_location = f"{os.path.abspath(os.path.join(__file__ , os.pardir, os.pardir, os.pardir))}/data"
@@ -150,7 +158,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_title,
         vs_title,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title")
@@ -166,7 +177,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_title_with_first_paragraph,
         vs_title,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title")
@@ -182,7 +196,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_title_with_section_titles,
         vs_title,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title")
@@ -198,7 +215,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_annotated_keywords,
         vs_title,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title")
@@ -214,7 +234,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_extracted_keywords_normalized,
         vs_title,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title")
@@ -230,7 +253,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_extracted_keywords_denormalized,
         vs_title,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title")
@@ -246,7 +272,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_extracted_keywords_denormalized_ordered,
         vs_title,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title")
@@ -262,7 +291,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_title_with_first_paragraph,
         vs_title_with_first_paragraph,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ first paragraph")
@@ -278,7 +310,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_title,
         vs_title_with_first_paragraph,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ first paragraph")
@@ -294,7 +329,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_title_with_section_titles,
         vs_title_with_first_paragraph,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ first paragraph")
@@ -310,7 +348,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_annotated_keywords,
         vs_title_with_first_paragraph,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ first paragraph")
@@ -326,7 +367,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_extracted_keywords_normalized,
         vs_title_with_first_paragraph,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ first paragraph")
@@ -342,7 +386,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_extracted_keywords_denormalized,
         vs_title_with_first_paragraph,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ first paragraph")
@@ -358,7 +405,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_extracted_keywords_denormalized_ordered,
         vs_title_with_first_paragraph,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ first paragraph")
@@ -374,7 +424,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_title_with_section_titles,
         vs_title_with_section_titles,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ section titles")
@@ -390,7 +443,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_title,
         vs_title_with_section_titles,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ section titles")
@@ -406,7 +462,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_title_with_first_paragraph,
         vs_title_with_section_titles,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ section titles")
@@ -422,7 +481,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_annotated_keywords,
         vs_title_with_section_titles,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ section titles")
@@ -438,7 +500,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_extracted_keywords_normalized,
         vs_title_with_section_titles,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ section titles")
@@ -454,7 +519,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_extracted_keywords_denormalized,
         vs_title_with_section_titles,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ section titles")
@@ -470,7 +538,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_extracted_keywords_denormalized_ordered,
         vs_title_with_section_titles,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ section titles")
@@ -488,7 +559,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_annotated_keywords,
         vs_annotated_k,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of pre-annotated keywords")
@@ -504,7 +578,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_title,
         vs_annotated_k,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of pre-annotated keywords")
@@ -520,7 +597,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_title_with_section_titles,
         vs_annotated_k,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of pre-annotated keywords")
@@ -536,7 +616,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_title_with_first_paragraph,
         vs_annotated_k,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of pre-annotated keywords")
@@ -552,7 +635,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_extracted_keywords_normalized,
         vs_annotated_k,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of pre-annotated keywords")
@@ -568,7 +654,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_extracted_keywords_denormalized,
         vs_annotated_k,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of pre-annotated keywords")
@@ -584,7 +673,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_extracted_keywords_denormalized_ordered,
         vs_annotated_k,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of pre-annotated keywords")
@@ -600,7 +692,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_extracted_keywords_normalized,
         vs_extracted_k_normalized,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (normalized)")
@@ -616,7 +711,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_title,
         vs_extracted_k_normalized,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (normalized)")
@@ -632,7 +730,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_title_with_first_paragraph,
         vs_extracted_k_normalized,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (normalized)")
@@ -648,7 +749,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_title_with_section_titles,
         vs_extracted_k_normalized,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (normalized)")
@@ -664,7 +768,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_annotated_keywords,
         vs_extracted_k_normalized,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (normalized)")
@@ -680,7 +787,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_extracted_keywords_denormalized,
         vs_extracted_k_normalized,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (normalized)")
@@ -696,7 +806,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_extracted_keywords_denormalized_ordered,
         vs_extracted_k_normalized,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (normalized)")
@@ -712,7 +825,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_extracted_keywords_denormalized,
         vs_extracted_k_denormalized,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized)")
@@ -728,7 +844,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_title,
         vs_extracted_k_denormalized,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized)")
@@ -744,7 +863,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_title_with_first_paragraph,
         vs_extracted_k_denormalized,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized)")
@@ -760,7 +882,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_title_with_section_titles,
         vs_extracted_k_denormalized,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized)")
@@ -776,7 +901,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_annotated_keywords,
         vs_extracted_k_denormalized,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized)")
@@ -792,7 +920,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_extracted_keywords_normalized,
         vs_extracted_k_denormalized,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized)")
@@ -808,7 +939,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_extracted_keywords_denormalized_ordered,
         vs_extracted_k_denormalized,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized)")
@@ -824,7 +958,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_extracted_keywords_denormalized_ordered,
         vs_extracted_k_denormalized_ordered,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized, order preserved)")
@@ -840,7 +977,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_title,
         vs_extracted_k_denormalized_ordered,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized, order preserved)")
@@ -856,7 +996,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_title_with_first_paragraph,
         vs_extracted_k_denormalized_ordered,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized, order preserved)")
@@ -872,7 +1015,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_title_with_section_titles,
         vs_extracted_k_denormalized_ordered,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized, order preserved)")
@@ -888,7 +1034,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_annotated_keywords,
         vs_extracted_k_denormalized_ordered,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized, order preserved)")
@@ -904,7 +1053,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_extracted_keywords_normalized,
         vs_extracted_k_denormalized_ordered,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized, order preserved)")
@@ -920,7 +1072,10 @@ if __name__ == "__main__":
         size,
         get_embedding_of_extracted_keywords_denormalized,
         vs_extracted_k_denormalized_ordered,
-        judgement_list_path
+        judgement_list_path,
+        backend=args.backend,
+        rerank=args.rerank,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized, order preserved)")
@@ -15,6 +15,19 @@ if __name__ == "__main__":
     p.add_argument('--user', default=None, help='ElasticSearch user')
     p.add_argument('--secret', default=None, help="ElasticSearch secret")
     p.add_argument('--device', default="cpu", help="(CUDA) device for pytorch")
+    p.add_argument('--cache', default=None, help="Directory of the persistent embedding cache")
+    p.add_argument('--quantize', action='store_true', help="Encode with the dynamically int8 quantized model (CPU only)")
+    p.add_argument('--backend', default="torch", choices=["torch", "onnx"], help="Inference backend of the encoder")
+    p.add_argument('--onnx_threads', default=0, type=int, help="Intra-op threads of ONNX Runtime, 0 uses all cores")
+    p.add_argument('--workers', default=0, type=int, help="Number of encoding processes, 0 encodes in the main process")
+    p.add_argument('--threads_per_worker', default=1, type=int, help="Torch threads per encoding process")
+    p.add_argument('--pipelined', action='store_true', help="Overlap parsing, encoding and insertion")
+    p.add_argument('--parse_workers', default=4, type=int, help="Parsing threads of the pipelined ingest")
+    p.add_argument('--insert_threads', default=0, type=int, help="hnswlib threads for insertion, 0 uses all cores")
+    p.add_argument('--vector_sidecar', action='store_true', help="Also save the vectors as memory-mapped float16 matrix (<storage>.f16.npy)")
+    p.add_argument('--archive_embeddings', action='store_true', help="Also archive the embeddings with their ids (<storage>.emb) to rebuild the storages without encoding")
+    p.add_argument('--checkpoint_every', default=0, type=int, help="Save a checkpoint after this many added articles, 0 saves only at the end")
+    p.add_argument('--resume', action='store_true', help="Continue the storages from their last checkpoint")
 
     args = p.parse_args()
 
@@ -37,10 +50,15 @@ if __name__ == "__main__":
 
     parser = ParserNetzpolitik(es)
     lang = "de"
-    em = EmbeddingModel(lang, device=args.device)
+    em = EmbeddingModel(lang, device=args.device, cache_location=args.cache, num_workers=args.workers, threads_per_worker=args.threads_per_worker, quantize=args.quantize, backend=args.backend, onnx_threads=args.onnx_threads)
     fe = FeatureExtraction(em, parser)
+    ingest_kwargs = {"pipelined": args.pipelined, "checkpoint_every": args.checkpoint_every, "resume": args.resume}
+    if args.pipelined:
+        ingest_kwargs.update(parse_workers=args.parse_workers, insert_threads=args.insert_threads)
+    storage_kwargs = {"vector_sidecar": args.vector_sidecar, "archive_embeddings": args.archive_embeddings}
     data_location = f"{os.path.abspath(os.path.join(__file__ , os.pardir, os.pardir))}/data"
     articles_path = f"{data_location}/netzpolitik.jsonl"
+    # initial capacity, the storages grow if the collection is larger
     num_elements = 20000
 
     def get_article_id(raw):
@@ -62,55 +80,58 @@ if __name__ == "__main__":
         return res
 
     print("Initialize netzpolitik vector storage of embeddings of title.\n")
-    def embedding_func_title(raw):
-        return fe.get_embedding_of_title(raw)
-    VectorStorage(f"{data_location}/netzpolitik_vs_title.bin", num_elements) \
-        .add_items_from_file(articles_path, embedding_func_title, get_article_id)
+    def text_func_title(raw):
+        return fe.get_text_of_title(raw)
+    VectorStorage(f"{data_location}/netzpolitik_vs_title.bin", num_elements, shrink_to_fit=True, **storage_kwargs) \
+        .add_items_from_file(articles_path, text_func_title, get_article_id, em, **ingest_kwargs)
 
     print("Initialize netzpolitik vector storage of embeddings of title and section titles.\n")
-    def embedding_func_title_with_section_titles(raw):
-        return fe.get_embedding_of_title_with_section_titles(raw)
-    VectorStorage(f"{data_location}/netzpolitik_vs_title_with_section_titles.bin", num_elements) \
-        .add_items_from_file(articles_path, embedding_func_title_with_section_titles, get_article_id)
+    def text_func_title_with_section_titles(raw):
+        return fe.get_text_of_title_with_section_titles(raw)
+    VectorStorage(f"{data_location}/netzpolitik_vs_title_with_section_titles.bin", num_elements, shrink_to_fit=True, **storage_kwargs) \
+        .add_items_from_file(articles_path, text_func_title_with_section_titles, get_article_id, em, **ingest_kwargs)
 
     print("Initialize netzpolitik vector storage of embeddings of title with first paragraph.\n")
-    def embedding_func_title_with_first_paragraph(raw):
-        return fe.get_embedding_of_title_with_first_paragraph(raw)
-    VectorStorage(f"{data_location}/netzpolitik_vs_title_with_first_paragraph.bin", num_elements) \
-        .add_items_from_file(articles_path, embedding_func_title_with_first_paragraph, get_article_id)
+    def text_func_title_with_first_paragraph(raw):
+        return fe.get_text_of_title_with_first_paragraph(raw)
+    VectorStorage(f"{data_location}/netzpolitik_vs_title_with_first_paragraph.bin", num_elements, shrink_to_fit=True, **storage_kwargs) \
+        .add_items_from_file(articles_path, text_func_title_with_first_paragraph, get_article_id, em, **ingest_kwargs)
 
     print("Initialize netzpolitik vector storage of embeddings of pre-annotated keywords.\n")
-    def embedding_func_annotated_keywords(raw):
-        return fe.get_embedding_of_keywords(raw["keywords"])
-    VectorStorage(f"{data_location}/netzpolitik_vs_annotated_k.bin", num_elements) \
-        .add_items_from_file(articles_path, embedding_func_annotated_keywords, get_article_id)
+    def text_func_annotated_keywords(raw):
+        return fe.get_text_of_keywords(raw["keywords"])
+    VectorStorage(f"{data_location}/netzpolitik_vs_annotated_k.bin", num_elements, shrink_to_fit=True, **storage_kwargs) \
+        .add_items_from_file(articles_path, text_func_annotated_keywords, get_article_id, em, **ingest_kwargs)
 
     print("Initialize netzpolitik vector storage of embeddings of extracted tf-idf keywords (normalized, unordered).\n")
-    def embedding_func_tf_idf_keywords(raw):
+    def text_func_tf_idf_keywords(raw):
         article_id = get_article_id(raw)
         if not article_id:
             return None
         keyw = parser.get_keywords_tf_idf(args.index_name, article_id)
-        return fe.get_embedding_of_keywords(keyw)
-    VectorStorage(f"{data_location}/netzpolitik_vs_extracted_k_normalized.bin", num_elements) \
-        .add_items_from_file(articles_path, embedding_func_tf_idf_keywords, get_article_id)
+        return fe.get_text_of_keywords(keyw)
+    VectorStorage(f"{data_location}/netzpolitik_vs_extracted_k_normalized.bin", num_elements, shrink_to_fit=True, **storage_kwargs) \
+        .add_items_from_file(articles_path, text_func_tf_idf_keywords, get_article_id, em, **ingest_kwargs)
 
     print("Initialize netzpolitik vector storage of embeddings of extracted tf-idf keywords (denormalized, unordered).\n")
-    def embedding_func_tf_idf_keywords_denormalized(raw):
+    def text_func_tf_idf_keywords_denormalized(raw):
         article_id = get_article_id(raw)
         if not article_id:
             return None
         keyw = parser.get_keywords_tf_idf_denormalized(args.index_name, article_id, raw["title"], raw["body"], keep_order=False)
-        return fe.get_embedding_of_keywords(keyw)
-    VectorStorage(f"{data_location}/netzpolitik_vs_extracted_k_denormalized.bin", num_elements) \
-        .add_items_from_file(articles_path, embedding_func_tf_idf_keywords_denormalized, get_article_id)
+        return fe.get_text_of_keywords(keyw)
+    VectorStorage(f"{data_location}/netzpolitik_vs_extracted_k_denormalized.bin", num_elements, shrink_to_fit=True, **storage_kwargs) \
+        .add_items_from_file(articles_path, text_func_tf_idf_keywords_denormalized, get_article_id, em, **ingest_kwargs)
 
     print("Initialize netzpolitik vector storage of embeddings of extracted tf-idf keywords (denormalized, order preserved).\n")
-    def embedding_func_tf_idf_keywords_denormalized_ordered(raw):
+    def text_func_tf_idf_keywords_denormalized_ordered(raw):
         article_id = get_article_id(raw)
         if not article_id:
             return None
         keyw = parser.get_keywords_tf_idf_denormalized(args.index_name, article_id, raw["title"], raw["body"], keep_order=True)
-        return fe.get_embedding_of_keywords(keyw)
-    VectorStorage(f"{data_location}/netzpolitik_vs_extracted_k_denormalized_ordered.bin", num_elements) \
-        .add_items_from_file(articles_path, embedding_func_tf_idf_keywords_denormalized_ordered, get_article_id)
\ No newline at end of file
+        return fe.get_text_of_keywords(keyw)
+    VectorStorage(f"{data_location}/netzpolitik_vs_extracted_k_denormalized_ordered.bin", num_elements, shrink_to_fit=True, **storage_kwargs) \
+        .add_items_from_file(articles_path, text_func_tf_idf_keywords_denormalized_ordered, get_article_id, em, **ingest_kwargs)
+
+    em.print_stats()
+    em.close()
@@ -8,7 +8,9 @@ import pathlib
 
 
 if __name__ == "__main__":
-    fe = FeatureExtraction(EmbeddingModel(), ParserNetzpolitik())
+    # the model is only loaded once the first text is encoded
+    em = EmbeddingModel("de")
+    fe = FeatureExtraction(em, ParserNetzpolitik())
     pp = pprint.PrettyPrinter(indent=4)
     storage_location = f"{pathlib.Path(__file__).parent.absolute()}/data/storage.bin"
     if os.path.isfile(storage_location):
@@ -16,13 +18,12 @@ if __name__ == "__main__":
         vs = VectorStorage(storage_location)
     else:
         print("Initialize vector storage.\n")
-        vs = VectorStorage()
+        vs = VectorStorage(storage_location, 20000)
         print("Add items from file...\n")
-        vs.add_items_from_file(f"{pathlib.Path(__file__).parent.absolute()}/data/netzpolitik.jsonl", fe.get_embedding_of_title_with_first_paragraph)
-        vs.save(storage_location)
+        vs.add_items_from_file(f"{pathlib.Path(__file__).parent.absolute()}/data/netzpolitik.jsonl", fe.get_text_of_title_with_first_paragraph, lambda raw: raw["url"], em)
     while True:
         data = input("Get news based on your text: \n")
-        recs = vs.get_k_nearest(data, 5)
+        recs = vs.get_k_nearest(em.encode(data), 5)
         print("-----------------------------------------")
         print("Your recommendations: \n")
         for rec in recs:
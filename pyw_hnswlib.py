@@ -1,16 +1,23 @@
 # Wrapper class around hnswlib
 import hnswlib
+import os
 import numpy as np
 import threading
-import pickle
+from .label_table import LabelTable
 from .typings import VectorList
 
 class Hnswlib():
-    def __init__(self, space, dim):
+    # growth_factor: the capacity is multiplied by it whenever an add would exceed it, None disables growing
+    # labels: a label table shared with other indexes, it is then saved and loaded by its owner
+    def __init__(self, space, dim, growth_factor=2., labels=None):
         self.index = hnswlib.Index(space, dim)
         self.lock = threading.Lock()
-        self.dict_labels = {}
-        self.cur_ind = 0
+        self.shared_labels = labels is not None
+        self.labels = labels if labels is not None else LabelTable()
+        self.growth_factor = growth_factor
+        self.space = space
+        self.dim = dim
+        self.ef = 10
 
     def init_index(self, max_elements: int, ef_construction = 200, M = 16):
         self.index.init_index(max_elements = max_elements, ef_construction = ef_construction, M = M)
@@ -19,51 +26,144 @@ class Hnswlib():
         return self.index.get_max_elements()
 
     def get_current_count(self):
+        # includes the elements marked as deleted
         return self.index.get_current_count()
 
+    def get_deleted_count(self):
+        return len(self.labels.free_labels)
+
+    def resize_index(self, new_size: int):
+        with self.lock:
+            self.index.resize_index(new_size)
+
+    def _reserve(self, num_added: int):
+        required = self.index.get_current_count() + num_added
+        capacity = self.index.get_max_elements()
+        if required <= capacity or self.growth_factor is None:
+            return
+        while capacity < required:
+            capacity = max(int(capacity * self.growth_factor), capacity + 1)
+        self.index.resize_index(capacity)
+
     def add_items(self, data: VectorList, ids=None):
+        # no copy for C-contiguous float32 input, which hnswlib reads directly
+        data = np.ascontiguousarray(data, dtype=np.float32)
         if ids is not None:
             assert len(data) == len(ids)
         num_added = len(data)
+        # hnswlib can not resize while adding, so adds are serialized; each add is multi-threaded
         with self.lock:
-            start = self.cur_ind
-            self.cur_ind += num_added
-        int_labels = []
+            self._reserve(num_added)
+            if ids is not None:
+                start = self.labels.append(ids)
+            else:
+                start = len(self.labels)
+                self.labels.append([str(label) for label in range(start, start + num_added)])
+            int_labels = np.arange(start, start + num_added)
+            self.index.add_items(data=data, ids=int_labels)
 
-        if ids is not None:
-            for dl in ids:
-                int_labels.append(start)
-                self.dict_labels[start] = dl
-                start += 1
-        else:
-            for _ in range(len(data)):
-                int_labels.append(start)
-                self.dict_labels[start] = start
-                start += 1
-        self.index.add_items(data=data, ids=np.asarray(int_labels))
+    def add_labeled_items(self, data: VectorList, labels):
+        '''
+        Adds the data under labels taken from the label table, e.g. the shared table of several
+        indexes. Vectors of labels already in the index are replaced.
+        '''
+        data = np.ascontiguousarray(data, dtype=np.float32)
+        assert len(data) == len(labels)
+        with self.lock:
+            self._reserve(len(labels))
+            self.index.add_items(data=data, ids=np.asarray(labels))
+
+    def upsert_items(self, data: VectorList, ids):
+        '''
+        Replaces the vectors of known ids and adds the others, reusing the labels of deleted
+        elements first. Ids must be unique.
+        '''
+        data = np.ascontiguousarray(data, dtype=np.float32)
+        assert len(data) == len(ids)
+        with self.lock:
+            labels = self.labels.assign(ids)
+            self._reserve(max(0, int(labels.max(initial=-1)) + 1 - self.index.get_current_count()))
+            # hnswlib updates existing labels in place and unmarks deleted ones
+            self.index.add_items(data=data, ids=labels)
+
+    def remove_items(self, ids) -> int:
+        # marks the elements as deleted, returns how many of the ids were found
+        with self.lock:
+            labels = self.labels.lookup(ids)
+            labels = np.unique(labels[labels >= 0]).tolist()
+            for label in labels:
+                self.index.mark_deleted(label)
+            self.labels.release(labels)
+        return len(labels)
+
+    def compact(self, block_size=16384):
+        '''
+        Rebuilds the index from the elements that are not deleted, which drops all tombstones.
+        No embeddings are computed, the stored vectors are reinserted block by block.
+        '''
+        if self.shared_labels:
+            raise RuntimeError("an index with a shared label table can not be compacted.")
+        with self.lock:
+            live = np.flatnonzero(self.labels.ids[:len(self.labels)] != b"")
+            ids = self.labels.translate(live).tolist()
+            index = hnswlib.Index(self.space, self.dim)
+            index.init_index(max_elements=max(len(live), 1), ef_construction=self.index.ef_construction, M=self.index.M)
+            index.set_ef(self.ef)
+            for start in range(0, len(live), block_size):
+                block = live[start:start + block_size]
+                index.add_items(data=self.get_items(block), ids=np.arange(start, start + len(block)))
+            self.index = index
+            self.labels = LabelTable(capacity=len(live))
+            self.labels.append(ids)
+
+    def get_items(self, labels) -> VectorList:
+        # the stored vectors, normalized in the cosine space; deleted labels can not be read
+        labels = np.asarray(labels)
+        return np.array(self.index.get_items(labels), dtype=np.float32).reshape(len(labels), self.dim)
 
     def set_ef(self, ef: int):
+        self.ef = ef
         self.index.set_ef(ef)
 
     def load_index(self, path: str, max_elements=0):
         self.index.load_index(path, max_elements=max_elements)
-        with open(path + ".pkl", "rb") as f:
-            self.cur_ind, self.dict_labels = pickle.load(f)
+        if not self.shared_labels:
+            self.labels = LabelTable.load_for_index(path)
 
     def save_index(self, path: str):
-        self.index.save_index(path)
-        with open(path + ".pkl", "wb") as f:
-            pickle.dump((self.cur_ind, self.dict_labels), f)
+        # written next to the path and renamed, a crash while saving keeps the previous index
+        self.index.save_index(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        if not self.shared_labels:
+            self.labels.save(LabelTable.sidecar_path(path))
 
     def set_num_threads(self, num_threads:int):
         self.index.set_num_threads(num_threads)
 
-    def knn_query(self, data: VectorList, k=1):
-        labels_int, distances = self.index.knn_query(data=data, k=k)
-        labels = []
-        for li in labels_int:
-            line = []
-            for l in li:
-                line.append(self.dict_labels[l])
-            labels.append(line)
-        return labels, distances
+    @staticmethod
+    def get_filter(allowed=None, denied=None):
+        # allowed is a bitmap over the labels, denied an array of labels
+        if allowed is not None:
+            if denied is not None:
+                allowed = allowed.copy()
+                allowed[denied] = False
+            return allowed.tolist().__getitem__
+        if denied is not None and len(denied) != 0:
+            denied = set(denied.tolist())
+            return lambda label: label not in denied
+        return None
+
+    def knn_query_labels(self, data: VectorList, k=1, allowed=None, denied=None):
+        '''
+        Only labels set in the allowed bitmap and not in denied are returned. The filter is
+        evaluated during the graph search, so k results come back if enough labels pass it.
+        '''
+        data = np.ascontiguousarray(data, dtype=np.float32)
+        label_filter = Hnswlib.get_filter(allowed, denied)
+        if label_filter is None:
+            return self.index.knn_query(data=data, k=k)
+        return self.index.knn_query(data=data, k=k, filter=label_filter)
+
+    def knn_query(self, data: VectorList, k=1, allowed=None, denied=None):
+        labels_int, distances = self.knn_query_labels(data, k, allowed=allowed, denied=denied)
+        return self.labels.translate(labels_int), distances
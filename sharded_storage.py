@@ -0,0 +1,227 @@
+import json
+import os
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from .label_table import IdFilter, LabelTable
+from .pyw_hnswlib import Hnswlib
+from .typings import VectorList, StringList, NeighborIds, NeighborDistances
+
+class ShardedVectorStorage():
+    '''
+    Vector storage partitioned by publication date, with one HNSW index per year or month.
+    The shards share one label table and keep the date and shard of every label, so that a
+    query is only routed to shards with articles published before the query date: older
+    shards are searched as they are, the shard of the query date for k * date_factor
+    neighbors of which the older ones are kept, again with a larger k for queries left with
+    fewer than k. The shards are searched in parallel threads and their results are merged
+    to the top k.
+
+    Dates are anything numpy converts to datetime64, e.g. datetime objects, ISO strings or
+    np.array(wapo_dates, dtype="datetime64[ms]") for the millisecond timestamps of WAPO.
+    '''
+    def __init__(
+        self,
+        storage_location,
+        partition = "year",
+        dim = 768,
+        ef_construction = 200,
+        m = 100,
+        ef = 150,
+        max_elements_per_shard = 1024,
+        num_threads = None,
+        date_factor = 4
+    ):
+        if partition not in ["year", "month"]:
+            raise ValueError(f"partition: {partition} not supported.")
+        self.storage_location = storage_location
+        self.dim = dim
+        self.ef_construction = ef_construction
+        self.m = m
+        self.ef = ef
+        self.max_elements_per_shard = max_elements_per_shard
+        self.num_threads = num_threads
+        self.date_factor = date_factor
+        self.lock = threading.Lock()
+
+        self.keys = []
+        self.shards = []
+        self.labels = LabelTable()
+        # per label: publication date and index of its shard in self.keys
+        self.dates = np.empty(0, dtype="datetime64[s]")
+        self.label_shards = np.empty(0, dtype=np.int32)
+        # named sets of ids to deny in queries, see register_filter
+        self.filters = {}
+
+        manifest_path = f"{storage_location}/manifest.json"
+        if os.path.isfile(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            partition = manifest["partition"]
+            self.dim = manifest["dim"]
+            self.labels = LabelTable.load(f"{storage_location}/labels.npy")
+            self.dates = np.load(f"{storage_location}/dates.npy").astype("datetime64[s]")
+            self.label_shards = np.load(f"{storage_location}/label_shards.npy")
+            for key in manifest["shards"]:
+                shard = Hnswlib(space='cosine', dim=self.dim, labels=self.labels)
+                shard.load_index(self.get_shard_path(key))
+                shard.set_ef(ef)
+                self.keys.append(key)
+                self.shards.append(shard)
+        self.partition = partition
+        self.unit = "Y" if partition == "year" else "M"
+
+    def get_shard_path(self, key: str) -> str:
+        return f"{self.storage_location}/{key}.bin"
+
+    def get_current_count(self):
+        return len(self.labels)
+
+    def get_shard_counts(self):
+        return {key: shard.get_current_count() for key, shard in zip(self.keys, self.shards)}
+
+    def _get_shard(self, key: str) -> int:
+        if key not in self.keys:
+            shard = Hnswlib(space='cosine', dim=self.dim, labels=self.labels)
+            shard.init_index(max_elements=self.max_elements_per_shard, ef_construction=self.ef_construction, M=self.m)
+            shard.set_ef(self.ef)
+            self.keys.append(key)
+            self.shards.append(shard)
+        return self.keys.index(key)
+
+    def _set_label_dates(self, start: int, dates: np.ndarray, shard_index: int):
+        end = start + len(dates)
+        if end > len(self.dates):
+            capacity = max(end, 2 * len(self.dates), 1024)
+            self.dates = np.resize(self.dates, capacity)
+            self.label_shards = np.resize(self.label_shards, capacity)
+        self.dates[start:end] = dates
+        self.label_shards[start:end] = shard_index
+
+    def add_items(self, embeddings: VectorList, ids: StringList, dates):
+        dates = np.array(dates, dtype="datetime64[s]")
+        assert len(embeddings) == len(ids) == len(dates)
+        keys = dates.astype(f"datetime64[{self.unit}]")
+        with self.lock:
+            for key in np.unique(keys):
+                rows = np.flatnonzero(keys == key)
+                shard_index = self._get_shard(str(key))
+                start = len(self.labels)
+                self.shards[shard_index].add_items(embeddings[rows], [ids[i] for i in rows])
+                self._set_label_dates(start, dates[rows], shard_index)
+
+    def _route(self, query_dates: np.ndarray):
+        # (shard, query rows, their dates if the shard needs a date filter) for every shard a batch of queries needs
+        tasks = []
+        for shard_index, key in enumerate(self.keys):
+            start = np.datetime64(key).astype("datetime64[s]")
+            end = (np.datetime64(key) + 1).astype("datetime64[s]")
+            older = np.flatnonzero(query_dates >= end)
+            if len(older) != 0:
+                tasks.append((shard_index, older, None))
+            within = np.flatnonzero((query_dates > start) & (query_dates < end))
+            if len(within) != 0:
+                tasks.append((shard_index, within, query_dates[within]))
+        return tasks
+
+    def _search(self, embeddings: VectorList, k: int, shard_index: int, rows: np.ndarray, before: Optional[np.ndarray], denied):
+        # the ids and distances of every row, the rows may get fewer than k results
+        shard_labels = np.flatnonzero(self.label_shards[:len(self.labels)] == shard_index)
+        if denied is not None:
+            shard_labels = np.setdiff1d(shard_labels, denied)
+        if before is None:
+            shard_k = min(k, len(shard_labels))
+            if shard_k == 0:
+                return [], [], []
+            labels, distances = self.shards[shard_index].knn_query_labels(embeddings[rows], shard_k, denied=denied)
+            return rows.tolist(), list(labels), list(distances)
+        # the number of older articles in the shard per row, rows without any are not searched
+        available = np.searchsorted(np.sort(self.dates[shard_labels]), before)
+        pending = np.flatnonzero(available > 0)
+        found = {}
+        query_k = min(len(shard_labels), self.date_factor * k)
+        while len(pending) != 0:
+            # all pending rows in one call, the date cutoff is applied to the results
+            labels, distances = self.shards[shard_index].knn_query_labels(embeddings[rows[pending]], query_k, denied=denied)
+            older = self.dates[labels] < before[pending, np.newaxis]
+            done = (older.sum(axis=1) >= np.minimum(k, available[pending])) | (query_k == len(shard_labels))
+            for i in np.flatnonzero(done):
+                found[pending[i]] = (labels[i][older[i]][:k], distances[i][older[i]][:k])
+            pending = pending[~done]
+            query_k = min(len(shard_labels), max(query_k * self.date_factor, query_k + k))
+        positions = sorted(found)
+        return [rows[i] for i in positions], [found[i][0] for i in positions], [found[i][1] for i in positions]
+
+    def get_vectors(self, article_ids: StringList) -> Tuple[VectorList, List[int]]:
+        # see VectorStorage.get_vectors
+        labels = self.labels.lookup(article_ids)
+        vectors = np.zeros((len(labels), self.dim), dtype=np.float32)
+        shard_of_row = np.where(labels >= 0, self.label_shards[np.maximum(labels, 0)], -1)
+        for shard_index in np.unique(shard_of_row[shard_of_row >= 0]):
+            rows = np.flatnonzero(shard_of_row == shard_index)
+            vectors[rows] = self.shards[shard_index].get_items(labels[rows])
+        return vectors, np.flatnonzero(labels < 0).tolist()
+
+    def register_filter(self, name: str, deny_ids: StringList):
+        # ids that queries passing deny_filter=name never return, see VectorStorage.register_filter
+        self.filters[name] = IdFilter(deny_ids)
+
+    def get_k_nearest_batch(self, embeddings: VectorList, k: int, dates, deny_ids: Optional[StringList] = None, deny_filter: Optional[str] = None) -> Tuple[NeighborIds, NeighborDistances]:
+        '''
+        embeddings (shape: N*dim) with the publication date of every query. Returns the ids and
+        cosine distances of the k nearest articles published before the query date (both
+        shape: N*k), nearest first. Rows with fewer than k older articles are padded with
+        empty ids and infinite distances. deny_ids and the ids of the registered deny_filter
+        are never returned.
+        '''
+        embeddings = np.ascontiguousarray(np.reshape(embeddings, (-1, self.dim)), dtype=np.float32)
+        query_dates = np.array(dates, dtype="datetime64[s]").reshape(-1)
+        assert len(query_dates) == len(embeddings)
+        denied = None
+        if deny_ids is not None:
+            denied = self.labels.lookup(deny_ids)
+            denied = denied[denied >= 0]
+        if deny_filter is not None:
+            filter_labels = self.filters[deny_filter].get_labels(self.labels)
+            denied = filter_labels if denied is None else np.union1d(filter_labels, denied)
+
+        tasks = self._route(query_dates)
+        with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            results = list(executor.map(lambda task: self._search(embeddings, k, *task, denied), tasks))
+
+        candidate_labels = [[] for _ in range(len(embeddings))]
+        candidate_distances = [[] for _ in range(len(embeddings))]
+        for rows, labels, distances in results:
+            for row, row_labels, row_distances in zip(rows, labels, distances):
+                candidate_labels[row].append(row_labels)
+                candidate_distances[row].append(row_distances)
+        nearest_labels = np.full((len(embeddings), k), -1, dtype=np.int64)
+        nearest_distances = np.full((len(embeddings), k), np.inf, dtype=np.float32)
+        for row in range(len(embeddings)):
+            if not candidate_labels[row]:
+                continue
+            labels = np.concatenate(candidate_labels[row])
+            distances = np.concatenate(candidate_distances[row])
+            top = np.argsort(distances, kind="stable")[:k]
+            nearest_labels[row, :len(top)] = labels[top]
+            nearest_distances[row, :len(top)] = distances[top]
+        ids = self.labels.translate(np.maximum(nearest_labels, 0))
+        ids[nearest_labels < 0] = ""
+        return ids, nearest_distances
+
+    def save(self):
+        os.makedirs(self.storage_location, exist_ok=True)
+        for key, shard in zip(self.keys, self.shards):
+            shard.save_index(self.get_shard_path(key))
+        count = len(self.labels)
+        self.labels.save(f"{self.storage_location}/labels.npy")
+        np.save(f"{self.storage_location}/dates.npy", self.dates[:count])
+        np.save(f"{self.storage_location}/label_shards.npy", self.label_shards[:count])
+        with open(f"{self.storage_location}/manifest.json", "w", encoding="utf-8") as f:
+            json.dump({"partition": self.partition, "dim": self.dim, "shards": self.keys}, f)
+
+    def print_stats(self):
+        for key, count in self.get_shard_counts().items():
+            print(f"Shard {key}: {count}")
+        print(f"Total: {self.get_current_count()}")
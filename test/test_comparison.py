@@ -0,0 +1,33 @@
+import numpy as np
+from ..embedding.comparison import compare_embeddings
+
+class FakeModel():
+    # fixed embeddings per text, optionally with noise
+    def __init__(self, embeddings, noise=0., seed=0):
+        self.embeddings = embeddings
+        self.noise = noise
+        self.random = np.random.RandomState(seed)
+
+    def encode_batch(self, texts, batch_size=32):
+        embeddings = np.array([self.embeddings[int(text)] for text in texts], dtype=np.float32)
+        return embeddings + self.noise * self.random.randn(*embeddings.shape).astype(np.float32), []
+
+class TestCompareEmbeddings():
+    @classmethod
+    def setup_class(self):
+        self.embeddings = np.random.RandomState(0).randn(200, 16).astype(np.float32)
+        self.texts = [str(i) for i in range(200)]
+
+    def test_identical_models(self):
+        stats = compare_embeddings(FakeModel(self.embeddings), FakeModel(self.embeddings), self.texts, k=5)
+        assert stats["k"] == 5
+        assert stats["recall_at_k"] == 1.
+        assert abs(stats["mean_cosine_similarity"] - 1.) < 1e-6
+        assert stats["max_abs_difference"] == 0.
+
+    def test_recall_drops_with_noise(self):
+        slightly = compare_embeddings(FakeModel(self.embeddings), FakeModel(self.embeddings, noise=0.05), self.texts, k=5)
+        strongly = compare_embeddings(FakeModel(self.embeddings), FakeModel(self.embeddings, noise=2.), self.texts, k=5)
+        assert 0.8 < slightly["recall_at_k"] <= 1.
+        assert strongly["recall_at_k"] < slightly["recall_at_k"]
+        assert strongly["mean_cosine_similarity"] < slightly["mean_cosine_similarity"]
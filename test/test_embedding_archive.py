@@ -0,0 +1,69 @@
+import tempfile
+import numpy as np
+from ..embedding_archive import EmbeddingArchive, rebuild
+from ..vector_storage import VectorStorage
+
+class TestEmbeddingArchive():
+    @classmethod
+    def setup_class(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data = np.random.RandomState(0).rand(300, 8).astype(np.float32) - 0.5
+        self.ids = [f"id{i}" for i in range(300)]
+
+    @classmethod
+    def teardown_class(self):
+        self.tmp_dir.cleanup()
+
+    def test_append_flush_reopen(self):
+        path = f"{self.tmp_dir.name}/archive.emb"
+        archive = EmbeddingArchive(path, 8)
+        archive.append(self.data[:100], self.ids[:100])
+        archive.flush()
+        # not flushed, dropped when the archive is opened again
+        archive.append(self.data[100:150], self.ids[100:150])
+
+        reopened = EmbeddingArchive(path, 8)
+        assert reopened.count == 100
+        reopened.append(self.data[100:200], self.ids[100:200])
+        reopened.truncate(150)
+        reopened.flush()
+        embeddings, ids = EmbeddingArchive.load(path)
+        assert isinstance(embeddings, np.memmap)
+        assert np.array_equal(embeddings, self.data[:150])
+        assert ids.tolist() == self.ids[:150]
+
+    def test_rebuild_from_storage_build(self):
+        path = f"{self.tmp_dir.name}/built.bin"
+        vs = VectorStorage(path, 10, dim=8, ef_construction=50, m=8, archive_embeddings=True)
+        vs.upsert_batch(self.ids, self.data)
+        # the later embedding of id0 replaces the first one
+        vs.upsert("id0", self.data[299])
+        vs.save()
+
+        target = f"{self.tmp_dir.name}/rebuilt.bin"
+        index = rebuild(f"{path}.emb", target, m=4, ef_construction=50, num_threads=2, block_size=64)
+        assert index.get_current_count() == 300
+        assert index.index.M == 4
+        rebuilt = VectorStorage(target, dim=8, ef=50)
+        ids, _ = rebuilt.get_k_nearest_batch(self.data[[5, 150]], 1)
+        assert ids.tolist() == [["id5"], ["id150"]]
+        vectors, _ = rebuilt.get_vectors(["id0"])
+        assert np.allclose(vectors[0], self.data[299] / np.linalg.norm(self.data[299]), atol=1e-6)
+
+    def test_rebuild_leaves_removed_out(self):
+        path = f"{self.tmp_dir.name}/removed.bin"
+        vs = VectorStorage(path, 10, dim=8, ef_construction=50, m=8, archive_embeddings=True)
+        vs.upsert_batch(self.ids[:20], self.data[:20])
+        assert vs.remove_batch(["id3", "id4", "unknown"]) == 2
+        # added again after its removal
+        vs.upsert("id4", self.data[4])
+        vs.save()
+
+        target = f"{self.tmp_dir.name}/removed_rebuilt.bin"
+        index = rebuild(f"{path}.emb", target, m=4, ef_construction=50)
+        assert index.get_current_count() == 19
+        rebuilt = VectorStorage(target, dim=8, ef=50)
+        ids, _ = rebuilt.get_k_nearest_batch(self.data[:20], 19)
+        assert "id3" not in set(ids.ravel().tolist())
+        _, missing = rebuilt.get_vectors(["id3", "id4"])
+        assert missing == [0]
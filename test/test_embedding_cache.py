@@ -0,0 +1,83 @@
+import os
+import tempfile
+import numpy as np
+from ..embedding.cache import EmbeddingCache
+
+class TestEmbeddingCache():
+    @classmethod
+    def setup_class(self):
+        self.dim = 4
+        self.texts = ["Technik", "technology", "Computer"]
+        self.embeddings = np.arange(12, dtype=np.float32).reshape(3, 4)
+
+    def test_lookup_after_put(self):
+        with tempfile.TemporaryDirectory() as location:
+            cache = EmbeddingCache(location, "stsb-distilbert-base", 512, self.dim)
+            cache.put(self.texts[:2], self.embeddings[:2])
+            mask, hits = cache.lookup(self.texts)
+            assert mask.tolist() == [True, True, False]
+            assert np.array_equal(hits, self.embeddings[:2])
+            assert cache.hits == 2
+            assert cache.misses == 1
+
+    def test_persisted_across_instances(self):
+        with tempfile.TemporaryDirectory() as location:
+            EmbeddingCache(location, "stsb-distilbert-base", 512, self.dim).put(self.texts, self.embeddings)
+            cache = EmbeddingCache(location, "stsb-distilbert-base", 512, self.dim)
+            mask, hits = cache.lookup(self.texts[::-1])
+            assert mask.all()
+            assert np.array_equal(hits, self.embeddings[::-1])
+
+    def test_namespaced_by_model_and_max_seq_length(self):
+        with tempfile.TemporaryDirectory() as location:
+            EmbeddingCache(location, "stsb-distilbert-base", 512, self.dim).put(self.texts, self.embeddings)
+            mask, _ = EmbeddingCache(location, "stsb-distilbert-base", 128, self.dim).lookup(self.texts)
+            assert not mask.any()
+            mask, _ = EmbeddingCache(location, "bert-base-german-cased", 512, self.dim).lookup(self.texts)
+            assert not mask.any()
+
+    def test_eviction_keeps_newest_entries(self):
+        with tempfile.TemporaryDirectory() as location:
+            cache = EmbeddingCache(location, "stsb-distilbert-base", 512, self.dim, max_entries=2, retain_ratio=0.5)
+            cache.put(self.texts, self.embeddings)
+            assert len(cache) == 1
+            mask, hits = cache.lookup(self.texts)
+            assert mask.tolist() == [False, False, True]
+            assert np.array_equal(hits, self.embeddings[2:])
+
+    def test_interrupted_append_is_truncated(self):
+        with tempfile.TemporaryDirectory() as location:
+            cache = EmbeddingCache(location, "stsb-distilbert-base", 512, self.dim)
+            cache.put(self.texts, self.embeddings)
+            with open(cache.keys_path, "r+b") as f:
+                f.truncate(2 * EmbeddingCache.KEY_SIZE + 5)
+            cache = EmbeddingCache(location, "stsb-distilbert-base", 512, self.dim)
+            assert len(cache) == 2
+            assert os.path.getsize(cache.vectors_path) == 2 * self.dim * 4
+            mask, _ = cache.lookup(self.texts)
+            assert mask.tolist() == [True, True, False]
+
+    def test_shared_location(self):
+        with tempfile.TemporaryDirectory() as location:
+            # as two processes sharing the location
+            first = EmbeddingCache(location, "stsb-distilbert-base", 512, self.dim)
+            second = EmbeddingCache(location, "stsb-distilbert-base", 512, self.dim)
+            first.put(self.texts[:2], self.embeddings[:2])
+            second.put(self.texts[::-1], self.embeddings[::-1])
+            assert len(second) == 3
+            mask, hits = first.lookup(self.texts)
+            assert mask.all()
+            assert np.array_equal(hits, self.embeddings)
+            mask, hits = EmbeddingCache(location, "stsb-distilbert-base", 512, self.dim).lookup(self.texts)
+            assert mask.all()
+            assert np.array_equal(hits, self.embeddings)
+
+    def test_eviction_by_other_instance(self):
+        with tempfile.TemporaryDirectory() as location:
+            first = EmbeddingCache(location, "stsb-distilbert-base", 512, self.dim, max_entries=2, retain_ratio=0.5)
+            second = EmbeddingCache(location, "stsb-distilbert-base", 512, self.dim, max_entries=2, retain_ratio=0.5)
+            first.put(self.texts[:1], self.embeddings[:1])
+            second.put(self.texts[1:], self.embeddings[1:])
+            mask, hits = first.lookup(self.texts)
+            assert mask.tolist() == [False, False, True]
+            assert np.array_equal(hits, self.embeddings[2:])
@@ -0,0 +1,81 @@
+import tempfile
+import numpy as np
+from ..exact_index import ExactIndex, recall_at_k
+from ..vector_storage import VectorStorage
+
+class TestExactIndex():
+    @classmethod
+    def setup_class(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        random = np.random.RandomState(0)
+        self.data = random.rand(500, 16).astype(np.float32) - 0.5
+        self.queries = random.rand(20, 16).astype(np.float32) - 0.5
+        self.ids = [f"id{i}" for i in range(500)]
+
+    @classmethod
+    def teardown_class(self):
+        self.tmp_dir.cleanup()
+
+    def test_knn_query_matches_brute_force(self):
+        index = ExactIndex(space="cosine", dim=16, block_elements=1000)
+        index.init_index(max_elements=100)
+        index.add_items(self.data, self.ids)
+        labels, distances = index.knn_query(self.queries, k=10)
+        normalized = self.data / np.linalg.norm(self.data, axis=1, keepdims=True)
+        queries = self.queries / np.linalg.norm(self.queries, axis=1, keepdims=True)
+        expected = np.argsort(-(queries @ normalized.T), axis=1)[:, :10]
+        assert labels.tolist() == [[f"id{i}" for i in row] for row in expected]
+        assert np.allclose(distances, 1 - np.sort(queries @ normalized.T, axis=1)[:, ::-1][:, :10], atol=1e-5)
+
+    def test_load_hnsw_storage(self):
+        path = f"{self.tmp_dir.name}/vs.bin"
+        hnsw = VectorStorage(path, 500, dim=16, ef_construction=10, m=4, ef=10)
+        hnsw.storage.add_items(self.data, self.ids)
+        hnsw.save()
+        exact = VectorStorage(path, dim=16, backend="exact")
+        assert exact.get_current_count() == 500
+        hnsw_ids, _ = hnsw.get_k_nearest_batch(self.queries, 10)
+        exact_ids, _ = exact.get_k_nearest_batch(self.queries, 10)
+        recalls = recall_at_k(hnsw_ids, exact_ids)
+        assert recalls.shape == (20,)
+        assert 0.5 < recalls.mean() <= 1.
+
+    def test_save_load(self):
+        path = f"{self.tmp_dir.name}/exact.bin"
+        vs = VectorStorage(path, 10, dim=16, backend="exact")
+        vs.storage.add_items(self.data[:100], self.ids[:100])
+        vs.save()
+        loaded = VectorStorage(path, dim=16, backend="exact")
+        assert isinstance(loaded.storage.vectors, np.memmap)
+        loaded.storage.add_items(self.data[100:], self.ids[100:])
+        ids, _ = loaded.get_k_nearest_batch(self.data[[5, 250]], 1)
+        assert ids.tolist() == [["id5"], ["id250"]]
+
+    def test_filtered_knn_query(self):
+        index = ExactIndex(space="cosine", dim=16)
+        index.init_index(max_elements=500)
+        index.add_items(self.data, self.ids)
+        allowed = np.zeros(500, dtype=bool)
+        allowed[:100] = True
+        labels, _ = index.knn_query(self.data[[5, 300]], k=3, allowed=allowed, denied=np.array([5]))
+        assert all(int(label[2:]) < 100 and label != "id5" for label in labels.ravel().tolist())
+
+    def test_load_hnsw_storage_with_deleted(self):
+        path = f"{self.tmp_dir.name}/deleted.bin"
+        hnsw = VectorStorage(path, 20, dim=16, ef_construction=10, m=4, ef=10)
+        hnsw.upsert_batch(self.ids[:20], self.data[:20])
+        assert hnsw.remove("id3")
+        hnsw.save()
+        exact = VectorStorage(path, dim=16, backend="exact")
+        assert exact.get_current_count() == 19
+        ids, _ = exact.get_k_nearest_batch(self.data[[3, 7]], 19)
+        assert "id3" not in ids.ravel().tolist()
+        assert ids[1, 0] == "id7"
+
+    def test_read_hnswlib_items_in_blocks(self):
+        vs = VectorStorage(f"{self.tmp_dir.name}/blocks.bin", 100, dim=16, ef_construction=50, m=8)
+        vs.upsert_batch(self.ids[:100], self.data[:100])
+        labels = np.array([5, 0, 99, 42, 7])
+        vectors = ExactIndex.read_hnswlib_items(vs.storage.index, labels, 16, block_size=2)
+        assert vectors.dtype == np.float32
+        assert np.array_equal(vectors, vs.storage.get_items(labels))
@@ -1,5 +1,7 @@
 import pytest
 import json
+from itertools import combinations
+from scipy.spatial.distance import cosine
 from ..embedding.model import EmbeddingModel
 from ..feature_extraction import FeatureExtraction
 import numpy as np
@@ -12,6 +14,10 @@ class TestFeatureExtraction():
         self.fe_DE = FeatureExtraction(self.embedder_DE, None)
         self.fe_EN = FeatureExtraction(self.embedder_EN, None)
 
+    def test_models_are_shared(self):
+        assert EmbeddingModel(lang="de").model is self.embedder_DE.model
+        assert self.embedder_DE.model is not self.embedder_EN.model
+
     def test_mean_of_pairwise_cosine_distances(self):
         ems = np.array([
             [-1,1,1],
@@ -72,4 +78,9 @@ class TestFeatureExtraction():
     def test_keywords_similarity_one_EN(self):
         empty = ["test"]
         ss = self.fe_EN.get_keywords_similarity(empty)
-        assert ss == 0
\ No newline at end of file
+        assert ss == 0
+
+    def test_mean_of_pairwise_cosine_distances_matches_pairwise(self):
+        ems = np.random.RandomState(0).randn(30, 768).astype(np.float32)
+        expected = np.mean([cosine(a, b) for a, b in combinations(ems, 2)])
+        assert abs(expected - FeatureExtraction.mean_of_pairwise_cosine_distances(ems)) < 1e-5
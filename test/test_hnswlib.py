@@ -0,0 +1,193 @@
+import tempfile
+import numpy as np
+from ..pyw_hnswlib import Hnswlib
+from ..vector_storage import VectorStorage
+
+class TestHnswlib():
+    @classmethod
+    def setup_class(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data = np.random.RandomState(0).rand(100, 8).astype(np.float32)
+        self.ids = [f"id{i}" for i in range(100)]
+
+    @classmethod
+    def teardown_class(self):
+        self.tmp_dir.cleanup()
+
+    def test_grows_on_demand(self):
+        index = Hnswlib(space="cosine", dim=8)
+        index.init_index(max_elements=10)
+        for start in range(0, 100, 30):
+            index.add_items(self.data[start:start + 30], self.ids[start:start + 30])
+        assert index.get_current_count() == 100
+        assert index.get_max_elements() == 160
+        labels, _ = index.knn_query(self.data[[42]], k=1)
+        assert labels.tolist() == [["id42"]]
+
+    def test_shrink_to_fit_and_append(self):
+        path = f"{self.tmp_dir.name}/vs.bin"
+        vs = VectorStorage(path, 64, dim=8, shrink_to_fit=True)
+        vs.storage.add_items(self.data[:50], self.ids[:50])
+        vs.save()
+        loaded = VectorStorage(path, dim=8)
+        assert loaded.get_max_elements() == 50
+        loaded.storage.add_items(self.data[50:], self.ids[50:])
+        assert loaded.get_current_count() == 100
+        assert loaded.get_max_elements() == 100
+        ids, _ = loaded.get_k_nearest_batch(self.data[[10, 90]], 1)
+        assert ids.tolist() == [["id10"], ["id90"]]
+
+    def test_filtered_knn_query(self):
+        vs = VectorStorage(f"{self.tmp_dir.name}/filtered.bin", 100, dim=8, persist=False)
+        vs.storage.add_items(self.data, self.ids)
+        ids, _ = vs.get_k_nearest_batch(self.data[[42]], 5, deny_ids=["id42", "unknown"])
+        assert "id42" not in ids[0].tolist()
+        assert len(ids[0]) == 5
+        allow_ids = [f"id{i}" for i in range(0, 100, 10)]
+        ids, _ = vs.get_k_nearest_batch(self.data[[42, 7]], 9, allow_ids=allow_ids, deny_ids=["id90"])
+        assert [sorted(row) for row in ids.tolist()] == [sorted(set(allow_ids) - {"id90"})] * 2
+        nearest = vs.get_k_nearest(self.data[3], 1, allow_ids=["id3", "id4"], deny_ids=["id3"])
+        assert list(nearest[0][0].keys()) == ["id4"]
+
+    def test_registered_deny_filter(self):
+        vs = VectorStorage(f"{self.tmp_dir.name}/registered.bin", 100, dim=8, persist=False)
+        vs.storage.add_items(self.data, self.ids)
+        denied = [f"id{i}" for i in range(0, 100, 2)]
+        vs.register_filter("even", denied)
+        expected, _ = vs.get_k_nearest_batch(self.data[[42, 7]], 5, deny_ids=denied + ["id7"])
+        ids, _ = vs.get_k_nearest_batch(self.data[[42, 7]], 5, deny_ids=["id7"], deny_filter="even")
+        assert ids.tolist() == expected.tolist()
+        # the labels of the filter follow changes of the storage
+        vs.remove("id2")
+        vs.upsert("id2", self.data[43])
+        ids, _ = vs.get_k_nearest_batch(self.data[[43]], 5, deny_filter="even")
+        assert "id2" not in ids[0].tolist()
+
+    def test_remove_upsert_reuses_labels(self):
+        path = f"{self.tmp_dir.name}/upsert.bin"
+        vs = VectorStorage(path, 100, dim=8, max_deleted_ratio=0.5)
+        vs.storage.add_items(self.data[:50], self.ids[:50])
+        assert vs.remove("id3")
+        assert not vs.remove("id3")
+        assert vs.get_current_count() == 49
+        ids, _ = vs.get_k_nearest_batch(self.data[[3]], 5)
+        assert "id3" not in ids[0].tolist()
+        # a new article takes the label of the deleted one
+        vs.upsert("new", self.data[3])
+        assert vs.storage.labels.lookup(["new"]).tolist() == [3]
+        assert vs.get_k_nearest_batch(self.data[[3]], 1)[0].tolist() == [["new"]]
+        # an existing article is updated in place
+        vs.upsert("id10", self.data[60])
+        assert vs.get_k_nearest_batch(self.data[[60]], 1)[0].tolist() == [["id10"]]
+        vs.upsert_batch(["id60", "id61"], self.data[60:62])
+        assert vs.get_current_count() == 52
+        vs.save()
+        loaded = VectorStorage(path, dim=8)
+        assert loaded.get_current_count() == 52
+        assert loaded.remove("new")
+        assert loaded.storage.get_deleted_count() == 1
+        assert loaded.storage.labels.lookup(["id61"]).tolist() == [51]
+
+    def test_compaction(self):
+        for backend in ["hnsw", "exact"]:
+            vs = VectorStorage(f"{self.tmp_dir.name}/compact_{backend}.bin", 100, dim=8, persist=False, backend=backend, max_deleted_ratio=0.2)
+            vs.storage.add_items(self.data, self.ids)
+            assert vs.remove_batch(self.ids[:20]) == 20
+            assert vs.storage.get_deleted_count() == 20
+            assert vs.remove("id20")
+            # more than 20% deleted, the storage was rebuilt without tombstones
+            assert vs.storage.get_deleted_count() == 0
+            assert vs.storage.get_current_count() == 79
+            ids, _ = vs.get_k_nearest_batch(self.data[[50, 5]], 1)
+            assert ids[0].tolist() == ["id50"]
+            assert int(ids[1][0][2:]) > 20
+
+    def test_vector_sidecar_rerank(self):
+        path = f"{self.tmp_dir.name}/sidecar.bin"
+        data = np.random.RandomState(1).rand(300, 8).astype(np.float32) - 0.5
+        ids = [f"id{i}" for i in range(300)]
+        vs = VectorStorage(path, 10, dim=8, ef_construction=10, m=4, ef=10, vector_sidecar=True)
+        vs.storage.add_items(data, ids)
+        vs.save()
+
+        loaded = VectorStorage(path, dim=8, ef=10, rerank=True, rerank_factor=10)
+        assert isinstance(loaded.vectors16, np.memmap)
+        normalized = data / np.linalg.norm(data, axis=1, keepdims=True)
+        assert np.allclose(loaded.vectors16, normalized, atol=1e-3)
+
+        queries = normalized[:20]
+        exact_ids = np.argsort(-(queries @ normalized.T), axis=1)[:, :5]
+        result_ids, distances = loaded.get_k_nearest_batch(queries, 5, deny_ids=["id1"])
+        assert result_ids[0, 0] == "id0"
+        assert "id1" not in result_ids.tolist()[1]
+        assert np.all(np.diff(distances, axis=1) >= 0)
+        assert result_ids[2:].tolist() == [[f"id{i}" for i in row] for row in exact_ids[2:]]
+
+        # changed and added vectors are visible to the rerank before the next save
+        loaded.upsert_batch(["id0", "new"], normalized[[5, 6]])
+        assert np.allclose(loaded.get_sidecar_vectors()[[0, 300]], normalized[[5, 6]], atol=1e-3)
+
+    def test_get_vectors(self):
+        path = f"{self.tmp_dir.name}/get_vectors.bin"
+        vs = VectorStorage(path, 10, dim=8, ef_construction=10, m=4, vector_sidecar=True)
+        vs.storage.add_items(self.data, self.ids)
+        normalized = self.data / np.linalg.norm(self.data, axis=1, keepdims=True)
+        vectors, missing = vs.get_vectors(["id3", "unknown", "id0"])
+        assert missing == [1]
+        assert np.allclose(vectors[[0, 2]], normalized[[3, 0]], atol=1e-6)
+        assert not vectors[1].any()
+        vs.save()
+        vectors, missing = VectorStorage(path, dim=8).get_vectors(["id3", "id0"])
+        assert missing == []
+        assert np.allclose(vectors, normalized[[3, 0]], atol=1e-3)
+
+    def test_sidecar_is_rewritten_without_flag(self):
+        path = f"{self.tmp_dir.name}/stale_sidecar.bin"
+        vs = VectorStorage(path, 10, dim=8, ef_construction=10, m=4, vector_sidecar=True)
+        vs.upsert_batch(self.ids[:20], self.data[:20])
+        vs.save()
+        # opened without vector_sidecar, the upsert keeps the count
+        vs = VectorStorage(path, dim=8)
+        vs.upsert("id0", self.data[50])
+        assert vs.remove("id1")
+        vs.upsert("new", self.data[51])
+        vs.save()
+        loaded = VectorStorage(path, dim=8)
+        assert loaded.vectors16 is not None
+        vectors, _ = loaded.get_vectors(["id0", "new"])
+        normalized = self.data[[50, 51]] / np.linalg.norm(self.data[[50, 51]], axis=1, keepdims=True)
+        assert np.allclose(vectors, normalized, atol=1e-3)
+
+    def test_sidecar_changes_in_place(self):
+        path = f"{self.tmp_dir.name}/sidecar_in_place.bin"
+        vs = VectorStorage(path, 10, dim=8, ef_construction=10, m=4, vector_sidecar=True)
+        vs.upsert_batch(self.ids[:20], self.data[:20])
+        vs.save()
+        vs = VectorStorage(path, dim=8, max_deleted_ratio=0.5)
+        vs.upsert("id0", self.data[50])
+        # copied from the memory map once, then written in place
+        vectors16 = vs.vectors16
+        assert not isinstance(vectors16, np.memmap)
+        for i in range(21, 30):
+            vs.upsert(self.ids[i], self.data[i])
+        assert vs.remove("id3")
+        # grown once to twice its rows for the new labels
+        assert len(vs.vectors16) == 40
+        assert not vs.get_sidecar_vectors()[3].any()
+        vectors, _ = vs.get_vectors(["id0", "id25"])
+        normalized = self.data[[50, 25]] / np.linalg.norm(self.data[[50, 25]], axis=1, keepdims=True)
+        assert np.allclose(vectors, normalized, atol=1e-3)
+        vs.save()
+        assert len(VectorStorage(path, dim=8).vectors16) == 29
+
+    def test_compact_in_blocks(self):
+        index = Hnswlib(space="cosine", dim=8)
+        index.init_index(max_elements=100, ef_construction=50, M=8)
+        index.add_items(self.data, self.ids)
+        index.remove_items(self.ids[10:30])
+        index.compact(block_size=7)
+        assert index.get_current_count() == 80
+        labels = index.labels.lookup(["id5", "id50"])
+        normalized = self.data[[5, 50]] / np.linalg.norm(self.data[[5, 50]], axis=1, keepdims=True)
+        assert np.allclose(index.get_items(labels), normalized, atol=1e-6)
+        assert index.labels.lookup(["id10"]).tolist() == [-1]
@@ -0,0 +1,119 @@
+import pytest
+import json
+import os
+import tempfile
+import numpy as np
+from ..embedding_archive import EmbeddingArchive
+from ..vector_storage import VectorStorage
+
+class FakeEmbedder():
+    # one-hot embeddings, texts "missing" can not be encoded
+    def encode_batch(self, texts, out=None, view=None):
+        embeddings = out[:len(texts)]
+        embeddings.fill(0)
+        for i, text in enumerate(texts):
+            embeddings[i, int(text) % embeddings.shape[1]] = 1
+        return embeddings, [i for i, text in enumerate(texts) if text == "missing"]
+
+class TestIngestPipeline():
+    @classmethod
+    def setup_class(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_path = f"{self.tmp_dir.name}/articles.jsonl"
+        with open(self.file_path, "w", encoding="utf-8") as f:
+            for i in range(250):
+                content = "" if i % 50 == 7 else str(i)
+                f.write(json.dumps({"id": f"id{i}", "content": content}) + "\n")
+
+    @classmethod
+    def teardown_class(self):
+        self.tmp_dir.cleanup()
+
+    def get_ids(self, vs):
+        labels = vs.storage.labels
+        return labels.translate(np.arange(len(labels))).tolist()
+
+    def test_pipelined_matches_serial(self):
+        serial = VectorStorage(f"{self.tmp_dir.name}/serial.bin", 300, dim=16, persist=False)
+        serial.add_items_from_file(self.file_path, lambda x: x["content"], lambda x: x["id"], FakeEmbedder(), batch_size=32)
+        pipelined = VectorStorage(f"{self.tmp_dir.name}/pipelined.bin", 300, dim=16)
+        pipelined.add_items_from_file(self.file_path, lambda x: x["content"], lambda x: x["id"], FakeEmbedder(), batch_size=32, pipelined=True, parse_workers=3, insert_threads=2, queue_size=2)
+        assert pipelined.get_current_count() == 245
+        assert self.get_ids(pipelined) == self.get_ids(serial)
+        assert os.path.isfile(f"{self.tmp_dir.name}/pipelined.bin")
+
+    def test_pipelined_raises_encoder_errors(self):
+        class FailingEmbedder(FakeEmbedder):
+            def encode_batch(self, texts, out=None, view=None):
+                raise ValueError("encoder failed")
+        vs = VectorStorage(f"{self.tmp_dir.name}/failing.bin", 300, dim=16, persist=False)
+        with pytest.raises(ValueError, match="encoder failed"):
+            vs.add_items_from_file(self.file_path, lambda x: x["content"], lambda x: x["id"], FailingEmbedder(), batch_size=32, pipelined=True)
+
+    def test_resume_from_checkpoint(self):
+        class CrashingEmbedder(FakeEmbedder):
+            # fails on the fourth batch
+            calls = 0
+            def encode_batch(self, texts, out=None, view=None):
+                self.calls += 1
+                if self.calls == 4:
+                    raise MemoryError()
+                return super().encode_batch(texts, out=out, view=view)
+
+        for pipelined in [False, True]:
+            path = f"{self.tmp_dir.name}/resumed_{pipelined}.bin"
+            vs = VectorStorage(path, 10, dim=16, archive_embeddings=True)
+            with pytest.raises(MemoryError):
+                vs.add_items_from_file(self.file_path, lambda x: x["content"], lambda x: x["id"], CrashingEmbedder(), batch_size=32, pipelined=pipelined, checkpoint_every=50, queue_size=1)
+            checkpointed = VectorStorage(path, dim=16)
+            assert 0 < checkpointed.get_current_count() < 245
+
+            resumed = VectorStorage(path, dim=16, archive_embeddings=True)
+            resumed.add_items_from_file(self.file_path, lambda x: x["content"], lambda x: x["id"], FakeEmbedder(), batch_size=32, pipelined=pipelined, checkpoint_every=50, resume=True)
+            assert self.get_ids(resumed) == [f"id{i}" for i in range(250) if i % 50 != 7]
+            # the archive holds every embedding once, also those added after the checkpoint before the crash
+            _, archived_ids = EmbeddingArchive.load(f"{path}.emb")
+            assert archived_ids.tolist() == self.get_ids(resumed)
+            # a finished file is skipped
+            VectorStorage(path, dim=16).add_items_from_file(self.file_path, lambda x: x["content"], lambda x: x["id"], FakeEmbedder(), checkpoint_every=50, resume=True)
+            assert VectorStorage(path, dim=16).get_current_count() == 245
+
+    def test_crash_while_checkpointing_keeps_previous_generation(self, monkeypatch):
+        def crash(*args, **kwargs):
+            raise MemoryError()
+        data = np.random.RandomState(0).rand(80, 16).astype(np.float32)
+        path = f"{self.tmp_dir.name}/generations.bin"
+        vs = VectorStorage(path, 10, dim=16, vector_sidecar=True)
+        vs.upsert_batch([f"id{i}" for i in range(50)], data[:50])
+        vs.save_checkpoint(self.file_path, 100)
+        vs.upsert_batch([f"id{i}" for i in range(50, 80)], data[50:])
+        # the index of the next generation is written, its checkpoint is not
+        with monkeypatch.context() as m:
+            m.setattr(json, "dump", crash)
+            with pytest.raises(MemoryError):
+                vs.save_checkpoint(self.file_path, 200)
+
+        resumed = VectorStorage(path, dim=16)
+        assert resumed.get_current_count() == 50
+        assert len(resumed.vectors16) == 50
+        assert resumed._get_resume_offset(self.file_path) == 100
+        resumed.save_checkpoint(self.file_path, 150, final=True)
+        assert not os.path.isfile(f"{path}.ckpt1")
+        assert VectorStorage(path, dim=16).get_current_count() == 50
+
+    def test_save_after_checkpoint(self):
+        data = np.random.RandomState(0).rand(100, 16).astype(np.float32)
+        path = f"{self.tmp_dir.name}/saved_after_checkpoint.bin"
+        vs = VectorStorage(path, 10, dim=16)
+        vs.upsert_batch([f"id{i}" for i in range(100)], data)
+        vs.save_checkpoint(self.file_path, 100)
+        assert not os.path.isfile(path)
+        assert VectorStorage.exists(path)
+
+        reopened = VectorStorage(path, dim=16)
+        assert reopened.remove("id5")
+        reopened.save()
+        assert not os.path.isfile(f"{path}.ckpt1")
+        saved = VectorStorage(path, dim=16)
+        assert saved.get_current_count() == 99
+        assert saved.storage.labels.lookup(["id5"]).tolist() == [-1]
@@ -0,0 +1,84 @@
+import os
+import pickle
+import tempfile
+import numpy as np
+from ..label_table import IdFilter, LabelTable
+from ..pyw_hnswlib import Hnswlib
+
+class TestLabelTable():
+    @classmethod
+    def setup_class(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.index_path = f"{self.tmp_dir.name}/test.bin"
+
+    @classmethod
+    def teardown_class(self):
+        self.tmp_dir.cleanup()
+
+    def test_append_and_translate(self):
+        table = LabelTable(capacity=2)
+        assert table.append(["a", "bb"]) == 0
+        assert table.append(["https://netzpolitik.org/ä", "d"]) == 2
+        assert len(table) == 4
+        assert table.translate(np.array([[3, 0], [2, 1]])).tolist() == [["d", "a"], ["https://netzpolitik.org/ä", "bb"]]
+
+    def test_save_load_append(self):
+        table = LabelTable()
+        table.append(["a", "b", "c"])
+        table.save(LabelTable.sidecar_path(self.index_path))
+        loaded = LabelTable.load_for_index(self.index_path)
+        assert isinstance(loaded.ids, np.memmap)
+        assert loaded.translate(np.array([2, 0])).tolist() == ["c", "a"]
+        assert loaded.append(["a longer id"]) == 3
+        assert loaded.translate(np.array([3, 1])).tolist() == ["a longer id", "b"]
+
+    def test_load_pickle(self):
+        index_path = f"{self.tmp_dir.name}/legacy.bin"
+        with open(index_path + ".pkl", "wb") as f:
+            pickle.dump((2, {0: "x", 1: "y"}), f)
+        table = LabelTable.load_for_index(index_path)
+        assert len(table) == 2
+        assert table.translate(np.array([1, 0])).tolist() == ["y", "x"]
+
+    def test_hnswlib_knn_query(self):
+        data = np.eye(4, dtype=np.float32)
+        index = Hnswlib(space="cosine", dim=4)
+        index.init_index(max_elements=4)
+        index.add_items(data, ["a", "b", "c", "d"])
+        index.save_index(self.index_path)
+        loaded = Hnswlib(space="cosine", dim=4)
+        loaded.load_index(self.index_path)
+        labels, _ = loaded.knn_query(data[[2, 0]], k=1)
+        assert labels.tolist() == [["c"], ["a"]]
+        assert os.path.isfile(LabelTable.sidecar_path(self.index_path))
+
+    def test_lookup(self):
+        table = LabelTable()
+        table.append(["b", "a", "ccc"])
+        assert table.lookup(["a", "ccc", "cccc", "zz", "b"]).tolist() == [1, 2, -1, -1, 0]
+        table.append(["d"])
+        assert table.lookup(["d"]).tolist() == [3]
+
+    def test_release_and_assign(self):
+        table = LabelTable()
+        table.append([f"id{i}" for i in range(5)])
+        table.lookup(["id0"])
+        table.release([1, 3])
+        assert table.lookup(["id1", "id3", "id4"]).tolist() == [-1, -1, 4]
+        labels = table.assign(["id4", "x", "y", "z"])
+        assert labels.tolist() == [4, 3, 1, 5]
+        assert table.lookup(["x", "y", "z", "id2"]).tolist() == [3, 1, 5, 2]
+        assert table.translate(np.array([1, 3, 5])).tolist() == ["y", "x", "z"]
+
+    def test_id_filter(self):
+        table = LabelTable()
+        table.append([f"id{i}" for i in range(5)])
+        id_filter = IdFilter(["id3", "unknown", "id1"])
+        labels = id_filter.get_labels(table)
+        assert labels.tolist() == [1, 3]
+        # looked up again only once the table changed
+        assert id_filter.get_labels(table) is labels
+        table.release([3])
+        table.assign(["unknown"])
+        assert id_filter.get_labels(table).tolist() == [1, 3]
+        assert id_filter.get_labels(LabelTable()).tolist() == []
@@ -0,0 +1,56 @@
+import tempfile
+import numpy as np
+from ..multi_view_storage import MultiViewStorage
+from ..vector_storage import VectorStorage
+
+class TestMultiViewStorage():
+    @classmethod
+    def setup_class(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        random = np.random.RandomState(0)
+        self.title = random.rand(200, 8).astype(np.float32) - 0.5
+        self.keywords = random.rand(200, 8).astype(np.float32) - 0.5
+        self.ids = [f"id{i}" for i in range(200)]
+
+    @classmethod
+    def teardown_class(self):
+        self.tmp_dir.cleanup()
+
+    def test_views_share_labels(self):
+        path = f"{self.tmp_dir.name}/views"
+        mvs = MultiViewStorage(path, dim=8, ef_construction=50, m=8, ef=50, max_elements=10)
+        mvs.add_items("title", self.title, self.ids)
+        # the keyword view misses the first 50 articles
+        mvs.add_items("keywords", self.keywords[50:], self.ids[50:])
+        assert mvs.get_current_count() == 200
+        mvs.save()
+
+        loaded = MultiViewStorage(path)
+        assert loaded.get_view_names() == ["title", "keywords"]
+        assert all(view is None for view in loaded.views.values())
+        ids, _ = loaded.get_k_nearest_batch("keywords", self.keywords[[60]], 1)
+        assert ids.tolist() == [["id60"]]
+        assert loaded.views["title"] is None
+
+        results = loaded.get_k_nearest_views({"title": self.title[:3], "keywords": self.keywords[100:103]}, 5, deny_ids=["id0"])
+        assert results["title"][0][1:, 0].tolist() == ["id1", "id2"]
+        assert "id0" not in results["title"][0].tolist()[0]
+        assert results["keywords"][0][:, 0].tolist() == ["id100", "id101", "id102"]
+        assert not set(results["keywords"][0].ravel().tolist()) & set(self.ids[:50])
+
+    def test_add_view_from_storage(self):
+        storage_path = f"{self.tmp_dir.name}/vs_title.bin"
+        vs = VectorStorage(storage_path, 10, dim=8, ef_construction=50, m=8)
+        vs.storage.add_items(self.title, self.ids)
+        vs.remove("id3")
+        vs.save()
+
+        mvs = MultiViewStorage(f"{self.tmp_dir.name}/imported", dim=8, ef=50)
+        mvs.add_items("keywords", self.keywords[:10], self.ids[:10])
+        mvs.add_view_from_storage("vs_title", storage_path, block_size=64)
+        assert mvs.get_current_count() == 200
+        view = mvs.get_view("vs_title")
+        assert view.get_current_count() == 199
+        assert view.index.M == 8
+        ids, _ = mvs.get_k_nearest_batch("vs_title", self.title[[5, 150]], 1)
+        assert ids.tolist() == [["id5"], ["id150"]]
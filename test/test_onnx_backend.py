@@ -0,0 +1,31 @@
+import pytest
+import tempfile
+import numpy as np
+
+pytest.importorskip("torch")
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("onnxruntime")
+
+from ..embedding.model import EmbeddingModel
+
+class TestOnnxBackend():
+    @classmethod
+    def setup_class(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.em_torch = EmbeddingModel(lang="en")
+        self.em_onnx = EmbeddingModel(lang="en", backend="onnx", onnx_location=self.tmp_dir.name)
+        # the last text is longer than max_seq_length and truncated by both backends
+        self.texts = ["technology", "The senate passed the budget after a long debate.", " ".join(["word"] * 1000)]
+
+    @classmethod
+    def teardown_class(self):
+        self.em_torch.close()
+        self.em_onnx.close()
+        self.tmp_dir.cleanup()
+
+    def test_matches_torch(self):
+        em_torch, _ = self.em_torch.encode_batch(self.texts)
+        em_onnx, _ = self.em_onnx.encode_batch(self.texts)
+        similarities = np.sum(em_torch * em_onnx, axis=1) / (np.linalg.norm(em_torch, axis=1) * np.linalg.norm(em_onnx, axis=1))
+        assert np.all(similarities > 0.9999)
+        assert np.allclose(em_torch, em_onnx, atol=1e-3)
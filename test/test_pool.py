@@ -0,0 +1,66 @@
+import pytest
+import numpy as np
+from ..embedding.pool import EncodingPool
+from ..embedding.truncation import TruncationStats
+
+class FakeTruncator():
+    def __init__(self):
+        self.stats = TruncationStats()
+
+class FakeEmbeddingModel():
+    # embeds a text "i" as [i, size of its chunk], texts of more than 3 characters count as truncated
+    dim = 2
+
+    def __init__(self):
+        self.scheduler = self
+        self.truncator = FakeTruncator()
+
+    def encode(self, texts, dim, batch_size=32, view=None):
+        self.truncator.stats.add(view, [len(texts), sum(len(text) > 3 for text in texts), 0])
+        return np.array([[int(text), len(texts)] for text in texts], dtype=np.float32)
+
+def load_fake_model(lang, model_kwargs, num_threads):
+    # picklable, the spawned workers import it from this module
+    if model_kwargs.get("fail"):
+        raise ValueError("model not found")
+    return FakeEmbeddingModel()
+
+class TestEncodingPool():
+    @classmethod
+    def setup_class(self):
+        self.pool = EncodingPool("en", num_workers=3, chunk_size=4, startup_timeout=60, load_model=load_fake_model)
+
+    @classmethod
+    def teardown_class(self):
+        self.pool.close()
+
+    def test_output_order_and_chunking(self):
+        texts = [str(i) for i in range(1000, 1030)]
+        embeddings = self.pool.encode(texts)
+        assert self.pool.dim == 2
+        assert embeddings[:, 0].tolist() == list(range(1000, 1030))
+        # chunks of chunk_size, the last one holds the rest
+        assert embeddings[:, 1].tolist() == [4] * 28 + [2] * 2
+        # small inputs are spread over all workers
+        assert self.pool.encode(["1", "2", "3"])[:, 1].tolist() == [1, 1, 1]
+        assert self.pool.encode([]).shape == (0, 2)
+
+    def test_encode_stream(self):
+        chunks = [[str(i) for i in range(start, start + 5)] for start in range(990, 1040, 5)]
+        results = list(self.pool.encode_stream(chunks, view="title"))
+        assert [result[:, 0].tolist() for result in results] == [[float(i) for i in chunk] for chunk in chunks]
+        # the truncation counts of all workers are summed per view
+        assert self.pool.truncation_stats.get("title") == [50, 40, 0]
+
+    def test_clean_shutdown(self):
+        pool = EncodingPool("en", num_workers=2, startup_timeout=60, load_model=load_fake_model)
+        pool.encode(["1", "2", "3"])
+        pool.close()
+        # the workers left their loop instead of being terminated
+        assert [worker.exitcode for worker in pool.workers] == [0, 0]
+        with pytest.raises(RuntimeError):
+            pool.encode(["1"])
+
+    def test_worker_failure(self):
+        with pytest.raises(RuntimeError, match="model not found"):
+            EncodingPool("en", {"fail": True}, num_workers=2, startup_timeout=60, load_model=load_fake_model)
@@ -0,0 +1,14 @@
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from ..embedding.registry import ModelRegistry
+
+class TestModelRegistry():
+    def test_key_includes_onnx_settings(self):
+        default = ModelRegistry.get_key("en", "cpu", 256, backend="onnx")
+        assert default == ModelRegistry.get_key("en", "cpu", 256, backend="onnx", onnx_location=ModelRegistry.default_onnx_location)
+        assert default != ModelRegistry.get_key("en", "cpu", 256, backend="onnx", onnx_location="/tmp/onnx")
+        assert default != ModelRegistry.get_key("en", "cpu", 256, backend="onnx", onnx_threads=4)
+        # torch models ignore the onnx settings
+        assert ModelRegistry.get_key("en", "cpu", 256) == ModelRegistry.get_key("en", "cpu", 256, onnx_location="/tmp/onnx", onnx_threads=4)
@@ -0,0 +1,35 @@
+import numpy as np
+from ..embedding.scheduler import LengthBucketScheduler
+
+class WordCountModel():
+    max_seq_length = 4
+
+    def __init__(self):
+        self.batch_lengths = []
+
+    def tokenize(self, text):
+        return list(range(len(text.split())))
+
+    def encode(self, token_ids, batch_size, is_pretokenized, convert_to_numpy, convert_to_tensor):
+        assert is_pretokenized
+        self.batch_lengths.append([len(ids) for ids in token_ids])
+        return np.array([[len(ids), len(ids)] for ids in token_ids], dtype=np.float32)
+
+class TestLengthBucketScheduler():
+    def test_restores_original_order(self):
+        model = WordCountModel()
+        scheduler = LengthBucketScheduler(model)
+        texts = ["a b c", "a", "a b c d e f", "a b"]
+        embeddings = scheduler.encode(texts, 2, batch_size=2)
+        # token ids are truncated to max_seq_length before encoding
+        assert embeddings[:, 0].tolist() == [3, 1, 4, 2]
+        assert model.batch_lengths == [[1, 2], [3, 4]]
+
+    def test_padding_stats(self):
+        scheduler = LengthBucketScheduler(WordCountModel())
+        scheduler.encode(["a b c", "a", "a b c d e f", "a b"], 2, batch_size=2)
+        # lengths incl. special tokens, truncated to max_seq_length: 5, 3, 6, 4
+        assert scheduler.token_count == 18
+        assert scheduler.padded_token_count == 2 * 4 + 2 * 6
+        assert scheduler.unsorted_padded_token_count == 2 * 5 + 2 * 6
+        assert abs(scheduler.get_padding_ratio(scheduler.padded_token_count) - 0.1) < 1e-9
@@ -0,0 +1,88 @@
+import tempfile
+import numpy as np
+from ..sharded_storage import ShardedVectorStorage
+
+class TestShardedVectorStorage():
+    @classmethod
+    def setup_class(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        random = np.random.RandomState(0)
+        self.data = random.rand(300, 8).astype(np.float32) - 0.5
+        self.ids = [f"id{i}" for i in range(300)]
+        # 100 articles per year from 2017 to 2019
+        self.dates = np.datetime64("2017-01-01") + (np.arange(300) * 365 // 100).astype("timedelta64[D]")
+
+    @classmethod
+    def teardown_class(self):
+        self.tmp_dir.cleanup()
+
+    def brute_force(self, query, before, k):
+        normalized = self.data / np.linalg.norm(self.data, axis=1, keepdims=True)
+        distances = 1 - normalized @ (query / np.linalg.norm(query))
+        distances[self.dates >= before] = np.inf
+        return [self.ids[i] for i in np.argsort(distances)[:k]]
+
+    def test_routes_to_older_articles(self):
+        location = f"{self.tmp_dir.name}/sharded"
+        storage = ShardedVectorStorage(location, dim=8, ef_construction=100, m=16, ef=100, num_threads=2)
+        storage.add_items(self.data, self.ids, self.dates)
+        assert sorted(storage.get_shard_counts().keys()) == ["2017", "2018", "2019"]
+        storage.save()
+
+        loaded = ShardedVectorStorage(location, dim=8, ef=100)
+        assert loaded.get_current_count() == 300
+        query_dates = [np.datetime64("2018-06-01"), np.datetime64("2020-01-01")]
+        ids, distances = loaded.get_k_nearest_batch(self.data[[10, 250]], 5, query_dates)
+        assert ids.shape == (2, 5)
+        assert ids[0].tolist() == self.brute_force(self.data[10], query_dates[0], 5)
+        assert ids[1].tolist() == self.brute_force(self.data[250], query_dates[1], 5)
+        assert (np.diff(distances, axis=1) >= 0).all()
+
+        vectors, missing = loaded.get_vectors(["id250", "unknown", "id10"])
+        normalized = self.data / np.linalg.norm(self.data, axis=1, keepdims=True)
+        assert missing == [1]
+        assert np.allclose(vectors[[0, 2]], normalized[[250, 10]], atol=1e-6)
+
+    def test_pads_early_queries(self):
+        storage = ShardedVectorStorage(f"{self.tmp_dir.name}/monthly", partition="month", dim=8)
+        storage.add_items(self.data, self.ids, self.dates)
+        ids, distances = storage.get_k_nearest_batch(self.data[[0, 1]], 3, ["2017-01-01", "2017-01-05"], deny_ids=["id0"])
+        assert ids[0].tolist() == ["", "", ""]
+        assert ids[1].tolist() == ["id1", "", ""]
+        assert np.isinf(distances[1, 1:]).all()
+
+    def test_batches_queries_within_a_shard(self):
+        storage = ShardedVectorStorage(f"{self.tmp_dir.name}/batched", dim=8, ef_construction=100, m=16, ef=100)
+        storage.add_items(self.data, self.ids, self.dates)
+        rows = [120, 150, 180, 199]
+        query_dates = self.dates[rows]
+        # one task per shard, however many queries fall into it
+        assert len(storage._route(query_dates)) == 2
+        ids, _ = storage.get_k_nearest_batch(self.data[rows], 5, query_dates, deny_ids=["id0"])
+        for row, row_ids in zip(rows, ids.tolist()):
+            expected = [article_id for article_id in self.brute_force(self.data[row], self.dates[row], 6) if article_id != "id0"][:5]
+            assert row_ids == expected
+
+    def test_registered_deny_filter(self):
+        storage = ShardedVectorStorage(f"{self.tmp_dir.name}/filtered", dim=8, ef_construction=100, m=16, ef=100)
+        storage.add_items(self.data, self.ids, self.dates)
+        denied = [f"id{i}" for i in range(0, 250, 3)]
+        storage.register_filter("denied", denied)
+        rows = [150, 260]
+        ids, _ = storage.get_k_nearest_batch(self.data[rows], 5, self.dates[rows], deny_ids=["id1"], deny_filter="denied")
+        for row, row_ids in zip(rows, ids.tolist()):
+            expected = [article_id for article_id in self.brute_force(self.data[row], self.dates[row], 100) if article_id not in denied and article_id != "id1"][:5]
+            assert row_ids == expected
+
+    def test_one_search_per_shard_batch(self):
+        storage = ShardedVectorStorage(f"{self.tmp_dir.name}/one_search", dim=8, ef_construction=100, m=16, ef=100, date_factor=100)
+        storage.add_items(self.data, self.ids, self.dates)
+        shard = storage.shards[storage.keys.index("2018")]
+        calls = []
+        knn_query_labels = shard.knn_query_labels
+        shard.knn_query_labels = lambda data, k, **kwargs: calls.append(len(data)) or knn_query_labels(data, k, **kwargs)
+        rows = [120, 150, 180, 199]
+        ids, _ = storage.get_k_nearest_batch(self.data[rows], 3, self.dates[rows])
+        assert calls == [4]
+        for row, row_ids in zip(rows, ids.tolist()):
+            assert row_ids == self.brute_force(self.data[row], self.dates[row], 3)
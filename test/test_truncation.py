@@ -0,0 +1,37 @@
+from ..embedding.truncation import Truncator
+
+class WordTokenizer():
+    def __init__(self):
+        self.tokenized_chars = 0
+
+    def __call__(self, text):
+        self.tokenized_chars += len(text)
+        return [len(word) for word in text.split()]
+
+class TestTruncator():
+    def test_short_text_is_not_truncated(self):
+        truncator = Truncator(WordTokenizer(), 4)
+        assert truncator.tokenize(["aa bb cc"], view="title") == [[2, 2, 2]]
+        assert truncator.stats.get("title") == [1, 0, 0]
+
+    def test_long_text_is_cut_before_tokenization(self):
+        tokenizer = WordTokenizer()
+        truncator = Truncator(tokenizer, 4, max_chars_per_token=3)
+        text = " ".join(["ab"] * 1000)
+        assert truncator.tokenize([text], view="body") == [[2, 2, 2, 2]]
+        assert tokenizer.tokenized_chars <= 12
+        assert truncator.stats.get("body") == [1, 1, 0]
+
+    def test_text_is_retokenized_if_cut_too_short(self):
+        tokenizer = WordTokenizer()
+        truncator = Truncator(tokenizer, 4, max_chars_per_token=3)
+        text = "abcdefghijk abcdefghijk abc"
+        assert truncator.tokenize([text], view="body") == [[11, 11, 3]]
+        assert truncator.stats.get("body") == [1, 0, 1]
+
+    def test_stats_per_view(self):
+        truncator = Truncator(WordTokenizer(), 2)
+        truncator.tokenize(["a b c", "a"], view="title")
+        truncator.tokenize(["a b c d"], view="keywords")
+        assert truncator.stats.get("title") == [2, 1, 0]
+        assert truncator.stats.get("keywords") == [1, 1, 0]
@@ -0,0 +1,49 @@
+import json
+import tempfile
+import numpy as np
+from ..tuning import Tuner, load_judgements, pareto_front
+
+class TestTuning():
+    @classmethod
+    def setup_class(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        random = np.random.RandomState(0)
+        self.data = random.rand(300, 16).astype(np.float32) - 0.5
+        self.ids = [f"id{i}" for i in range(300)]
+
+    @classmethod
+    def teardown_class(self):
+        self.tmp_dir.cleanup()
+
+    def test_pareto_front(self):
+        settings = [
+            {"recall": 0.9, "p50_ms": 1., "file_bytes": 10},
+            {"recall": 0.95, "p50_ms": 2., "file_bytes": 10},
+            {"recall": 0.9, "p50_ms": 2., "file_bytes": 10},
+            {"recall": 0.85, "p50_ms": 1., "file_bytes": 5}
+        ]
+        assert pareto_front(settings) == [settings[0], settings[1], settings[3]]
+
+    def test_load_judgements(self):
+        path = f"{self.tmp_dir.name}/judgements.jsonl"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"id": "id0", "references": [{"id": "id1", "exp_rel": 4}, {"id": "id2", "exp_rel": 0}]}) + "\n")
+            f.write(json.dumps({"id": "id3", "references": ["id4", "id5"]}) + "\n")
+            f.write(json.dumps({"id": "id6", "references": [{"id": "id7", "exp_rel": 1}]}) + "\n")
+        assert load_judgements(path, 2) == {"id0": ["id1"], "id3": ["id4", "id5"]}
+
+    def test_sweep(self):
+        judgements = {"id0": ["id1", "id2"], "unknown": ["id3"]}
+        tuner = Tuner(self.data, self.ids, k=10, num_queries=50, judgements=judgements)
+        index = tuner.build(m=8, ef_construction=50)
+        tuner.evaluate(index, Tuner.get_index_size(index), 8, 50, [5, 10, 300])
+        # ef below k is skipped
+        assert [s["ef"] for s in tuner.settings] == [10, 300]
+        best = tuner.settings[1]
+        assert best["recall"] == 1.
+        assert 0. <= best["judgement_recall"] <= 1.
+        assert 0. < best["p50_ms"] <= best["p99_ms"]
+        assert best["file_bytes"] > 300 * 16 * 4
+        result = tuner.get_result(0.99)
+        assert result["recommended"]["recall"] >= 0.99
+        assert tuner.get_result(1.1)["recommended"] is None
@@ -0,0 +1,88 @@
+import pytest
+import tempfile
+import threading
+import numpy as np
+from ..vector_server import VectorServer, VectorStorageClient, open_storage
+from ..vector_storage import VectorStorage
+
+class TestVectorServer():
+    @classmethod
+    def setup_class(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        random = np.random.RandomState(0)
+        self.data = random.rand(200, 8).astype(np.float32) - 0.5
+        self.storage_path = f"{self.tmp_dir.name}/vs.bin"
+        vs = VectorStorage(self.storage_path, 200, dim=8, ef_construction=50, m=8)
+        vs.storage.add_items(self.data, [f"id{i}" for i in range(200)])
+        vs.save()
+        self.socket_path = f"{self.tmp_dir.name}/vs.sock"
+        self.server = VectorServer(self.socket_path, dim=8, ef=50)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def teardown_class(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def test_client_matches_storage(self):
+        local = VectorStorage(self.storage_path, dim=8, ef=50)
+        client = open_storage(self.storage_path, vector_server=self.socket_path)
+        assert isinstance(client, VectorStorageClient)
+        assert client.get_current_count() == 200
+        expected_ids, expected_distances = local.get_k_nearest_batch(self.data[:10], 5, deny_ids=["id0"])
+        ids, distances = client.get_k_nearest_batch(self.data[:10], 5, deny_ids=["id0"])
+        assert ids.tolist() == expected_ids.tolist()
+        assert np.allclose(distances, expected_distances)
+        nearest = client.get_k_nearest(self.data[3], 3, allow_ids=["id3", "id4", "id5"])
+        assert set(list(n.keys())[0] for n in nearest[0]) == {"id3", "id4", "id5"}
+        vectors, missing = client.get_vectors(["id7", "unknown"])
+        expected_vectors, _ = local.get_vectors(["id7", "unknown"])
+        assert missing == [1]
+        assert np.allclose(vectors, expected_vectors)
+        client.register_filter("denied", ["id1", "id2", "id3"])
+        expected_ids, _ = local.get_k_nearest_batch(self.data[:10], 5, deny_ids=["id0", "id1", "id2", "id3"])
+        ids, _ = client.get_k_nearest_batch(self.data[:10], 5, deny_ids=["id0"], deny_filter="denied")
+        assert ids.tolist() == expected_ids.tolist()
+        client.close()
+        # the server keeps one storage per path
+        VectorStorageClient(self.storage_path, socket_path=self.socket_path).get_current_count()
+        assert len(self.server.storages) == 1
+
+    def test_errors_are_raised_in_the_client(self):
+        client = VectorStorageClient(f"{self.tmp_dir.name}/missing.bin", socket_path=self.socket_path)
+        with pytest.raises(RuntimeError, match="FileNotFoundError"):
+            client.get_current_count()
+
+    def save_storage(self, name):
+        path = f"{self.tmp_dir.name}/{name}"
+        vs = VectorStorage(path, 200, dim=8, ef_construction=50, m=8)
+        vs.storage.add_items(self.data, [f"id{i}" for i in range(200)])
+        vs.save()
+        return path
+
+    def test_storage_kwargs_are_sent(self):
+        path = self.save_storage("vs_exact.bin")
+        client = open_storage(path, vector_server=self.socket_path, backend="exact")
+        exact = VectorStorage(path, dim=8, backend="exact")
+        ids, _ = client.get_k_nearest_batch(self.data[:10], 5)
+        expected_ids, _ = exact.get_k_nearest_batch(self.data[:10], 5)
+        assert ids.tolist() == expected_ids.tolist()
+        storage = self.server.get_storage(client.storage_location, {"backend": "exact"})
+        assert storage.backend == "exact"
+        # loaded once per path, kwargs that only matter for loading may differ
+        assert storage is self.server.get_storage(client.storage_location, {"backend": "exact", "max_elements": 500})
+        with pytest.raises(ValueError, match="backend=exact"):
+            self.server.get_storage(client.storage_location)
+        client.close()
+
+    def test_concurrent_requests_load_once(self):
+        path = self.save_storage("vs_concurrent.bin")
+        storages = []
+        threads = [threading.Thread(target=lambda: storages.append(self.server.get_storage(path, {"max_elements": 300}))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(storages) == 8
+        assert all(storage is storages[0] for storage in storages)
@@ -1,5 +1,6 @@
 import pytest
 import os
+import numpy as np
 from ..vector_storage import VectorStorage
 from ..embedding.model import EmbeddingModel
 
@@ -14,9 +15,7 @@ class TestVectorStorage():
 
     def test_get_k_nearest_de(self):
         file_path = f"{self.data_location}/german_words.jsonl"
-        def emb_func(obj):
-            return self.em_de.encode(obj["content"])
-        self.vs_de.add_items_from_file(file_path, emb_func, lambda x: x["id"])
+        self.vs_de.add_items_from_file(file_path, lambda x: x["content"], lambda x: x["id"], self.em_de)
         actual = self.vs_de.get_k_nearest(self.em_de.encode("Technik"), 5)[0]
         actual_ids = set([list(el.keys())[0] for el in actual])
         expected_ids = { "a", "b", "c", "d", "e" }
@@ -24,10 +23,36 @@ class TestVectorStorage():
 
     def test_get_k_nearest_en(self):
         file_path = f"{self.data_location}/english_words.jsonl"
-        def emb_func(obj):
-            return self.em_en.encode(obj["content"])
-        self.vs_en.add_items_from_file(file_path, emb_func, lambda x: x["id"])
+        self.vs_en.add_items_from_file(file_path, lambda x: x["content"], lambda x: x["id"], self.em_en)
         actual = self.vs_en.get_k_nearest(self.em_en.encode("technology"), 5)[0]
         actual_ids = set([list(el.keys())[0] for el in actual])
         expected_ids = { "a", "b", "c", "d", "e" }
-        assert actual_ids == expected_ids
\ No newline at end of file
+        assert actual_ids == expected_ids
+
+    def test_get_k_nearest_batch(self):
+        vs = VectorStorage("test", 10, persist=False)
+        file_path = f"{self.data_location}/english_words.jsonl"
+        vs.add_items_from_file(file_path, lambda x: x["content"], lambda x: x["id"], self.em_en)
+        queries, _ = self.em_en.encode_batch(["technology", "computer"])
+        ids, distances = vs.get_k_nearest_batch(queries, 5)
+        assert ids.shape == (2, 5)
+        assert distances.shape == (2, 5)
+        assert set(ids[0].tolist()) == { "a", "b", "c", "d", "e" }
+        assert ids[1].tolist() == [list(nn.keys())[0] for nn in vs.get_k_nearest(queries[1], 5)[0]]
+        assert (np.diff(distances, axis=1) >= 0).all()
+
+    def test_encode_batch(self):
+        texts = ["technology", None, "computer", ""]
+        embeddings, missing = self.em_en.encode_batch(texts)
+        assert embeddings.shape == (4, 768)
+        assert embeddings.dtype == np.float32
+        assert embeddings.flags["C_CONTIGUOUS"]
+        assert missing == [1, 3]
+        assert not embeddings[[1, 3]].any()
+        assert np.allclose(embeddings[0], self.em_en.encode("technology"), atol=1e-5)
+
+    def test_encode_returns_float32_vector(self):
+        emb = self.em_de.encode("Technik")
+        assert isinstance(emb, np.ndarray)
+        assert emb.dtype == np.float32
+        assert emb.shape == (768,)
@@ -0,0 +1,174 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from typing import Dict, List
+from .exact_index import ExactIndex, recall_at_k
+from .pyw_hnswlib import Hnswlib
+from .vector_storage import VectorStorage
+from .typings import VectorList
+
+def measure_latency(index: Hnswlib, queries: VectorList, k: int) -> List[float]:
+    # one query at a time on one thread, as a request would be answered
+    index.set_num_threads(1)
+    seconds = []
+    for query in queries:
+        start = time.perf_counter()
+        index.knn_query_labels(query[np.newaxis], k)
+        seconds.append(time.perf_counter() - start)
+    index.set_num_threads(-1)
+    return seconds
+
+def load_judgements(judgement_list_path: str, rel_cutoff: int) -> Dict[str, List[str]]:
+    # query id -> relevant ids, for the WAPO ({"id", "exp_rel"}) and netzpolitik (id) formats
+    judgements = {}
+    with open(judgement_list_path, "r", encoding="utf-8") as f:
+        for line in f:
+            judgement = json.loads(line)
+            relevant = [ref["id"] if isinstance(ref, dict) else ref for ref in judgement["references"] if not isinstance(ref, dict) or int(ref["exp_rel"]) >= rel_cutoff]
+            if relevant:
+                judgements[judgement["id"]] = relevant
+    return judgements
+
+def pareto_front(settings: List[dict]) -> List[dict]:
+    # settings no other setting beats in recall, p50 latency and index file size at once
+    def dominates(a, b):
+        better_or_equal = a["recall"] >= b["recall"] and a["p50_ms"] <= b["p50_ms"] and a["file_bytes"] <= b["file_bytes"]
+        strictly_better = a["recall"] > b["recall"] or a["p50_ms"] < b["p50_ms"] or a["file_bytes"] < b["file_bytes"]
+        return better_or_equal and strictly_better
+    return [s for s in settings if not any(dominates(other, s) for other in settings)]
+
+class Tuner():
+    '''
+    Sweeps the HNSW parameters of a vector storage. For every setting it measures the recall@k
+    against exact search, the p50/p99 latency of single queries, the index file size and, if
+    judgement lists are given, the recall of their relevant articles, queried with the stored
+    vectors of the query articles.
+    '''
+    def __init__(self, vectors: VectorList, ids: List[str], k=100, num_queries=1000, judgements=None, seed=0):
+        self.vectors = vectors
+        self.ids = ids
+        self.k = k
+        self.dim = vectors.shape[1]
+        random = np.random.RandomState(seed)
+        self.query_rows = random.choice(len(vectors), min(num_queries, len(vectors)), replace=False)
+        self.settings = []
+
+        exact = ExactIndex(space='cosine', dim=self.dim)
+        exact.init_index(max_elements=len(vectors))
+        exact.add_items(vectors, ids)
+        self.exact_ids, _ = exact.knn_query(vectors[self.query_rows], k)
+
+        # judgement queries whose article is stored, one more neighbor as the query article is dropped
+        self.judgements = []
+        if judgements:
+            row_of_id = {article_id: row for row, article_id in enumerate(ids)}
+            self.judgements = [(row_of_id[query_id], relevant) for query_id, relevant in judgements.items() if query_id in row_of_id]
+
+    def judgement_recall(self, index: Hnswlib) -> float:
+        if not self.judgements:
+            return None
+        rows = [row for row, _ in self.judgements]
+        labels, _ = index.knn_query(self.vectors[rows], self.k + 1)
+        recalls = []
+        for (row, relevant), result_ids in zip(self.judgements, labels.tolist()):
+            result_ids = set(result_ids) - {self.ids[row]}
+            recalls.append(len(result_ids & set(relevant)) / len(relevant))
+        return float(np.mean(recalls))
+
+    def evaluate(self, index: Hnswlib, file_bytes: int, m: int, ef_construction: int, efs: List[int]):
+        for ef in efs:
+            if ef < self.k:
+                continue
+            index.set_ef(ef)
+            ids, _ = index.knn_query(self.vectors[self.query_rows], self.k)
+            seconds = measure_latency(index, self.vectors[self.query_rows], self.k)
+            setting = {
+                "m": m,
+                "ef_construction": ef_construction,
+                "ef": ef,
+                "recall": float(recall_at_k(ids, self.exact_ids).mean()),
+                "judgement_recall": self.judgement_recall(index),
+                "p50_ms": float(np.percentile(seconds, 50) * 1000),
+                "p99_ms": float(np.percentile(seconds, 99) * 1000),
+                "file_bytes": file_bytes
+            }
+            self.settings.append(setting)
+            print(setting)
+
+    def build(self, m: int, ef_construction: int) -> Hnswlib:
+        index = Hnswlib(space='cosine', dim=self.dim)
+        index.init_index(max_elements=len(self.vectors), ef_construction=ef_construction, M=m)
+        index.add_items(self.vectors, self.ids)
+        return index
+
+    @staticmethod
+    def get_index_size(index: Hnswlib) -> int:
+        # the size of the saved index file
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = f"{tmp_dir}/index.bin"
+            index.index.save_index(path)
+            return os.path.getsize(path)
+
+    def get_result(self, target_recall: float) -> dict:
+        front = pareto_front(self.settings)
+        reaching = [s for s in front if s["recall"] >= target_recall]
+        return {
+            "k": self.k,
+            "target_recall": target_recall,
+            "recommended": min(reaching, key=lambda s: (s["p50_ms"], s["file_bytes"])) if reaching else None,
+            "pareto": sorted(front, key=lambda s: s["recall"]),
+            "settings": self.settings
+        }
+
+def parse_ints(values: str) -> List[int]:
+    return [int(value) for value in values.split(",") if value]
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description='Tune ef (and optionally M/ef_construction) of a vector storage')
+    p.add_argument('--storage', required=True, help='Path of the vector storage (.bin)')
+    p.add_argument('--dim', default=768, type=int, help='Dimension of the embeddings')
+    p.add_argument('--k', default=100, type=int, help='Number of nearest neighbors')
+    p.add_argument('--queries', default=1000, type=int, help='Number of stored vectors used as queries')
+    p.add_argument('--ef', default="100,150,200,300,400", help='Comma separated ef values to sweep')
+    p.add_argument('--judgement_list', default=None, help='Judgement list (.jsonl) for the recall of relevant articles')
+    p.add_argument('--rel_cutoff', default=2, type=int, help='Minimum relevance of WAPO judgements')
+    p.add_argument('--sample', default=0, type=int, help='Sweep M/ef_construction on indexes built from this many stored vectors, 0 tunes only ef')
+    p.add_argument('--m', default="16,32,64,100", help='Comma separated M values for the sample indexes')
+    p.add_argument('--ef_construction', default="100,200", help='Comma separated ef_construction values for the sample indexes')
+    p.add_argument('--target_recall', default=0.95, type=float, help='Recall@k against exact search the recommended setting must reach')
+    p.add_argument('--output', default=None, help='JSON file for the results, defaults to <storage>.tuning.json')
+
+    args = p.parse_args()
+
+    vs = VectorStorage(args.storage, dim=args.dim, persist=False)
+    labels = vs.storage.labels
+    live = np.flatnonzero(labels.ids[:len(labels)] != b"")
+    judgements = load_judgements(args.judgement_list, args.rel_cutoff) if args.judgement_list else None
+
+    if args.sample:
+        # the judgement queries are only meaningful on the whole collection
+        live = np.random.RandomState(0).choice(live, min(args.sample, len(live)), replace=False)
+        judgements = None
+    vectors = ExactIndex.read_hnswlib_items(vs.storage.index, live, args.dim)
+    ids = labels.translate(live).tolist()
+    tuner = Tuner(vectors, ids, k=args.k, num_queries=args.queries, judgements=judgements)
+
+    if args.sample:
+        for m in parse_ints(args.m):
+            for ef_construction in parse_ints(args.ef_construction):
+                start = time.perf_counter()
+                index = tuner.build(m, ef_construction)
+                print(f"Built M={m}, ef_construction={ef_construction} in {time.perf_counter() - start:.1f}s")
+                tuner.evaluate(index, Tuner.get_index_size(index), m, ef_construction, parse_ints(args.ef))
+    else:
+        tuner.evaluate(vs.storage, os.path.getsize(args.storage), vs.storage.index.M, vs.storage.index.ef_construction, parse_ints(args.ef))
+
+    result = tuner.get_result(args.target_recall)
+    output = args.output or f"{args.storage}.tuning.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"Recommended: {result['recommended']}")
+    print(f"Results: {output}")
@@ -1,6 +1,9 @@
+import numpy as np
 from typing import List, Dict
 
-Vector = List[float]
-VectorList = List[Vector]
+Vector = np.ndarray # float32 (shape: dim)
+VectorList = np.ndarray # float32 (shape: N*dim)
 StringList = List[str]
-NearestNeighborList = List[List[Dict[str, float]]]
\ No newline at end of file
+NearestNeighborList = List[List[Dict[str, float]]]
+NeighborIds = np.ndarray # str (shape: N*k)
+NeighborDistances = np.ndarray # float32 (shape: N*k)
\ No newline at end of file
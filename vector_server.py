@@ -0,0 +1,208 @@
+import argparse
+import inspect
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import numpy as np
+from typing import List, Optional, Tuple
+from .vector_storage import VectorStorage
+from .typings import Vector, VectorList, StringList, NearestNeighborList, NeighborIds, NeighborDistances
+
+DEFAULT_SOCKET = "/tmp/news_search_engine_vs.sock"
+
+# a message is a JSON header and a binary payload, each prefixed by its length
+def send_message(sock: socket.socket, header: dict, payload: bytes = b""):
+    encoded = json.dumps(header).encode("utf-8")
+    sock.sendall(struct.pack("!IQ", len(encoded), len(payload)) + encoded + payload)
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError("connection closed.")
+        received += count
+    return bytes(buffer)
+
+def recv_message(sock: socket.socket) -> Tuple[dict, bytes]:
+    header_size, payload_size = struct.unpack("!IQ", _recv_exactly(sock, 12))
+    header = json.loads(_recv_exactly(sock, header_size).decode("utf-8"))
+    return header, _recv_exactly(sock, payload_size)
+
+def get_storage_kwarg(storage_kwargs: dict, name: str):
+    # the value VectorStorage uses, given or its default
+    if name in storage_kwargs:
+        return storage_kwargs[name]
+    return inspect.signature(VectorStorage).parameters[name].default
+
+class VectorServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    '''
+    Keeps vector storages loaded and answers kNN queries of VectorStorageClient over a Unix
+    socket, so the storages are loaded once per host instead of once per script. Storages
+    are named by their absolute path and loaded once, on the first query, with storage_kwargs
+    (e.g. ef, backend, rerank) passed to VectorStorage. Clients may send their own
+    storage_kwargs, which override those of the server. Later requests for a loaded storage
+    must agree on the kwargs that change its answers (serving_kwargs), the others only matter
+    for loading. Every connection is served by a thread.
+    '''
+    daemon_threads = True
+    serving_kwargs = ["dim", "ef", "backend", "rerank", "rerank_factor"]
+
+    def __init__(self, socket_path=DEFAULT_SOCKET, **storage_kwargs):
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        self.socket_path = socket_path
+        self.storage_kwargs = storage_kwargs
+        self.storages = {}
+        self.loaded_kwargs = {}
+        self.path_locks = {}
+        self.lock = threading.Lock()
+        super().__init__(socket_path, VectorRequestHandler)
+
+    def get_storage(self, storage_location: str, storage_kwargs: Optional[dict] = None) -> VectorStorage:
+        kwargs = dict(self.storage_kwargs, **(storage_kwargs or {}))
+        if storage_location not in self.storages:
+            with self.lock:
+                path_lock = self.path_locks.setdefault(storage_location, threading.Lock())
+            # a load only holds up the requests for the same path
+            with path_lock:
+                if storage_location not in self.storages:
+                    if not VectorStorage.exists(storage_location):
+                        raise FileNotFoundError(f"storage: {storage_location} not found.")
+                    print(f"Loading {storage_location} {kwargs}")
+                    storage = VectorStorage(storage_location, persist=False, **kwargs)
+                    self.loaded_kwargs[storage_location] = kwargs
+                    self.storages[storage_location] = storage
+        loaded_kwargs = self.loaded_kwargs[storage_location]
+        conflicts = [name for name in self.serving_kwargs if get_storage_kwarg(kwargs, name) != get_storage_kwarg(loaded_kwargs, name)]
+        if conflicts:
+            raise ValueError(f"storage: {storage_location} is loaded with {', '.join(f'{name}={get_storage_kwarg(loaded_kwargs, name)}' for name in conflicts)}.")
+        return self.storages[storage_location]
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+class VectorRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        # a client sends any number of requests over its connection
+        while True:
+            try:
+                header, payload = recv_message(self.request)
+            except ConnectionError:
+                return
+            try:
+                response, response_payload = self.answer(header, payload)
+            except Exception as e:
+                response, response_payload = {"error": f"{type(e).__name__}: {e}"}, b""
+            send_message(self.request, response, response_payload)
+
+    def answer(self, header: dict, payload: bytes) -> Tuple[dict, bytes]:
+        storage = self.server.get_storage(header["storage"], header.get("storage_kwargs"))
+        if header["op"] == "count":
+            return {"count": storage.get_current_count()}, b""
+        if header["op"] == "knn":
+            embeddings = np.frombuffer(payload, dtype=np.float32).reshape(header["shape"])
+            ids, distances = storage.get_k_nearest_batch(embeddings, header["k"], allow_ids=header.get("allow_ids"), deny_ids=header.get("deny_ids"), deny_filter=header.get("deny_filter"))
+            return {"ids": ids.tolist()}, np.ascontiguousarray(distances, dtype=np.float32).tobytes()
+        if header["op"] == "register_filter":
+            storage.register_filter(header["name"], header["ids"])
+            return {}, b""
+        if header["op"] == "vectors":
+            vectors, missing = storage.get_vectors(header["ids"])
+            return {"missing": missing, "dim": vectors.shape[1]}, vectors.tobytes()
+        raise ValueError(f"op: {header['op']} not supported.")
+
+class VectorStorageClient():
+    '''
+    Drop-in for the queries of VectorStorage, answered by a VectorServer that holds the
+    storage at storage_location. storage_kwargs (e.g. backend, rerank) are sent with every
+    request, the server loads the storage with them.
+    '''
+    def __init__(self, storage_location, socket_path=DEFAULT_SOCKET, **storage_kwargs):
+        self.storage_location = os.path.abspath(storage_location)
+        self.socket_path = socket_path
+        self.storage_kwargs = storage_kwargs
+        self.sock = None
+        self.lock = threading.Lock()
+
+    def _request(self, header: dict, payload: bytes = b"") -> Tuple[dict, bytes]:
+        with self.lock:
+            if self.sock is None:
+                self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.sock.connect(self.socket_path)
+            send_message(self.sock, dict(header, storage=self.storage_location, storage_kwargs=self.storage_kwargs), payload)
+            response, response_payload = recv_message(self.sock)
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response, response_payload
+
+    def get_current_count(self):
+        return self._request({"op": "count"})[0]["count"]
+
+    def register_filter(self, name: str, deny_ids: StringList):
+        # the ids are sent once and kept by the server, queries only send the name
+        self._request({"op": "register_filter", "name": name, "ids": list(deny_ids)})
+
+    def get_k_nearest(self, embedding: Vector, k: int, allow_ids: Optional[StringList] = None, deny_ids: Optional[StringList] = None, deny_filter: Optional[str] = None) -> NearestNeighborList:
+        ids, distances = self.get_k_nearest_batch(np.reshape(embedding, (1, -1)), k, allow_ids=allow_ids, deny_ids=deny_ids, deny_filter=deny_filter)
+        nearest: NearestNeighborList = []
+        for id_row, distance_row in zip(ids.tolist(), distances):
+            nearest.append([{article_id: distance} for article_id, distance in zip(id_row, distance_row)])
+        return nearest
+
+    def get_k_nearest_batch(self, embeddings: VectorList, k: int, allow_ids: Optional[StringList] = None, deny_ids: Optional[StringList] = None, deny_filter: Optional[str] = None) -> Tuple[NeighborIds, NeighborDistances]:
+        embeddings = np.ascontiguousarray(np.reshape(embeddings, (len(embeddings), -1)), dtype=np.float32)
+        header = {"op": "knn", "k": k, "shape": list(embeddings.shape)}
+        if allow_ids is not None:
+            header["allow_ids"] = list(allow_ids)
+        if deny_ids is not None:
+            header["deny_ids"] = list(deny_ids)
+        if deny_filter is not None:
+            header["deny_filter"] = deny_filter
+        response, payload = self._request(header, embeddings.tobytes())
+        ids = np.array(response["ids"], dtype=str).reshape(len(embeddings), k)
+        distances = np.frombuffer(payload, dtype=np.float32).reshape(len(embeddings), k)
+        return ids, distances
+
+    def get_vectors(self, article_ids: StringList) -> Tuple[VectorList, List[int]]:
+        response, payload = self._request({"op": "vectors", "ids": list(article_ids)})
+        return np.frombuffer(payload, dtype=np.float32).reshape(len(article_ids), response["dim"]), response["missing"]
+
+    def close(self):
+        with self.lock:
+            if self.sock is not None:
+                self.sock.close()
+                self.sock = None
+
+def open_storage(storage_location, vector_server: Optional[str] = None, **storage_kwargs):
+    # the client of a running VectorServer at the socket path vector_server, else the storage itself
+    if vector_server:
+        return VectorStorageClient(storage_location, socket_path=vector_server, **storage_kwargs)
+    return VectorStorage(storage_location, **storage_kwargs)
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description='Serve kNN queries of vector storages over a Unix socket')
+    p.add_argument('--socket', default=DEFAULT_SOCKET, help='Path of the Unix socket')
+    p.add_argument('--dim', default=768, type=int, help='Dimension of the embeddings')
+    p.add_argument('--ef', default=150, type=int, help='ef of the HNSW search')
+    p.add_argument('--backend', default="hnsw", choices=["hnsw", "exact"], help="Search the vector storages with HNSW or exactly")
+    p.add_argument('--rerank', action='store_true', help="Rerank over-fetched HNSW candidates by exact cosine against the float16 vector sidecar")
+    p.add_argument('storages', nargs='*', help='Vector storages (.bin) to load at start, others are loaded on their first query')
+
+    args = p.parse_args()
+
+    server = VectorServer(args.socket, dim=args.dim, ef=args.ef, backend=args.backend, rerank=args.rerank)
+    for path in args.storages:
+        server.get_storage(os.path.abspath(path))
+    print(f"Serving on {args.socket}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
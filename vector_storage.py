@@ -1,9 +1,14 @@
 import json
 import os
+import numpy as np
 from tqdm import tqdm
+from typing import List, Optional, Tuple
+from .embedding_archive import EmbeddingArchive
+from .exact_index import ExactIndex, normalize
+from .ingest import IngestPipeline
+from .label_table import IdFilter, LabelTable
 from .pyw_hnswlib import Hnswlib
-from .typings import Vector, VectorList, StringList, NearestNeighborList
-from .embedding.model import EmbeddingModel
+from .typings import Vector, VectorList, StringList, NearestNeighborList, NeighborIds, NeighborDistances
 
 class VectorStorage():
 
@@ -15,99 +20,461 @@ class VectorStorage():
         ef_construction = 200,
         m = 100,
         ef = 150,
-        persist = True
+        persist = True,
+        growth_factor = 2.,
+        shrink_to_fit = False,
+        backend = "hnsw",
+        max_deleted_ratio = 0.2,
+        vector_sidecar = False,
+        rerank = False,
+        rerank_factor = 4,
+        archive_embeddings = False
     ):
-        self.storage = Hnswlib(space='cosine', dim = dim)
+        '''
+        max_elements is the initial capacity, the storage grows by growth_factor whenever it is
+        exceeded. With shrink_to_fit=True the capacity is cut to the item count before saving.
+        backend="exact" searches by brute force (see ExactIndex), it can also load HNSW storages.
+        remove compacts the storage once more than max_deleted_ratio of its elements are deleted.
+        With vector_sidecar=True the normalized vectors are also saved as a float16 matrix by label
+        (see get_sidecar_path), which is memory-mapped on load. With rerank=True queries fetch
+        k * rerank_factor candidates from the index and return the k nearest by exact cosine
+        against the float16 vectors, so a low ef and a smaller graph give the same accuracy.
+        With archive_embeddings=True the added and upserted embeddings are also appended to an
+        EmbeddingArchive at <storage>.emb, from which embedding_archive.rebuild builds new graphs,
+        removals are archived as well.
+        '''
+        if backend == "hnsw":
+            self.storage = Hnswlib(space='cosine', dim = dim, growth_factor = growth_factor)
+        elif backend == "exact":
+            self.storage = ExactIndex(space='cosine', dim = dim, growth_factor = growth_factor)
+        else:
+            raise ValueError(f"backend: {backend} not supported.")
+        self.backend = backend
+        self.dim = dim
         self.storage_location = storage_location
         self.max_elements = max_elements
+        self.shrink_to_fit = shrink_to_fit
+        self.max_deleted_ratio = max_deleted_ratio
+        self.vector_sidecar = vector_sidecar
+        self.rerank = rerank
+        self.rerank_factor = rerank_factor
+        self.archive = EmbeddingArchive(storage_location + ".emb", dim) if archive_embeddings else None
+        # named sets of ids to deny in queries, see register_filter
+        self.filters = {}
 
-        if os.path.isfile(storage_location):
+        # the files of the last checkpoint while an ingest is not finished, see save_checkpoint
+        index_location = self._get_index_location()
+        if os.path.isfile(index_location):
             if max_elements:
-                self.storage.load_index(storage_location, max_elements=max_elements)
+                self.storage.load_index(index_location, max_elements=max_elements)
             else:
-                self.storage.load_index(storage_location)
+                self.storage.load_index(index_location)
         else:
-            self.storage.init_index(max_elements=max_elements, ef_construction = ef_construction, M = m)
+            self.storage.init_index(max_elements=max_elements or 1024, ef_construction = ef_construction, M = m)
 
         # Controlling the recall by setting ef:
         # higher ef leads to better accuracy, but slower search
         self.storage.set_ef(ef) # ef should always be > k
         self.persist = persist
 
+        # float16 vectors by label, read from the index when missing or behind it; the first
+        # vectors16_count rows are valid, the others are capacity for labels added later
+        self.vectors16 = None
+        self.vectors16_count = 0
+        if os.path.isfile(self.get_sidecar_path(index_location)):
+            vectors16 = np.load(self.get_sidecar_path(index_location), mmap_mode="r")
+            if len(vectors16) == self.storage.get_current_count():
+                self.vectors16 = vectors16
+                self.vectors16_count = len(vectors16)
+
+    def save(self):
+        count = self.storage.get_current_count()
+        if self.shrink_to_fit and count < self.get_max_elements():
+            self.storage.resize_index(max(count, 1))
+        self.storage.save_index(self.storage_location)
+        # an existing or loaded sidecar is rewritten too, it would be stale after upserts
+        if self.vector_sidecar or self.vectors16 is not None or os.path.isfile(self.get_sidecar_path()):
+            self._save_sidecar()
+        if self.archive is not None:
+            self.archive.flush()
+        checkpoint = self._read_checkpoint()
+        if checkpoint is not None and checkpoint.get("generation") is not None:
+            # the storage path holds the newest state now, resume refuses it if its count
+            # differs from the checkpoint
+            previous = checkpoint["generation"]
+            checkpoint["generation"] = None
+            self._write_checkpoint(checkpoint)
+            self._remove_generation(previous)
+
+    @staticmethod
+    def exists(storage_location) -> bool:
+        # also true for storages only saved by checkpoints so far
+        return os.path.isfile(storage_location) or os.path.isfile(storage_location + ".ckpt.json")
+
+    def get_sidecar_path(self, index_location: Optional[str] = None) -> str:
+        return (index_location or self.storage_location) + ".f16.npy"
+
+    def _read_vectors16(self, start: int, end: int, block_size=16384) -> np.ndarray:
+        vectors16 = np.zeros((end - start, self.dim), dtype=np.float16)
+        for block_start in range(start, end, block_size):
+            labels = np.arange(block_start, min(block_start + block_size, end))
+            labels = labels[self.storage.labels.ids[labels] != b""]
+            if len(labels) != 0:
+                vectors16[labels - start] = self.storage.get_items(labels)
+        return vectors16
+
+    def get_sidecar_vectors(self) -> np.ndarray:
+        '''
+        The normalized vectors as float16 matrix, row i holds label i. Rows of deleted labels
+        are zero. Labels added since the sidecar was loaded are read from the index.
+        '''
+        count = self.storage.get_current_count()
+        if self.vectors16 is None:
+            self.vectors16 = self._read_vectors16(0, count)
+        elif self.vectors16_count < count:
+            if len(self.vectors16) < count:
+                # grown geometrically, a few labels at a time are added in amortized constant time
+                vectors16 = np.zeros((max(count, 2 * len(self.vectors16)), self.dim), dtype=np.float16)
+                vectors16[:self.vectors16_count] = self.vectors16[:self.vectors16_count]
+                self.vectors16 = vectors16
+            self.vectors16[self.vectors16_count:count] = self._read_vectors16(self.vectors16_count, count)
+        self.vectors16_count = count
+        return self.vectors16[:count]
+
+    def _get_writable_vectors16(self) -> np.ndarray:
+        # a memory-mapped sidecar is copied on the first change, later changes are written in place
+        if not self.vectors16.flags.writeable:
+            self.vectors16 = np.array(self.vectors16)
+        return self.get_sidecar_vectors()
+
+    def _save_sidecar(self, index_location: Optional[str] = None):
+        # written next to the sidecar and renamed, a mapped sidecar stays readable meanwhile
+        path = self.get_sidecar_path(index_location)
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, self.get_sidecar_vectors())
+        os.replace(path + ".tmp", path)
+        self.vectors16 = np.load(path, mmap_mode="r")
+        self.vectors16_count = len(self.vectors16)
+
     def get_max_elements(self):
         return self.storage.get_max_elements()
 
     def get_current_count(self):
-        return self.storage.get_current_count()
+        # deleted elements are not counted
+        return self.storage.get_current_count() - self.storage.get_deleted_count()
+
+    def upsert(self, article_id: str, embedding: Vector):
+        self.upsert_batch([article_id], np.reshape(embedding, (1, -1)))
+
+    def upsert_batch(self, article_ids: StringList, embeddings: VectorList):
+        '''
+        Replaces the embeddings of stored articles and adds the others. Labels of deleted
+        articles are reused. Changes are only persisted by save.
+        '''
+        if len(set(article_ids)) != len(article_ids):
+            raise ValueError("article ids of an upsert must be unique.")
+        self.storage.upsert_items(embeddings, article_ids)
+        if self.archive is not None:
+            self.archive.append(embeddings, article_ids)
+        if self.vectors16 is not None:
+            self._get_writable_vectors16()[self.storage.labels.lookup(article_ids)] = normalize(embeddings)
+
+    def remove(self, article_id: str) -> bool:
+        return self.remove_batch([article_id]) == 1
+
+    def remove_batch(self, article_ids: StringList) -> int:
+        '''
+        Marks the articles as deleted and returns how many were stored. Compacts the storage
+        if the ratio of deleted elements exceeds max_deleted_ratio.
+        '''
+        if self.archive is not None:
+            # so that rebuild leaves the articles out
+            stored = self.storage.labels.lookup(article_ids) >= 0
+            self.archive.remove([article_id for article_id, is_stored in zip(article_ids, stored) if is_stored])
+        labels = self.storage.labels.lookup(article_ids)
+        removed = self.storage.remove_items(article_ids)
+        total = self.storage.get_current_count()
+        if removed and total and self.storage.get_deleted_count() / total > self.max_deleted_ratio:
+            self.storage.compact()
+            # compaction relabels the elements
+            self.vectors16 = None
+        elif removed and self.vectors16 is not None:
+            self._get_writable_vectors16()[labels[labels >= 0]] = 0
+        return removed
+
+    def get_vectors(self, article_ids: StringList) -> Tuple[VectorList, List[int]]:
+        '''
+        Returns the stored embeddings of the articles (shape: N*dim) normalized to unit length,
+        so their dot product is the cosine similarity, and the positions of the ids that are not
+        stored, whose rows are zero. Read from the vector sidecar if it is loaded.
+        '''
+        labels = self.storage.labels.lookup(article_ids)
+        found = np.flatnonzero(labels >= 0)
+        vectors = np.zeros((len(labels), self.dim), dtype=np.float32)
+        if len(found) != 0:
+            if self.vectors16 is not None:
+                vectors[found] = self.get_sidecar_vectors()[labels[found]]
+            else:
+                vectors[found] = self.storage.get_items(labels[found])
+        return vectors, np.flatnonzero(labels < 0).tolist()
 
-    def get_k_nearest(self, embedding: Vector, k: int) -> NearestNeighborList:
+    def get_k_nearest(self, embedding: Vector, k: int, allow_ids: Optional[StringList] = None, deny_ids: Optional[StringList] = None, deny_filter: Optional[str] = None) -> NearestNeighborList:
         '''
-        embeddings (shape:N*dim). Returns a numpy array of (shape: N*K)
+        embedding (shape: dim). Returns one list of k {id: distance} dicts.
         '''
-        labels, distances = self.storage.knn_query([embedding], k)
+        ids, distances = self.get_k_nearest_batch(np.reshape(embedding, (1, -1)), k, allow_ids=allow_ids, deny_ids=deny_ids, deny_filter=deny_filter)
         nearest: NearestNeighborList = []
-        for row_i, row in enumerate(labels):
-            nn = []
-            for col_i, col in enumerate(row):
-                dic = {}
-                dic[col] = distances[row_i][col_i]
-                nn.append(dic)
-            nearest.append(nn)
+        for id_row, distance_row in zip(ids.tolist(), distances):
+            nearest.append([{article_id: distance} for article_id, distance in zip(id_row, distance_row)])
         return nearest
 
-    def add_items_from_file(self, file_path, emb_func, get_id_func):
-        total = 0
-        exception_count = 0
-        with open(file_path, 'r', encoding="utf-8") as data_file:
-            emb_batch: VectorList = []
-            id_batch: StringList = []
+    def register_filter(self, name: str, deny_ids: StringList):
+        '''
+        Registers ids that queries passing deny_filter=name never return, e.g. the same
+        thousands of opinion articles for every query. Registering a name again replaces it.
+        '''
+        self.filters[name] = IdFilter(deny_ids)
 
-            for line in tqdm(data_file, total=self.max_elements):
-                raw = json.loads(line)
-                article_id = get_id_func(raw)
-                emb = emb_func(raw)
-                if emb is None or article_id is None:
-                    exception_count += 1
-                    continue
-                emb_batch.append(emb)
-                id_batch.append(article_id)
-                total += 1
+    def get_k_nearest_batch(self, embeddings: VectorList, k: int, allow_ids: Optional[StringList] = None, deny_ids: Optional[StringList] = None, deny_filter: Optional[str] = None) -> Tuple[NeighborIds, NeighborDistances]:
+        '''
+        embeddings (shape: N*dim) are queried in one call, hnswlib spreads the rows over its
+        threads, the exact backend multiplies blocks of rows. Returns the ids and cosine
+        distances of the k nearest neighbors per row (both shape: N*k), nearest first.
+        If allow_ids is given, only these ids are returned, deny_ids and the ids of the
+        registered deny_filter are never returned. The filters apply during the search, so no
+        results are dropped afterwards.
+        '''
+        labels = self.storage.labels
+        allowed = None
+        if allow_ids is not None:
+            allowed = np.zeros(len(labels), dtype=bool)
+            allow_labels = labels.lookup(allow_ids)
+            allowed[allow_labels[allow_labels >= 0]] = True
+        denied = None
+        if deny_ids is not None:
+            denied = labels.lookup(deny_ids)
+            denied = denied[denied >= 0]
+        if deny_filter is not None:
+            filter_labels = self.filters[deny_filter].get_labels(labels)
+            denied = filter_labels if denied is None else np.union1d(filter_labels, denied)
+        if self.rerank:
+            return self._knn_query_reranked(embeddings, k, allowed, denied)
+        return self.storage.knn_query(embeddings, k, allowed=allowed, denied=denied)
 
-                if len(emb_batch) == 1000:
-                    self.storage.add_items(emb_batch, id_batch)
-                    emb_batch = []
-                    id_batch = []
+    def _knn_query_reranked(self, embeddings: VectorList, k: int, allowed, denied) -> Tuple[NeighborIds, NeighborDistances]:
+        queries = normalize(np.reshape(embeddings, (-1, self.dim)))
+        if allowed is not None:
+            available = int(allowed.sum()) - (int(allowed[denied].sum()) if denied is not None else 0)
+        else:
+            available = self.get_current_count() - (len(denied) if denied is not None else 0)
+        num_candidates = max(k, min(k * self.rerank_factor, available))
+        candidates, _ = self.storage.knn_query_labels(queries, num_candidates, allowed=allowed, denied=denied)
+        vectors16 = self.get_sidecar_vectors()
+        labels = np.empty((len(queries), k), dtype=np.int64)
+        distances = np.empty((len(queries), k), dtype=np.float32)
+        # the gathered candidate vectors of a block stay below 2^24 floats
+        block_size = max(1, (1 << 24) // (num_candidates * self.dim))
+        for start in range(0, len(queries), block_size):
+            block = candidates[start:start + block_size]
+            similarities = np.einsum("nd,nkd->nk", queries[start:start + block_size], vectors16[block].astype(np.float32))
+            top = np.argsort(-similarities, axis=1, kind="stable")[:, :k]
+            labels[start:start + block_size] = np.take_along_axis(block, top, axis=1)
+            distances[start:start + block_size] = 1 - np.take_along_axis(similarities, top, axis=1)
+        return self.storage.labels.translate(labels), distances
+
+    def _add_batch(self, embedder, text_batch, id_batch, emb_buffer) -> int:
+        # returns the number of texts the embedder could not encode
+        # the storage file names the view, e.g. wapo_vs_title.bin
+        embeddings, missing = embedder.encode_batch(text_batch, out=emb_buffer, view=os.path.basename(self.storage_location))
+        if missing:
+            keep = np.setdiff1d(np.arange(len(text_batch)), missing)
+            embeddings = embeddings[keep]
+            id_batch = [id_batch[i] for i in keep]
+        if len(id_batch) != 0:
+            self.storage.add_items(embeddings, id_batch)
+            if self.archive is not None:
+                self.archive.append(embeddings, id_batch)
+        return len(missing)
+
+    def get_checkpoint_path(self) -> str:
+        return self.storage_location + ".ckpt.json"
+
+    def _read_checkpoint(self) -> dict:
+        path = self.get_checkpoint_path()
+        if not os.path.isfile(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_checkpoint(self, checkpoint: dict):
+        path = self.get_checkpoint_path()
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f)
+        os.replace(path + ".tmp", path)
+
+    def _get_index_location(self, generation: Optional[int] = None) -> str:
+        # the index of a checkpoint generation, the checkpoint names the current one until the final save
+        if generation is None:
+            checkpoint = self._read_checkpoint()
+            generation = checkpoint.get("generation") if checkpoint is not None else None
+        if generation is None:
+            return self.storage_location
+        return f"{self.storage_location}.ckpt{generation}"
+
+    def _remove_generation(self, generation: Optional[int]):
+        if generation is None:
+            return
+        location = self._get_index_location(generation)
+        for path in [location, LabelTable.sidecar_path(location), self.get_sidecar_path(location)]:
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def _get_resume_offset(self, file_path: str) -> int:
+        checkpoint = self._read_checkpoint()
+        if checkpoint is None:
+            return 0
+        if checkpoint["count"] != self.storage.get_current_count() or checkpoint["count"] != len(self.storage.labels):
+            raise RuntimeError(f"{self.storage_location} does not match its checkpoint {self.get_checkpoint_path()}.")
+        if self.archive is not None:
+            # embeddings archived after the checkpoint are added again
+            self.archive.truncate(checkpoint.get("embeddings", self.archive.count))
+        return checkpoint["offsets"].get(os.path.abspath(file_path), 0)
+
+    def save_checkpoint(self, file_path: str, offset: int, final=False):
+        '''
+        Saves the storage and then the byte offset in file_path up to which all lines are
+        stored, so that resume continues after it. The checkpoint keeps the offsets of all
+        input files of the storage, e.g. the articles and the missing articles of WAPO.
+        Until the final checkpoint, the storage is saved as a new generation of files
+        (<storage>.ckpt<generation>) that the rename of <storage>.ckpt.json commits, so a
+        crash in between keeps the previous generation. Opening the storage loads the
+        generation of its checkpoint.
+        '''
+        checkpoint = self._read_checkpoint() or {"offsets": {}}
+        previous = checkpoint.get("generation")
+        if final:
+            self.save()
+            checkpoint["generation"] = None
+        else:
+            checkpoint["generation"] = (previous or 0) + 1
+            index_location = self._get_index_location(checkpoint["generation"])
+            # no shrink_to_fit, more items follow
+            self.storage.save_index(index_location)
+            if self.vector_sidecar or self.vectors16 is not None or os.path.isfile(self.get_sidecar_path()):
+                self._save_sidecar(index_location)
+            if self.archive is not None:
+                self.archive.flush()
+        checkpoint["count"] = self.storage.get_current_count()
+        if self.archive is not None:
+            checkpoint["embeddings"] = self.archive.count
+        checkpoint["offsets"][os.path.abspath(file_path)] = offset
+        self._write_checkpoint(checkpoint)
+        self._remove_generation(previous)
+
+    def _open_lines(self, data_file, offset: int):
+        # decoded lines of the binary data_file from offset on and a function of the offset after the last line read
+        data_file.seek(offset)
+        position = [offset]
+        def lines():
+            for line in data_file:
+                position[0] += len(line)
+                yield line.decode("utf-8")
+        return lines(), lambda: position[0]
+
+    def _add_items_pipelined(self, file_path, parse_func, embedder, batch_size, checkpoint_every, resume, pipeline_kwargs):
+        pipeline = IngestPipeline(
+            self.storage,
+            embedder,
+            self.dim,
+            batch_size=batch_size,
+            view=os.path.basename(self.storage_location),
+            archive=self.archive,
+            **pipeline_kwargs
+        )
+        checkpoint_count = [self.storage.get_current_count()]
+        def on_inserted(offset):
+            if self.storage.get_current_count() - checkpoint_count[0] >= checkpoint_every:
+                self.save_checkpoint(file_path, offset)
+                checkpoint_count[0] = self.storage.get_current_count()
 
-            if len(emb_batch) != 0:
-                self.storage.add_items(emb_batch, id_batch)
+        with open(file_path, 'rb') as data_file:
+            lines, position = self._open_lines(data_file, self._get_resume_offset(file_path) if resume else 0)
+            if checkpoint_every:
+                pipeline.run(tqdm(lines, total=self.max_elements), parse_func, position=position, on_inserted=on_inserted)
+            else:
+                pipeline.run(tqdm(lines, total=self.max_elements), parse_func)
+            offset = position()
         if self.persist:
-            self.storage.save_index(self.storage_location)
-            print(f"Done. Exception Count: {exception_count}. Total: {total}")
+            if checkpoint_every:
+                self.save_checkpoint(file_path, offset, final=True)
+            else:
+                self.save()
+            pipeline.print_stats()
 
-    def add_items_from_ids_file(self, file_path, emb_func):
+    def _add_items_sequential(self, file_path, parse_func, embedder, batch_size, checkpoint_every, resume):
         total = 0
         exception_count = 0
-        with open(file_path, 'r', encoding="utf-8") as data_file:
-            emb_batch: VectorList = []
+        checkpoint_count = self.storage.get_current_count()
+        with open(file_path, 'rb') as data_file:
+            lines, position = self._open_lines(data_file, self._get_resume_offset(file_path) if resume else 0)
+            # reused for every batch, hnswlib copies the vectors into the index
+            emb_buffer = np.empty((batch_size, self.dim), dtype=np.float32)
+            text_batch: StringList = []
             id_batch: StringList = []
 
-            for line in data_file:
-                article_id = line.strip()
-                emb = emb_func(article_id)
-                if emb is None:
+            for line in tqdm(lines, total=self.max_elements):
+                text, article_id = parse_func(line)
+                if not text or article_id is None:
                     exception_count += 1
                     continue
-                emb_batch.append(emb)
+                text_batch.append(text)
                 id_batch.append(article_id)
                 total += 1
 
-                if len(emb_batch) == 1000:
-                    self.storage.add_items(emb_batch, id_batch)
-                    emb_batch = []
+                if len(text_batch) == batch_size:
+                    missing_count = self._add_batch(embedder, text_batch, id_batch, emb_buffer)
+                    exception_count += missing_count
+                    total -= missing_count
+                    text_batch = []
                     id_batch = []
+                    if checkpoint_every and self.storage.get_current_count() - checkpoint_count >= checkpoint_every:
+                        self.save_checkpoint(file_path, position())
+                        checkpoint_count = self.storage.get_current_count()
 
-            if len(emb_batch) != 0:
-                self.storage.add_items(emb_batch, id_batch)
+            if len(text_batch) != 0:
+                missing_count = self._add_batch(embedder, text_batch, id_batch, emb_buffer)
+                exception_count += missing_count
+                total -= missing_count
+            offset = position()
         if self.persist:
-            self.storage.save_index(self.storage_location)
-            print(f"Done. Exception Count: {exception_count}. Total: {total}")
\ No newline at end of file
+            if checkpoint_every:
+                self.save_checkpoint(file_path, offset, final=True)
+            else:
+                self.save()
+            print(f"Done. Exception Count: {exception_count}. Total: {total}")
+
+    def add_items_from_file(self, file_path, text_func, get_id_func, embedder, batch_size=1000, pipelined=False, checkpoint_every=0, resume=False, **pipeline_kwargs):
+        '''
+        text_func maps a raw article to the text to embed. Texts are encoded by embedder in
+        batches of batch_size. With pipelined=True, parsing, encoding and insertion overlap, see
+        IngestPipeline for the pipeline_kwargs (parse_workers, insert_threads, queue_size).
+        With checkpoint_every > 0, the storage is saved with a checkpoint (see save_checkpoint)
+        whenever that many articles were added since the last one. resume=True skips the lines
+        of file_path stored at the last checkpoint, the storage has to be loaded from it.
+        '''
+        def parse_func(line):
+            raw = json.loads(line)
+            return text_func(raw), get_id_func(raw)
+        if pipelined:
+            self._add_items_pipelined(file_path, parse_func, embedder, batch_size, checkpoint_every, resume, pipeline_kwargs)
+        else:
+            self._add_items_sequential(file_path, parse_func, embedder, batch_size, checkpoint_every, resume)
+
+    def add_items_from_ids_file(self, file_path, text_func, embedder, batch_size=1000, pipelined=False, checkpoint_every=0, resume=False, **pipeline_kwargs):
+        def parse_func(line):
+            article_id = line.strip()
+            return text_func(article_id), article_id
+        if pipelined:
+            self._add_items_pipelined(file_path, parse_func, embedder, batch_size, checkpoint_every, resume, pipeline_kwargs)
+        else:
+            self._add_items_sequential(file_path, parse_func, embedder, batch_size, checkpoint_every, resume)
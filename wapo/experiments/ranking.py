@@ -5,21 +5,28 @@ import numpy as np
 import json
 from tqdm import tqdm
 from elasticsearch import Elasticsearch
+from elasticsearch.helpers import scan
 from scipy.spatial.distance import cosine
 from ..parser import ParserWAPO
 from ...embedding.model import EmbeddingModel
 from ...feature_extraction import FeatureExtraction
 from ..judgement_list import JudgementListWapo
-from ...vector_storage import VectorStorage
-from ...typings import NearestNeighborList
+from ...vector_server import open_storage
+from ...sharded_storage import ShardedVectorStorage
 
 class WAPORanker():
-    def __init__(self, es, parser, em, vs, index):
+    def __init__(self, es, parser, em, vs, index, deny_ids=None):
         self.es = es
         self.parser = parser
         self.em = em
         self.vs = vs
         self.index = index
+        # excluded from the semantic search besides the query article, registered with the
+        # storage (or vector server) once and referred to by name in every query
+        self.deny_filter = None
+        if deny_ids:
+            self.deny_filter = "not_relevant_kickers"
+            self.vs.register_filter(self.deny_filter, deny_ids)
         self.data_location = f"{os.path.abspath(os.path.join(__file__ , os.pardir, os.pardir, os.pardir))}/data"
 
     def get_embedding_of_extracted_keywords_denormalized_ordered(self, es_doc):
@@ -27,6 +34,28 @@ class WAPORanker():
             query = " ".join(keywords)
             return self.em.encode(query)
 
+    @staticmethod
+    def get_ids_by_kicker(es, index, kickers):
+        '''
+        Ids of the articles whose kicker is one of kickers (lower case), e.g.
+        JudgementListWapo.not_relevant_kickers. ParserWAPO.parse_article indexes them.
+        '''
+        query = {"query": {"bool": {"should": [{"match_phrase": {"kicker": kicker}} for kicker in kickers]}}, "_source": ["kicker"]}
+        return [hit["_id"] for hit in scan(es, index=index, query=query) if (hit["_source"].get("kicker") or "").lower() in kickers]
+
+    def get_cosine_scores(self, query_es, docs_es):
+        '''
+        Cosine similarities of the stored extracted keywords embedding of the query article to
+        those of the docs in one dot product, None for articles that are not stored.
+        '''
+        vectors, missing = self.vs.get_vectors([query_es["_id"]] + [doc_es["_id"] for doc_es in docs_es])
+        scores = (vectors[1:] @ vectors[0]).tolist()
+        if 0 in missing:
+            return [None] * len(docs_es)
+        for row in missing:
+            scores[row - 1] = None
+        return scores
+
     def get_features(self, query_es, doc_es, bm25_score=None, cosine_score=None):
         doc_length = len(doc_es["_source"]["title"]) + len(doc_es["_source"]["text"])
         query_published_after = 1 if int(query_es["_source"]["date"]) > int(doc_es["_source"]["date"]) else 0
@@ -54,7 +83,7 @@ class WAPORanker():
             cosine_score = 0
             query_emb = self.get_embedding_of_extracted_keywords_denormalized_ordered(query_es)
             doc_emb = self.get_embedding_of_extracted_keywords_denormalized_ordered(doc_es)
-            if query_emb and doc_emb:
+            if query_emb is not None and doc_emb is not None:
                 cosine_score = 1 - cosine(query_emb, doc_emb) # convert cosine sim. to cosine dist. as trev_eval sorts in desc. order
         
         return np.array([bm25_score, cosine_score, doc_length, query_published_after])
@@ -73,7 +102,8 @@ class WAPORanker():
         query_groups = []
         for jl in tqdm(data, total=len(data)):
             query_es = self.es.get(index=self.index, id=jl["id"])
-            count = 0
+            refs = []
+            docs_es = []
             for ref in jl["references"]:
                 if ref["id"] == jl["id"]:
                     continue
@@ -86,11 +116,15 @@ class WAPORanker():
                 except Exception as e:
                     print(e)
                     continue
-                ref_features = self.get_features(query_es, doc_es)
+                refs.append(ref)
+                docs_es.append(doc_es)
+            # stored embeddings instead of encoding the query and every doc again
+            cosine_scores = self.get_cosine_scores(query_es, docs_es)
+            for ref, doc_es, cosine_score in zip(refs, docs_es, cosine_scores):
+                ref_features = self.get_features(query_es, doc_es, cosine_score=cosine_score)
                 X.append(ref_features)
                 y.append(int(ref["exp_rel"]))
-                count += 1
-            query_groups.append(count)
+            query_groups.append(len(refs))
         return (X,y,query_groups)
 
     def get_training_data(self, jl_paths):
@@ -145,8 +179,14 @@ class WAPORanker():
         keywords_denorm = self.parser.get_keywords_tf_idf_denormalized(self.index, query_es["_id"], query_es["_source"]["title"], query_es["_source"]["text"], keep_order=True)
         if keywords_denorm:
             emb_query = self.em.encode(" ".join(keywords_denorm))
-            nearest_n: NearestNeighborList = self.vs.get_k_nearest(emb_query,size)
-            results = [{"id": list(nn.keys())[0], "cosine_score":1-list(nn.values())[0], "bm25_score":None} for nn in nearest_n[0] if list(nn.keys())[0] != query_es["_id"]] # convert cosine sim. to cosine dist. as trev_eval sorts in desc. order
+            # the query article and the denied articles are excluded during the search
+            if isinstance(self.vs, ShardedVectorStorage):
+                # only articles published before the query article
+                query_date = np.array([int(query_es["_source"]["date"])], dtype="datetime64[ms]")
+                nearest_ids, distances = self.vs.get_k_nearest_batch(np.reshape(emb_query, (1, -1)), size, query_date, deny_ids=[query_es["_id"]], deny_filter=self.deny_filter)
+            else:
+                nearest_ids, distances = self.vs.get_k_nearest_batch(np.reshape(emb_query, (1, -1)), size, deny_ids=[query_es["_id"]], deny_filter=self.deny_filter)
+            results = [{"id": res_id, "cosine_score":1-float(dist), "bm25_score":None} for res_id, dist in zip(nearest_ids[0].tolist(), distances[0]) if res_id] # convert cosine sim. to cosine dist. as trev_eval sorts in desc. order
         return results
 
     def get_ranking(self, test_pred, test_ids):
@@ -166,6 +206,8 @@ class WAPORanker():
                     X_test = []
                     X_test_ids = []
                     retrieval = retrieval_func(query_es)
+                    found = []
+                    docs_es = []
                     for res in retrieval:
                         doc_es = None
                         try:
@@ -176,6 +218,12 @@ class WAPORanker():
                         except Exception as e:
                             print(e)
                             continue
+                        found.append(res)
+                        docs_es.append(doc_es)
+                    cosine_scores = self.get_cosine_scores(query_es, docs_es)
+                    for res, doc_es, cosine_score in zip(found, docs_es, cosine_scores):
+                        if res["cosine_score"] is None:
+                            res["cosine_score"] = cosine_score
                         res_features = self.get_features(query_es,doc_es,res["bm25_score"],res["cosine_score"])[feature_inds]
                         X_test.append(res_features)
                         X_test_ids.append(res["id"])
@@ -366,6 +414,11 @@ if __name__ == "__main__":
     p.add_argument('--user', default=None, help='ElasticSearch user')
     p.add_argument('--secret', default=None, help="ElasticSearch secret")
     p.add_argument('--device', default="cpu", help="(CUDA) device for pytorch")
+    p.add_argument('--cache', default=None, help="Directory of the persistent embedding cache")
+    storage_group = p.add_mutually_exclusive_group()
+    storage_group.add_argument('--sharded', action='store_true', help="Retrieve from the storage sharded by publication date (see wapo.shard_vs)")
+    storage_group.add_argument('--vector_server', default=None, help="Socket path of a running vector server (python -m NewsSearchEngine.vector_server) to query instead of loading the storages")
+    p.add_argument('--keep_opinion', action='store_true', help="Do not exclude opinion articles and letters to the editor from the semantic search")
 
     args = p.parse_args()
 
@@ -387,14 +440,18 @@ if __name__ == "__main__":
         )
 
     parser = ParserWAPO(es)
-    em = EmbeddingModel(lang="en", device=args.device)
+    em = EmbeddingModel(lang="en", device=args.device, cache_location=args.cache)
     data_location = f"{os.path.abspath(os.path.join(__file__ , os.pardir, os.pardir, os.pardir))}/data"
     judgement_list_18_path = f"{data_location}/judgement_list_wapo_18.jsonl"
     judgement_list_19_path = f"{data_location}/judgement_list_wapo_19.jsonl"
     judgement_list_20_path = f"{data_location}/judgement_list_wapo_20.jsonl"
     vs_extracted_k_denormalized_ordered = f"{data_location}/wapo_vs_extracted_k_denormalized_ordered.bin"
-    vs = VectorStorage(vs_extracted_k_denormalized_ordered)
-    ranker = WAPORanker(es, parser, em, vs, index)
+    if args.sharded:
+        vs = ShardedVectorStorage(f"{data_location}/wapo_vs_extracted_k_denormalized_ordered_sharded")
+    else:
+        vs = open_storage(vs_extracted_k_denormalized_ordered, args.vector_server)
+    deny_ids = None if args.keep_opinion else WAPORanker.get_ids_by_kicker(es, index, JudgementListWapo.not_relevant_kickers)
+    ranker = WAPORanker(es, parser, em, vs, index, deny_ids=deny_ids)
 
     if not os.path.isfile(f"{data_location}/X_train.txt"):
         print("Initialize training and validation data...")
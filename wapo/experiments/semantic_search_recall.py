@@ -1,15 +1,17 @@
 import argparse
+import functools
 import json
 import os
+import numpy as np
 from elasticsearch import Elasticsearch
 from ..parser import ParserWAPO
-from ...vector_storage import VectorStorage
+from ...multi_view_storage import MultiViewStorage
+from ...vector_server import open_storage
 from ...feature_extraction import FeatureExtraction
 from ...embedding.model import EmbeddingModel
-from ...typings import NearestNeighborList
 
 class SemanticSearchExperiment():
-    def __init__(self, es, index, size, get_query_func, vector_storage_location, judgement_list_path, rel_cutoff):
+    def __init__(self, es, index, size, get_query_func, vector_storage_location, judgement_list_path, rel_cutoff, multi_view=None, vector_server=None):
         self.es = es
         self.index = index
         self.count = 0
@@ -20,9 +22,15 @@ class SemanticSearchExperiment():
         self.rel_cutoff = rel_cutoff
         self.exception_count = 0
 
-        # load vector storage from file
-        self.vs = VectorStorage(vector_storage_location)
+        # load vector storage from file, or use its view of the multi-view storage
+        if multi_view is None:
+            self.get_k_nearest_batch = open_storage(vector_storage_location, vector_server).get_k_nearest_batch
+        else:
+            view = os.path.splitext(os.path.basename(vector_storage_location))[0]
+            self.get_k_nearest_batch = functools.partial(multi_view.get_k_nearest_batch, view)
 
+        queries = []
+        query_judgements = []
         with open(judgement_list_path, "r", encoding="utf-8") as f:
             for line in f:
                 judgement = json.loads(line)
@@ -38,32 +46,31 @@ class SemanticSearchExperiment():
                         id = judgement["id"]
                     )
                     query = get_query_func(query_article_es)
-                    if not query:
+                    if query is None:
                         continue
                     self.count += 1
-                    nearest_n: NearestNeighborList = self.vs.get_k_nearest(query,size)
-                    result_ids = [list(nn.keys())[0] for nn in nearest_n[0]]
-                    result_ids = list(set(result_ids))
-                    recall = 0.
-                    self.retrieval_count_avg += len(result_ids)
-                    for res_id in result_ids:
-                        if res_id == judgement["id"]:
-                            continue
-                        for ref in relevant_articles:
-                            if ref["id"] == res_id:
-                                recall += 1
-                                break
-                    recall /= len(relevant_articles)
-                    self.recall_avg += recall
-                    if recall < self.min_recall:
-                        self.min_recall = recall
-                    if recall > self.max_recall:
-                        self.max_recall = recall
+                    queries.append(query)
+                    query_judgements.append((judgement, relevant_articles))
                 except Exception as e:
                     # query article not found
                     self.exception_count += 1
                     print(e)
                     continue
+
+        # all topics in one knn query
+        if queries:
+            nearest_ids, _ = self.get_k_nearest_batch(np.stack(queries), size)
+            for (judgement, relevant_articles), result_ids in zip(query_judgements, nearest_ids.tolist()):
+                result_ids = list(set(result_ids))
+                relevant_ids = set(ref["id"] for ref in relevant_articles)
+                self.retrieval_count_avg += len(result_ids)
+                recall = len([res_id for res_id in result_ids if res_id != judgement["id"] and res_id in relevant_ids])
+                recall /= len(relevant_articles)
+                self.recall_avg += recall
+                if recall < self.min_recall:
+                    self.min_recall = recall
+                if recall > self.max_recall:
+                    self.max_recall = recall
         self.recall_avg /= self.count
         self.retrieval_count_avg /= self.count
 
@@ -84,6 +91,10 @@ if __name__ == "__main__":
     p.add_argument('--user', default=None, help='ElasticSearch user')
     p.add_argument('--secret', default=None, help="ElasticSearch secret")
     p.add_argument('--device', default="cpu", help="(CUDA) device for pytorch")
+    p.add_argument('--cache', default=None, help="Directory of the persistent embedding cache")
+    p.add_argument('--quantize', action='store_true', help="Encode the queries with the dynamically int8 quantized model (CPU only), compare storages built with and without --quantize for the int8 recall")
+    p.add_argument('--multi_view', default=None, help="Directory of a multi-view storage with the vector storages as views, each view is loaded once")
+    p.add_argument('--vector_server', default=None, help="Socket path of a running vector server (python -m NewsSearchEngine.vector_server) to query instead of loading the storages")
 
     args = p.parse_args()
 
@@ -105,9 +116,10 @@ if __name__ == "__main__":
         )
 
     parser = ParserWAPO(es)
-    em = EmbeddingModel(lang="en", device=args.device)
+    em = EmbeddingModel(lang="en", device=args.device, cache_location=args.cache, quantize=args.quantize)
     fe = FeatureExtraction(em, parser)
     size = 100
+    multi_view = MultiViewStorage(args.multi_view) if args.multi_view else None
     rel_cutoff = 2
     data_location = f"{os.path.abspath(os.path.join(__file__ , os.pardir, os.pardir, os.pardir))}/data"
     judgement_list_path = f"{data_location}/judgement_list_wapo_combined.jsonl"
@@ -157,7 +169,9 @@ if __name__ == "__main__":
         get_embedding_of_title,
         vs_title,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title")
@@ -174,7 +188,9 @@ if __name__ == "__main__":
         get_embedding_of_title_with_first_paragraph,
         vs_title,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title")
@@ -191,7 +207,9 @@ if __name__ == "__main__":
         get_embedding_of_title_with_section_titles,
         vs_title,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title")
@@ -208,7 +226,9 @@ if __name__ == "__main__":
         get_embedding_of_extracted_keywords_normalized,
         vs_title,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title")
@@ -225,7 +245,9 @@ if __name__ == "__main__":
         get_embedding_of_extracted_keywords_denormalized,
         vs_title,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title")
@@ -242,7 +264,9 @@ if __name__ == "__main__":
         get_embedding_of_extracted_keywords_denormalized_ordered,
         vs_title,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title")
@@ -259,7 +283,9 @@ if __name__ == "__main__":
         get_embedding_of_title_with_first_paragraph,
         vs_title_with_first_paragraph,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ first paragraph")
@@ -276,7 +302,9 @@ if __name__ == "__main__":
         get_embedding_of_title,
         vs_title_with_first_paragraph,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ first paragraph")
@@ -293,7 +321,9 @@ if __name__ == "__main__":
         get_embedding_of_title_with_section_titles,
         vs_title_with_first_paragraph,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ first paragraph")
@@ -310,7 +340,9 @@ if __name__ == "__main__":
         get_embedding_of_extracted_keywords_normalized,
         vs_title_with_first_paragraph,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ first paragraph")
@@ -327,7 +359,9 @@ if __name__ == "__main__":
         get_embedding_of_extracted_keywords_denormalized,
         vs_title_with_first_paragraph,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ first paragraph")
@@ -344,7 +378,9 @@ if __name__ == "__main__":
         get_embedding_of_extracted_keywords_denormalized_ordered,
         vs_title_with_first_paragraph,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ first paragraph")
@@ -361,7 +397,9 @@ if __name__ == "__main__":
         get_embedding_of_title_with_section_titles,
         vs_title_with_section_titles,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ section titles")
@@ -378,7 +416,9 @@ if __name__ == "__main__":
         get_embedding_of_title,
         vs_title_with_section_titles,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ section titles")
@@ -395,7 +435,9 @@ if __name__ == "__main__":
         get_embedding_of_title_with_first_paragraph,
         vs_title_with_section_titles,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ section titles")
@@ -412,7 +454,9 @@ if __name__ == "__main__":
         get_embedding_of_extracted_keywords_normalized,
         vs_title_with_section_titles,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ section titles")
@@ -429,7 +473,9 @@ if __name__ == "__main__":
         get_embedding_of_extracted_keywords_denormalized,
         vs_title_with_section_titles,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ section titles")
@@ -446,7 +492,9 @@ if __name__ == "__main__":
         get_embedding_of_extracted_keywords_denormalized_ordered,
         vs_title_with_section_titles,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of title w/ section titles")
@@ -463,7 +511,9 @@ if __name__ == "__main__":
         get_embedding_of_extracted_keywords_normalized,
         vs_extracted_k_normalized,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (normalized)")
@@ -480,7 +530,9 @@ if __name__ == "__main__":
         get_embedding_of_title,
         vs_extracted_k_normalized,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (normalized)")
@@ -497,7 +549,9 @@ if __name__ == "__main__":
         get_embedding_of_title_with_first_paragraph,
         vs_extracted_k_normalized,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (normalized)")
@@ -514,7 +568,9 @@ if __name__ == "__main__":
         get_embedding_of_title_with_section_titles,
         vs_extracted_k_normalized,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (normalized)")
@@ -531,7 +587,9 @@ if __name__ == "__main__":
         get_embedding_of_extracted_keywords_denormalized,
         vs_extracted_k_normalized,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (normalized)")
@@ -548,7 +606,9 @@ if __name__ == "__main__":
         get_embedding_of_extracted_keywords_denormalized_ordered,
         vs_extracted_k_normalized,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (normalized)")
@@ -565,7 +625,9 @@ if __name__ == "__main__":
         get_embedding_of_extracted_keywords_denormalized,
         vs_extracted_k_denormalized,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized)")
@@ -582,7 +644,9 @@ if __name__ == "__main__":
         get_embedding_of_title,
         vs_extracted_k_denormalized,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized)")
@@ -599,7 +663,9 @@ if __name__ == "__main__":
         get_embedding_of_title_with_first_paragraph,
         vs_extracted_k_denormalized,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized)")
@@ -616,7 +682,9 @@ if __name__ == "__main__":
         get_embedding_of_title_with_section_titles,
         vs_extracted_k_denormalized,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized)")
@@ -633,7 +701,9 @@ if __name__ == "__main__":
         get_embedding_of_extracted_keywords_normalized,
         vs_extracted_k_denormalized,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized)")
@@ -650,7 +720,9 @@ if __name__ == "__main__":
         get_embedding_of_extracted_keywords_denormalized_ordered,
         vs_extracted_k_denormalized,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized)")
@@ -667,7 +739,9 @@ if __name__ == "__main__":
         get_embedding_of_extracted_keywords_denormalized_ordered,
         vs_extracted_k_denormalized_ordered,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized, order preserved)")
@@ -684,7 +758,9 @@ if __name__ == "__main__":
         get_embedding_of_title,
         vs_extracted_k_denormalized_ordered,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized, order preserved)")
@@ -701,7 +777,9 @@ if __name__ == "__main__":
         get_embedding_of_title_with_first_paragraph,
         vs_extracted_k_denormalized_ordered,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized, order preserved)")
@@ -718,7 +796,9 @@ if __name__ == "__main__":
         get_embedding_of_title_with_section_titles,
         vs_extracted_k_denormalized_ordered,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized, order preserved)")
@@ -735,7 +815,9 @@ if __name__ == "__main__":
         get_embedding_of_extracted_keywords_normalized,
         vs_extracted_k_denormalized_ordered,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized, order preserved)")
@@ -752,7 +834,9 @@ if __name__ == "__main__":
         get_embedding_of_extracted_keywords_denormalized,
         vs_extracted_k_denormalized_ordered,
         judgement_list_path,
-        rel_cutoff
+        rel_cutoff,
+        multi_view=multi_view,
+        vector_server=args.vector_server
     )
     print("----------------------------------------------------------------")
     print("Index articles by:   embedding of extracted keywords (denormalized, order preserved)")
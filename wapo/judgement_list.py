@@ -46,18 +46,19 @@ class JudgementListWapo():
                 fout.write("\n")
         print("created wapo judgment list.")
 
+    # kickers of articles that are no background links
+    not_relevant_kickers = {
+        "opinion",
+        "letters to the editor",
+        "the post's view"
+    }
+
     @staticmethod
     def examine(es):
         def is_not_relevant(kicker: str):
             is_not_relevant = False
             if kicker:
-                not_relevant = {
-                    #"test",
-                    "opinion",
-                    "letters to the editor",
-                    "the post's view"
-                }
-                is_not_relevant = kicker.lower() in not_relevant
+                is_not_relevant = kicker.lower() in JudgementListWapo.not_relevant_kickers
             return is_not_relevant
         data_location = f"{os.path.abspath(os.path.join(__file__ , os.pardir, os.pardir))}/data"
         years = ["20"]
@@ -0,0 +1,63 @@
+from ..vector_storage import VectorStorage
+from ..sharded_storage import ShardedVectorStorage
+from elasticsearch import Elasticsearch
+from tqdm import tqdm
+import numpy as np
+import os
+import argparse
+
+if __name__ == "__main__":
+    index_name_combined = "wapo_clean"
+
+    p = argparse.ArgumentParser(description='Split a Washington Post vector storage into shards by publication date')
+    p.add_argument('--host', default='localhost', help='Host for ElasticSearch endpoint')
+    p.add_argument('--port', default='9200', help='Port for ElasticSearch endpoint')
+    p.add_argument('--index_name', default=index_name_combined, help='index name')
+    p.add_argument('--user', default=None, help='ElasticSearch user')
+    p.add_argument('--secret', default=None, help="ElasticSearch secret")
+    p.add_argument('--storage', default="wapo_vs_extracted_k_denormalized_ordered", help="Name of the vector storage in data/")
+    p.add_argument('--partition', default="year", choices=["year", "month"], help="One shard per year or month")
+    p.add_argument('--batch_size', default=1000, type=int, help="Articles per date lookup")
+
+    args = p.parse_args()
+
+    es = None
+
+    if args.user and args.secret:
+        es = Elasticsearch(
+            hosts = [{"host": args.host, "port": args.port}],
+            http_auth=(args.user, args.secret),
+            scheme="https",
+            retry_on_timeout=True,
+            max_retries=10
+        )
+    else:
+        es = Elasticsearch(
+            hosts=[{"host": args.host, "port": args.port}],
+            retry_on_timeout=True,
+            max_retries=10
+        )
+
+    data_location = f"{os.path.abspath(os.path.join(__file__ , os.pardir, os.pardir))}/data"
+    vs = VectorStorage(f"{data_location}/{args.storage}.bin", persist=False)
+    sharded = ShardedVectorStorage(f"{data_location}/{args.storage}_sharded", partition=args.partition, dim=vs.dim)
+
+    # the stored vectors are reused, nothing is encoded again
+    labels = vs.storage.labels
+    live = np.flatnonzero(labels.ids[:len(labels)] != b"")
+    exception_count = 0
+    for start in tqdm(range(0, len(live), args.batch_size)):
+        batch = live[start:start + args.batch_size]
+        ids = labels.translate(batch).tolist()
+        docs = es.mget(index=args.index_name, body={"ids": ids}, _source_includes=["date"])["docs"]
+        found = [i for i, doc in enumerate(docs) if doc.get("found") and doc["_source"].get("date")]
+        exception_count += len(batch) - len(found)
+        if not found:
+            continue
+        vectors = np.array(vs.storage.index.get_items(batch[found]), dtype=np.float32).reshape(len(found), vs.dim)
+        # WAPO dates are milliseconds since epoch
+        dates = np.array([int(docs[i]["_source"]["date"]) for i in found], dtype="datetime64[ms]")
+        sharded.add_items(vectors, [ids[i] for i in found], dates)
+    sharded.save()
+    sharded.print_stats()
+    print(f"Exception Count: {exception_count}")